@@ -0,0 +1,188 @@
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import FrozenSet, Optional, Tuple
+
+from config import Config
+from intent_classifier import IntentClassifier
+
+# Słowa typowe dla pytań o atrakcje - nie wyznaczają miejsca przewodnika. Rdzenie po 4 litery służą
+# tylko do odsiewania tych słów (także w innej formie), kluczem przewodnika jest pełna nazwa miejsca
+_STEM_LENGTH = 4
+_GENERIC_WORDS = [
+    "atrakcje", "zwiedzanie", "zwiedzic", "zobaczyc", "robic", "porobic", "warto", "jakie", "jaki", "gdzie",
+    "mozna", "polecasz", "polecisz", "polec", "najlepsze", "ciekawe", "miejsca", "miescie", "miasto", "tam",
+    "tego", "prosze", "poprosze", "pokaz", "powiedz", "chce", "chcemy", "chcialbym", "chcialabym", "jade",
+    "jedziemy", "jedzie", "podczas", "pobytu", "przewodnik", "wycieczka", "sightseeing", "attractions",
+    "what", "see", "dla", "nas", "mnie", "jest", "czy", "ktore", "jeszcze", "inne", "wiecej", "okolicy",
+]
+# Szczegóły wyjazdu i zainteresowania - trafiają do wstępu dla użytkownika, ogólny przewodnik je obejmuje
+_DETAIL_WORDS = [
+    "zima", "zimie", "zimowe", "latem", "lecie", "letnie", "wiosna", "wiosne", "wiosenne", "jesien", "jesienia",
+    "jesienne", "weekend", "dzieci", "dziecmi", "dzieckiem", "rodzina", "rodzinnie", "rodzinne", "tanio", "tanie",
+    "budzet", "budzetowo", "romantycznie", "romantyczne", "dwoje", "znajomymi", "seniorow", "muzea", "muzeum",
+    "zabytki", "restauracje", "jedzenie", "plaze", "zakupy", "nocne", "spacer", "spacery",
+]
+_GENERIC_STEMS = {word[:_STEM_LENGTH] for word in _GENERIC_WORDS}
+_DETAIL_STEMS = {word[:_STEM_LENGTH] for word in _DETAIL_WORDS}
+_NOT_IATA = {"PLN", "EUR", "USD", "GBP", "CHF", "CZK", "HUF", "SPA", "VIP"}
+_TOKEN_PATTERN = re.compile(r"[.!?]|[^\W\d_]+")
+
+# Regularne końcówki odmiany nazw miast ("Barcelona" -> "w Barcelonie", "Rzym" -> "w Rzymie")
+_VOWEL_ENDINGS = ["a", "y", "i", "e", "ie", "o"]
+_CONSONANT_ENDINGS = ["", "a", "u", "ie", "iu", "em", "owi"]
+# Formy z obocznościami, których końcówki nie opisują (miasta z Config.AIRPORT_CITIES)
+_IRREGULAR_FORMS = {
+    "pradze": "Praga", "madrycie": "Madryt", "wiednia": "Wiedeń", "wiedniu": "Wiedeń", "wiedniem": "Wiedeń",
+    "budapeszcie": "Budapeszt",
+}
+
+_SEASONS = {12: "zima", 1: "zima", 2: "zima", 3: "wiosna", 4: "wiosna", 5: "wiosna",
+            6: "lato", 7: "lato", 8: "lato", 9: "jesien", 10: "jesien", 11: "jesien"}
+_PERIOD_LABELS = {"zima": "zima", "wiosna": "wiosna", "lato": "lato", "jesien": "jesień"}
+ANY_PERIOD = "any"
+
+HIT = "hit"
+MISS = "miss"
+
+
+def _stems(text: str, skip: FrozenSet[str] = frozenset()) -> FrozenSet[str]:
+    stems = (word[:_STEM_LENGTH] for word in IntentClassifier.normalize(text).split() if len(word) >= 3)
+    return frozenset(stem for stem in stems if stem not in skip)
+
+
+def _inflections(name: str) -> FrozenSet[str]:
+    """Formy nazwy jednowyrazowej z regularnymi końcówkami (znormalizowane); dłuższe nazwy tylko w mianowniku"""
+    base = IntentClassifier.normalize(name)
+    if " " in base or not base:
+        return frozenset([base])
+    if base.endswith("a"):
+        return frozenset(base[:-1] + ending for ending in _VOWEL_ENDINGS)
+    return frozenset(base + ending for ending in _CONSONANT_ENDINGS)
+
+
+_CITY_FORMS = {form: city for city in Config.AIRPORT_CITIES.values() for form in _inflections(city)}
+_CITY_FORMS.update(_IRREGULAR_FORMS)
+
+
+def canonical_place(name: str, trip_destination: Optional[str] = None) -> str:
+    """Nazwa miejsca w mianowniku: kod IATA lub odmiana miasta z Config.AIRPORT_CITIES, odmiana miejsca
+    docelowego ze stanu podróży; nierozpoznana nazwa zostaje bez zmian (osobny wpis w cache, bez zgadywania)"""
+    name = name.strip()
+    if name.upper() in Config.AIRPORT_CITIES:
+        return Config.AIRPORT_CITIES[name.upper()]
+    form = IntentClassifier.normalize(name)
+    if form in _CITY_FORMS:
+        return _CITY_FORMS[form]
+    if trip_destination:
+        trip_destination = canonical_place(trip_destination)
+        if form in _inflections(trip_destination):
+            return trip_destination
+    return name
+
+
+def place_key(name: str) -> str:
+    """Klucz przewodnika - pełna znormalizowana nazwa miejsca ("Rzym", "w Rzymie", "FCO" -> 'rzym')"""
+    return IntentClassifier.normalize(canonical_place(name))
+
+
+def guide_destination(question: str, trip_destination: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Jedno miejsce przewodnika: (klucz cache, nazwa do promptu) albo None.
+    Miejsce z pytania (nazwa wielką literą w środku zdania lub kod IATA), a gdy pytanie żadnego
+    nie wymienia - miejsce docelowe ze stanu podróży. None gdy pytanie wymienia kilka miejsc albo
+    zawiera słowa, które mogą być nierozpoznaną nazwą ("co zobaczyć w lizbonie" przy podróży do Rzymu)"""
+    places = {}
+    sentence_start = True
+    for token in _TOKEN_PATTERN.findall(question or ""):
+        if token in ".!?":
+            sentence_start = True
+            continue
+        is_code = len(token) == 3 and token.isupper() and token not in _NOT_IATA
+        if (is_code or (token[0].isupper() and not sentence_start)) and _stems(token, _GENERIC_STEMS):
+            name = canonical_place(token, trip_destination)
+            places.setdefault(place_key(name), name)
+        sentence_start = False
+    
+    if len(places) == 1:
+        return next(iter(places.items()))
+    if places or not trip_destination or _stems(question or "", _GENERIC_STEMS | _DETAIL_STEMS):
+        return None
+    name = canonical_place(trip_destination)
+    key = place_key(name)
+    return (key, name) if key else None
+
+
+def travel_period(date: Optional[str], granularity: str = Config.ATTRACTIONS_CACHE_GRANULARITY) -> str:
+    """Pora roku (lub miesiąc) wyjazdu - przewodnik zależy od sezonu, a nie od konkretnego dnia"""
+    try:
+        month = datetime.strptime(date, "%Y-%m-%d").month
+    except (TypeError, ValueError):
+        return ANY_PERIOD
+    return f"{month:02d}" if granularity == "month" else _SEASONS[month]
+
+
+def period_label(period: str) -> str:
+    """Pora roku lub miesiąc do promptu przewodnika"""
+    if period == ANY_PERIOD:
+        return "dowolna (daty nieznane)"
+    return _PERIOD_LABELS.get(period, f"miesiąc {period}")
+
+
+class AttractionsCache:
+    """Cache ogólnych przewodników po atrakcjach w pamięci: klucz (miejsce, pora roku, język), TTL i limit
+    wpisów (LRU). Wspólny dla sesji, więc trafiają do niego tylko przewodniki bez kontekstu rozmowy"""
+    
+    def __init__(self, ttl: float = Config.ATTRACTIONS_CACHE_TTL, max_entries: int = Config.ATTRACTIONS_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+    
+    def get(self, destination: str, period: str, language: str = Config.DEFAULT_LANGUAGE) -> Optional[str]:
+        """Zwraca zapisany przewodnik lub None"""
+        with self._lock:
+            self._drop_expired()
+            key = (destination, period, language)
+            if key not in self._entries:
+                self.stats[MISS] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats[HIT] += 1
+            return self._entries[key][1]
+    
+    def set(self, destination: str, period: str, guide: str, language: str = Config.DEFAULT_LANGUAGE):
+        with self._lock:
+            key = (destination, period, language)
+            self._entries[key] = (time.time(), guide)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def _drop_expired(self):
+        expired_before = time.time() - self.ttl
+        for key in [key for key, (stored_at, _) in self._entries.items() if stored_at < expired_before]:
+            del self._entries[key]
+
+
+_attractions_cache: Optional[AttractionsCache] = None
+_attractions_cache_lock = threading.Lock()
+
+
+def get_attractions_cache() -> AttractionsCache:
+    """Wspólny cache przewodników dla wszystkich sesji"""
+    global _attractions_cache
+    if _attractions_cache is None:
+        with _attractions_cache_lock:
+            if _attractions_cache is None:
+                _attractions_cache = AttractionsCache()
+    return _attractions_cache
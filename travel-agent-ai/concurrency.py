@@ -0,0 +1,153 @@
+import asyncio
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Hashable, Iterator, Optional, TypeVar
+
+from config import Config
+
+T = TypeVar("T")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_io_executor() -> ThreadPoolExecutor:
+    """Wspólna pula wątków dla równoległych wywołań HTTP w klientach synchronicznych"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=Config.IO_WORKERS, thread_name_prefix="booking-io")
+    return _executor
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+_END = object()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Prywatna pętla zdarzeń w osobnym wątku - synchroniczne API agenta wykonuje na niej ścieżkę asynchroniczną"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="agent-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def run_sync(coro: Coroutine[Any, Any, T]) -> T:
+    """Wykonuje korutynę na pętli w tle i czeka na wynik (kontekst wywołującego, np. priorytet zapytań,
+    przechodzi do zadania)"""
+    loop = get_background_loop()
+    _check_caller(loop)
+    return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+def iterate_sync(stream: AsyncIterator[T]) -> Iterator[T]:
+    """Asynchroniczny generator jako zwykły iterator. Generator działa w całości w jednym zadaniu na pętli
+    w tle, elementy przechodzą przez kolejkę. Zamknięcie iteratora przed końcem (break, close(), wyjątek
+    u wywołującego) anuluje zadanie i czeka, aż generator wykona swoje finally"""
+    loop = get_background_loop()
+    _check_caller(loop)
+    items: "queue.Queue[tuple]" = queue.Queue()
+    started: "Future[asyncio.Task]" = Future()
+    
+    async def pump():
+        started.set_result(asyncio.current_task())
+        try:
+            async for item in stream:
+                items.put((item, None))
+            items.put((_END, None))
+        except BaseException as e:
+            items.put((_END, e))
+    
+    asyncio.run_coroutine_threadsafe(pump(), loop)
+    finished = False
+    try:
+        while True:
+            item, error = items.get()
+            if item is _END:
+                finished = True
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        if not finished:
+            loop.call_soon_threadsafe(started.result().cancel)
+            while items.get()[0] is not _END:
+                pass
+
+
+def _check_caller(loop: asyncio.AbstractEventLoop):
+    """Wywołanie z samej pętli w tle czekałoby na siebie w nieskończoność"""
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    if running is loop:
+        raise RuntimeError("Synchroniczne API wywołane z pętli w tle - użyj wersji asynchronicznej")
+
+
+def gather_with_deadline(calls: Dict[Hashable, Callable[[], T]], timeout: float,
+                         executor: Optional[ThreadPoolExecutor] = None) -> Dict[Hashable, Optional[T]]:
+    """Uruchamia wywołania równolegle ze wspólnym limitem czasu (domyślnie w puli I/O).
+    Wywołania, które nie zdążyły (lub rzuciły wyjątek), dają None"""
+    if not calls:
+        return {}
+    if len(calls) == 1:
+        key, call = next(iter(calls.items()))
+        return {key: _safe_call(call)}
+    
+    # Kontekst (np. priorytet zapytań) przechodzi do wątków puli
+    futures = {
+        (executor or get_io_executor()).submit(contextvars.copy_context().run, _safe_call, call): key
+        for key, call in calls.items()
+    }
+    done, not_done = wait(futures, timeout=timeout)
+    
+    results = {key: None for key in calls}
+    for future in done:
+        results[futures[future]] = future.result()
+    for future in not_done:
+        future.cancel()
+        print(f"DEBUG: {futures[future]} not resolved within {timeout}s deadline")
+    return results
+
+
+async def agather_with_deadline(calls: Dict[Hashable, Callable[[], Awaitable[T]]], timeout: float) -> Dict[Hashable, Optional[T]]:
+    """Asynchroniczna wersja gather_with_deadline"""
+    if not calls:
+        return {}
+    
+    tasks = {asyncio.ensure_future(_asafe_call(call)): key for key, call in calls.items()}
+    done, pending = await asyncio.wait(tasks, timeout=timeout)
+    
+    results = {key: None for key in calls}
+    for task in done:
+        results[tasks[task]] = task.result()
+    for task in pending:
+        task.cancel()
+        print(f"DEBUG: {tasks[task]} not resolved within {timeout}s deadline")
+    return results
+
+
+def _safe_call(call: Callable[[], T]) -> Optional[T]:
+    try:
+        return call()
+    except Exception as e:
+        print(f"Concurrent call failed: {e}")
+        return None
+
+
+async def _asafe_call(call: Callable[[], Awaitable[T]]) -> Optional[T]:
+    try:
+        return await call()
+    except Exception as e:
+        print(f"Concurrent call failed: {e}")
+        return None
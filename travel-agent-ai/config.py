@@ -16,12 +16,140 @@ class Config:
     # Claude Configuration
     CLAUDE_MODEL = 'claude-sonnet-4-20250514'
     CLAUDE_TEMPERATURE = 0.3
+    CLAUDE_FAST_MODEL = 'claude-3-5-haiku-20241022'
+    # Model i timeout (s) dla każdego etapu - routing i ekstrakcja zwracają tylko dane strukturalne
+    STAGE_MODELS = {
+        'routing': CLAUDE_FAST_MODEL,
+        'flight_extraction': CLAUDE_FAST_MODEL,
+        'hotel_extraction': CLAUDE_FAST_MODEL,
+        'trip_extraction': CLAUDE_FAST_MODEL,
+        'formatting': CLAUDE_MODEL,
+        'attractions': CLAUDE_MODEL,
+        'attractions_personalization': CLAUDE_FAST_MODEL,
+        'summary': CLAUDE_FAST_MODEL
+    }
+    STAGE_TIMEOUTS = {
+        'routing': 15,
+        'flight_extraction': 20,
+        'hotel_extraction': 20,
+        'trip_extraction': 20,
+        'formatting': 60,
+        'attractions': 60,
+        'attractions_personalization': 15,
+        'summary': 30
+    }
+    ESCALATE_ON_PARSE_ERROR = True  # nieparsowalna odpowiedź szybkiego modelu - ponów na CLAUDE_MODEL
+    PROMPT_CACHING = True  # statyczne instrukcje promptów oznaczone do cache Anthropic (cache_control)
+    # Minimalny prefiks (narzędzia + blok systemowy) w tokenach, od którego Anthropic cache'uje prompt
+    PROMPT_CACHE_MIN_TOKENS = {CLAUDE_FAST_MODEL: 2048}
+    PROMPT_CACHE_MIN_TOKENS_DEFAULT = 1024
+    
+    # Intent Routing
+    INTENT_FAST_PATH = True  # lokalny klasyfikator przed wywołaniem LLM
+    INTENT_CONFIDENCE_THRESHOLD = 0.6  # poniżej progu decyzję podejmuje LLM
+    STRUCTURED_ROUTING = True  # typ zapytania i parametry w jednym wywołaniu LLM
+    
+    # Conversation Memory
+    MEMORY_MODE = 'summary'  # 'summary' - ostatnie tury + podsumowanie starszych, 'buffer' - cała historia
+    MEMORY_RECENT_TURNS = 4  # tury przechowywane dosłownie
+    MEMORY_TOKEN_BUDGET = 1500  # przybliżony limit tokenów dla dosłownych tur
+    MEMORY_SUMMARY_WORKERS = 2  # wątki dla podsumowań historii (wywołania LLM w tle)
+    # Magazyn rozmów: 'memory' - w procesie, 'sqlite' - plik przetrwa restart i jest współdzielony przez workerów
+    SESSION_STORE = os.getenv('SESSION_STORE', 'memory')
+    SESSION_STORE_PATH = os.getenv('SESSION_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'sessions.db'))
+    SESSION_STORE_TTL = 7 * 24 * 3600  # seconds - rozmowy nieaktywne dłużej są usuwane z magazynu
+    SESSION_STORE_MEMORY_TTL = 2 * 3600  # seconds - magazyn 'memory' (ponad SERVER_SESSION_TTL, żeby nie gubić aktywnych rozmów)
+    SESSION_STORE_MEMORY_MAX_SESSIONS = 2000  # magazyn 'memory' - ponad limit usuwana najdawniej aktywna rozmowa (LRU)
+    
+    # Result Formatting
+    FORMAT_MODE = 'template'  # 'template' - lokalny szablon, 'rich' - formatowanie przez LLM
+    FORMAT_ENCODING = 'compact'  # dane ofert dla LLM: 'compact' - tabela z nagłówkiem, 'repr' - str(results)
+    FORMAT_TOKEN_BUDGET = 1200  # przybliżony limit tokenów tabeli ofert - nadmiarowe (najsłabsze) oferty są pomijane
     
     # API Limits and Timeouts
     MAX_RETRIES = 3
-    RETRY_DELAY = 2  # seconds
+    RETRY_DELAY = 2  # seconds, bazowe opóźnienie - kolejne próby czekają wykładniczo dłużej (z jitterem)
+    RETRY_MAX_DELAY = 20  # seconds, dłuższy Retry-After oznacza rezygnację z ponowienia
+    LOCATION_MAX_RETRIES = 1  # ponowienia searchDestination
+    CIRCUIT_FAILURE_THRESHOLD = 5  # kolejne awarie endpointu, po których circuit breaker odrzuca wywołania
+    CIRCUIT_RESET_TIMEOUT = 30  # seconds, po tym czasie jedno wywołanie próbne
+    
+    # Rate Limiting (jeden klucz RapidAPI dla całego ruchu) - (zapytań na sekundę, maks. naraz)
+    RATE_LIMITS = {
+        'searchDestination': (5, 10),
+        'searchFlights': (2, 4),
+        'searchHotels': (2, 4),
+        'default': (2, 4)
+    }
+    RATE_LIMIT_MAX_WAIT = 10  # seconds, dłuższe czekanie na token kończy zapytanie błędem
     REQUEST_TIMEOUT = 30  # seconds
+    LOCATION_TIMEOUT = 15  # seconds, searchDestination
+    LOCATION_BATCH_TIMEOUT = 15  # seconds, wspólny limit dla równoległego wyszukiwania lokalizacji
+    IO_WORKERS = 16  # wątki dla równoległych wywołań API w klientach synchronicznych
+    TRIP_SEARCH_TIMEOUT = 60  # seconds, wspólny limit wyszukiwania lotów i hoteli dla podróży
+    
+    # Serwer HTTP (server.py, ASGI) - wiele sesji rozmów w jednym procesie
+    SERVER_MAX_SESSIONS = 1000  # ponad limit usuwana najdawniej używana bezczynna sesja (LRU)
+    SERVER_SESSION_TTL = 30 * 60  # seconds, sesje bezczynne dłużej są zwalniane z pamięci (zostają w SESSION_STORE)
+    SERVER_SWEEP_INTERVAL = 60  # seconds, co tyle usuwanie wygasłych sesji w tle
+    SERVER_MAX_CONCURRENT_REQUESTS = 32  # odpowiedzi generowane naraz (wszystkie sesje)
+    SERVER_QUEUE_TIMEOUT = 5  # seconds czekania na wolne miejsce - potem 503 z Retry-After
+    SERVER_MAX_MESSAGE_CHARS = 2000  # dłuższe wiadomości odrzucane (413)
+    
+    # Location Cache (SQLite, współdzielony przez procesy)
+    LOCATION_CACHE_PATH = os.getenv('LOCATION_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'locations.db'))
+    LOCATION_CACHE_TTL = 30 * 24 * 3600  # seconds - ID lokalizacji praktycznie się nie zmieniają
+    LOCATION_CACHE_MAX_ENTRIES = 5000
+    LOCATION_CACHE_TOUCH_BATCH = 100  # trafienia zapisują czas użycia (LRU) zbiorczo, co tyle odczytów
+    LOCATION_CACHE_EVICT_EVERY = 50  # usuwanie wpisów wygasłych i ponad limit co tyle zapisów
+    LOCATION_CACHE_WARM_UP = False  # wstępne pobranie popularnych lokalizacji przy starcie
+    WARM_UP_AIRPORTS = ['WAW', 'CDG', 'LHR', 'BER', 'FCO', 'MAD', 'BCN', 'AMS', 'VIE', 'PRG', 'BUD', 'KRK', 'GDN', 'WRO']
+    # Lotnisko -> miasto (te same pary co KODY IATA w promptach)
+    AIRPORT_CITIES = {
+        'WAW': 'Warszawa', 'CDG': 'Paryż', 'LHR': 'Londyn', 'BER': 'Berlin', 'FCO': 'Rzym', 'MAD': 'Madryt', 'BCN': 'Barcelona',
+        'AMS': 'Amsterdam', 'VIE': 'Wiedeń', 'PRG': 'Praga', 'BUD': 'Budapeszt', 'KRK': 'Kraków', 'GDN': 'Gdańsk', 'WRO': 'Wrocław'
+    }
+    WARM_UP_CITIES = ['Paryż', 'Londyn', 'Berlin', 'Rzym', 'Madryt', 'Barcelona', 'Amsterdam', 'Wiedeń', 'Praga', 'Budapeszt', 'Kraków', 'Gdańsk', 'Wrocław', 'Warszawa']
+    
+    # Cache wyników wyszukiwania (w pamięci)
+    RESULT_CACHE_TTL = 300  # seconds - ceny mogą być nieaktualne przez kilka minut
+    RESULT_CACHE_STALE_TTL = 600  # seconds - po TTL wynik zwracany od razu, a odświeżany w tle
+    RESULT_CACHE_MAX_ENTRIES = 200  # pojedyncza odpowiedź searchFlights/searchHotels to setki KB
+    
+    # Prefetch - wyszukiwanie w tle spodziewanego następnego zapytania (hotele po lotach, loty po hotelach)
+    PREFETCH = True
+    PREFETCH_WORKERS = 2  # osobna pula, niezależna od puli I/O zapytań użytkowników
+    PREFETCH_MAX_PENDING = 4  # maks. wyszukiwań w tle naraz (wszystkie sesje)
+    PREFETCH_MIN_TOKENS = 2  # start tylko gdy kubełek ma tyle wolnych tokenów i pustą kolejkę
+    
+    # Cache przewodników po atrakcjach (w pamięci, wspólny dla sesji)
+    ATTRACTIONS_CACHE = True
+    ATTRACTIONS_CACHE_TTL = 7 * 24 * 3600  # seconds - wiedza o atrakcjach zmienia się rzadko
+    ATTRACTIONS_CACHE_MAX_ENTRIES = 100
+    ATTRACTIONS_CACHE_GRANULARITY = 'season'  # 'season' - pora roku wyjazdu, 'month' - miesiąc
+    ATTRACTIONS_CACHE_MIN_CHARS = 800  # krótsze (np. urwane) odpowiedzi nie trafiają do cache
+    ATTRACTIONS_PERSONALIZE = True  # wstęp dopasowany do pytania i stanu podróży (szybki model, bez cache) przed ogólnym przewodnikiem
+    
+    # HTTP Connection Pool (keep-alive do booking-com15.p.rapidapi.com)
+    HTTP_POOL_CONNECTIONS = 4  # liczba pul (hostów)
+    HTTP_POOL_MAXSIZE = 20  # maks. połączeń utrzymywanych na host
+    HTTP_POOL_BLOCK = False  # True - czekaj na wolne połączenie zamiast otwierać nowe
+    HTTP_CONNECT_TIMEOUT = 5  # seconds
+    HTTP_KEEPALIVE_EXPIRY = 30  # seconds, bezczynne połączenia klienta asynchronicznego
     MAX_RESULTS = 10
+    RESULT_ITEMS_LIMIT = 20  # oferty brane z jednej odpowiedzi searchFlights/searchHotels
+    HOTEL_MAX_PAGES = 3  # strony wyników searchHotels pobierane, gdy na pierwszej jest za mało pasujących hoteli
+    HOTEL_MIN_RESULTS = 10  # tyle hoteli spełniających filtry ceny wystarcza - kolejne strony nie są pobierane
+    HOTEL_PAGE_CONCURRENCY = 2  # strony pobierane równolegle
+    HOTEL_PAGES_TIMEOUT = 30  # seconds, wspólny limit dla równolegle pobieranych stron
+    FLEX_DATE_MAX_DAYS = 3  # kalendarz cen: maks. ± dni wokół daty wylotu
+    FLEX_DATE_CONCURRENCY = 4  # daty sprawdzane równolegle
+    FLEX_DATE_TIMEOUT = 30  # seconds, wspólny limit dla jednej grupy dat
+    
+    # Strumieniowe parsowanie odpowiedzi (wymaga pakietu ijson, bez niego - response.json())
+    STREAM_PARSING = True  # czyta odpowiedź fragmentami i kończy po RESULT_ITEMS_LIMIT ofertach
+    STREAM_CHUNK_SIZE = 64 * 1024  # bytes
+    STREAM_DRAIN_MAX_BYTES = 256 * 1024  # reszta odpowiedzi po limicie ofert doczytywana do tylu bajtów, żeby połączenie wróciło do puli
     
     # Default Values
     DEFAULT_CURRENCY = 'PLN'
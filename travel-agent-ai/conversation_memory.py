@@ -0,0 +1,180 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+from config import Config
+from session_store import SessionStore
+
+NO_HISTORY = "Brak poprzednich rozmów."
+CHARS_PER_TOKEN = 4  # przybliżenie - bez wywoływania tokenizera
+
+_summary_executor: Optional[ThreadPoolExecutor] = None
+_summary_executor_lock = threading.Lock()
+
+
+def _get_summary_executor() -> ThreadPoolExecutor:
+    """Osobna pula dla podsumowań (wywołania LLM) - nie zajmuje wątków zapytań do API"""
+    global _summary_executor
+    if _summary_executor is None:
+        with _summary_executor_lock:
+            if _summary_executor is None:
+                _summary_executor = ThreadPoolExecutor(max_workers=Config.MEMORY_SUMMARY_WORKERS,
+                                                       thread_name_prefix="memory-summary")
+    return _summary_executor
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class ConversationMemory:
+    """Historia rozmowy z budżetem tokenów.
+    Ostatnie tury są przechowywane dosłownie, starsze trafiają do podsumowania aktualizowanego w tle
+    (summarizer(dotychczasowe_podsumowanie, nowe_tury) -> nowe_podsumowanie).
+    Tury czekające na podsumowanie pozostają w historii dosłownie, więc nic nie ginie.
+    W trybie 'buffer' przechowywana jest cała historia (bez podsumowań).
+    Z magazynem sesji (store) historia jest wczytywana przy pierwszym użyciu, a każda tura i nowe
+    podsumowanie od razu zapisywane - rozmowę można kontynuować po restarcie lub w innym procesie"""
+    
+    def __init__(self, summarizer: Optional[Callable[[str, str], str]] = None, mode: str = Config.MEMORY_MODE,
+                 recent_turns: int = Config.MEMORY_RECENT_TURNS, token_budget: int = Config.MEMORY_TOKEN_BUDGET,
+                 store: Optional[SessionStore] = None, session_id: Optional[str] = None):
+        self.summarizer = summarizer
+        self.mode = mode
+        self.recent_turns = recent_turns
+        self.token_budget = token_budget
+        self.store = store
+        self.session_id = session_id
+        self.summary = ""
+        self._summarized_turns = 0  # tury zawarte w podsumowaniu (licząc od początku rozmowy)
+        self._loaded = store is None
+        self._turns: List[Tuple[str, str, str]] = []  # (użytkownik, agent, gotowy tekst tury)
+        self._pending: List[Tuple[str, str, str]] = []  # tury czekające na podsumowanie
+        self._summarizing = False
+        self._history_text: Optional[str] = None
+        self._lock = threading.RLock()
+    
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Ostatnie tury jako wiadomości (np. ostatnie pytanie Agenta dla klasyfikatora intencji)"""
+        with self._lock:
+            self._ensure_loaded()
+            turns = self._pending + self._turns
+        messages = []
+        for user_msg, ai_msg, _ in turns:
+            messages.extend([HumanMessage(content=user_msg), AIMessage(content=ai_msg)])
+        return messages
+    
+    def history_text(self) -> str:
+        """Tekst historii dla promptów - budowany ponownie tylko po zmianie"""
+        with self._lock:
+            self._ensure_loaded()
+            if self._history_text is None:
+                parts = []
+                if self.summary:
+                    parts.append(f"Podsumowanie wcześniejszej rozmowy: {self.summary}")
+                parts.extend(text for _, _, text in self._pending + self._turns)
+                self._history_text = "\n".join(parts) if parts else NO_HISTORY
+            return self._history_text
+    
+    def save_context(self, user_input: str, response: str):
+        with self._lock:
+            self._ensure_loaded()
+            self._turns.append(self._turn(user_input, response))
+            self._history_text = None
+            if self.store:
+                self.store.append_turn(self.session_id, user_input, response)
+            if self.mode == "summary" and self.summarizer:
+                self._evict()
+    
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self._summarized_turns = 0
+            self._turns.clear()
+            self._pending.clear()
+            self._history_text = None
+            self._loaded = True
+            if self.store:
+                self.store.delete(self.session_id)
+    
+    def _ensure_loaded(self):
+        """Wczytuje zapisaną historię sesji przy pierwszym użyciu (wywoływane pod blokadą)"""
+        if self._loaded:
+            return
+        self._loaded = True
+        stored = self.store.load_history(self.session_id)
+        if stored is None:
+            return
+        
+        self.summary = stored.summary
+        self._summarized_turns = stored.summarized_turns
+        self._turns = [self._turn(user_input, response) for user_input, response in stored.turns]
+        self._history_text = None
+        print(f"DEBUG: Memory loaded for session {self.session_id} ({len(self._turns)} turns{' + summary' if self.summary else ''})")
+        if self.mode == "summary" and self.summarizer:
+            self._evict()
+    
+    @staticmethod
+    def _turn(user_input: str, response: str) -> Tuple[str, str, str]:
+        return user_input, response, f"Użytkownik: {user_input}\nAgent: {response}"
+    
+    def _evict(self):
+        """Przenosi najstarsze tury do podsumowania, gdy przekroczono liczbę tur lub budżet tokenów"""
+        while len(self._turns) > 1 and (
+                len(self._turns) > self.recent_turns or
+                sum(estimate_tokens(text) for _, _, text in self._turns) > self.token_budget):
+            self._pending.append(self._turns.pop(0))
+        
+        if self._pending and not self._summarizing:
+            self._summarizing = True
+            _get_summary_executor().submit(self._summarize_pending)
+    
+    def _summarize_pending(self):
+        """Dołącza oczekujące tury do podsumowania (poza ścieżką odpowiedzi)"""
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+                if not batch:
+                    self._summarizing = False
+                    return
+            
+            try:
+                new_summary = self.summarizer(summary, "\n".join(text for _, _, text in batch))
+            except Exception as e:
+                print(f"Memory summarization error: {e}")
+                with self._lock:
+                    self._summarizing = False
+                    self._drop_unsummarized()
+                return
+            
+            with self._lock:
+                # clear() w trakcie podsumowania - wynik nieaktualny
+                if self._pending[:len(batch)] != batch:
+                    self._summarizing = False
+                    return
+                del self._pending[:len(batch)]
+                self.summary = new_summary.strip()
+                self._summarized_turns += len(batch)
+                self._history_text = None
+                if self.store:
+                    self.store.save_summary(self.session_id, self.summary, self._summarized_turns)
+            print(f"DEBUG: Memory summary updated ({len(batch)} turns, ~{estimate_tokens(self.summary)} tokens)")
+    
+    def _drop_unsummarized(self):
+        """Po nieudanym podsumowaniu usuwa najstarsze oczekujące tury ponad budżet tokenów - historia nie rośnie,
+        dopóki model podsumowań jest niedostępny (wywoływane pod blokadą)"""
+        dropped = 0
+        while self._pending and sum(estimate_tokens(text) for _, _, text in self._pending + self._turns) > self.token_budget:
+            self._pending.pop(0)
+            dropped += 1
+        if not dropped:
+            return
+        self._summarized_turns += dropped
+        self._history_text = None
+        if self.store:
+            self.store.save_summary(self.session_id, self.summary, self._summarized_turns)
+        print(f"DEBUG: Memory summarization failed, dropped {dropped} oldest turns ({len(self._pending)} still pending)")
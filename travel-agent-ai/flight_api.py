@@ -1,120 +1,420 @@
+import asyncio
 import requests
-import time
-from typing import Optional, Dict
+import httpx
+from datetime import date, datetime, timedelta
+from typing import Optional, Dict, List, Tuple
 from models import FlightQuery
 from config import Config
+from http_session import get_session, request_timeout, get_async_client, async_timeout
+from concurrency import gather_with_deadline, agather_with_deadline
+from location_cache import LocationCache, get_location_cache
+from result_cache import ResultCache, get_result_cache, canonical_key
+from single_flight import SingleFlight, get_single_flight
+from resilience import RetryPolicy, call_with_retry, acall_with_retry
+from rate_limiter import BACKGROUND, request_priority
+from stream_parser import streaming_available, parse_streamed, aparse_streamed
 
-class FlightAPI:
-    def __init__(self, api_key: str):
+# Pola oferty czytane przez TravelAgent._extract_flight_essentials i FlightAPIBase._offer_fare - tylko one są
+# budowane przy parsowaniu strumieniowym
+OFFER_FIELDS = (
+    "priceBreakdown.total.units", "priceBreakdown.total.nanos", "segments.item.totalTime",
+    "segments.item.legs.item.carriersData.item.name", "segments.item.legs.item.departureTime",
+    "segments.item.legs.item.arrivalTime", "segments.item.legs.item.departureAirport.code",
+    "segments.item.legs.item.arrivalAirport.code",
+)
+
+class FlightAPIBase:
+    """Część wspólna klientów lotów bez I/O: parametry zapytań, klucze cache, interpretacja odpowiedzi.
+    FlightAPI (requests) i AsyncFlightAPI (httpx) dodają tylko transport - te same nazwy metod,
+    w AsyncFlightAPI jako korutyny, więc żadna z klas nie zastępuje drugiej"""
+    
+    def __init__(self, api_key: str, location_cache: Optional[LocationCache] = None,
+                 result_cache: Optional[ResultCache] = None, single_flight: Optional[SingleFlight] = None):
         self.api_key = api_key
         self.base_url = Config.BOOKING_API_FLIGHT_URL
         self.headers = {
             'x-rapidapi-host': Config.BOOKING_API_HOST,
             'x-rapidapi-key': api_key
         }
-        self.location_cache: Dict[str, str] = {}
+        self.location_cache = location_cache if location_cache is not None else get_location_cache()
+        self.result_cache = result_cache if result_cache is not None else get_result_cache()
+        self.single_flight = single_flight if single_flight is not None else get_single_flight()
+    
+    @staticmethod
+    def _location_ids(locations: Dict[str, Optional[str]], query: FlightQuery) -> Optional[Tuple[str, str]]:
+        """(origin_id, destination_id) z wyniku search_locations; None gdy którejś lokalizacji brak"""
+        origin_id = locations.get(query.origin)
+        destination_id = locations.get(query.destination)
+        
+        if not origin_id or not destination_id:
+            print(f"Could not find location IDs for {query.origin} -> {query.destination}")
+            return None
+        return origin_id, destination_id
+    
+    @classmethod
+    def _search_cache_key(cls, origin_id: str, destination_id: str, query: FlightQuery) -> str:
+        return canonical_key("searchFlights", cls._search_params(origin_id, destination_id, query))
+    
+    @staticmethod
+    def _location_cache_key(iata_code: str, language_code: Optional[str]) -> str:
+        return f"flight:{iata_code}_{language_code or 'default'}"
+    
+    @staticmethod
+    def _location_params(iata_code: str, language_code: Optional[str]) -> dict:
+        params = {"query": iata_code}
+        if language_code:
+            params["languagecode"] = language_code
+        return params
+    
+    @staticmethod
+    def _pick_location_id(data: dict) -> Optional[str]:
+        """Wybiera ID lokalizacji z odpowiedzi searchDestination (None gdy brak ID - nie trafia do cache)"""
+        if not data.get('data'):
+            return None
+        
+        # Preferuj lotniska
+        for location in data['data']:
+            if location.get('type') == 'AIRPORT' and location.get('id'):
+                return location['id']
+        
+        # Jeśli nie ma lotniska, weź pierwszą dostępną lokalizację
+        return next((location['id'] for location in data['data'] if location.get('id')), None)
+    
+    @staticmethod
+    def _flexible_date_queries(query: FlightQuery, days: int) -> List[FlightQuery]:
+        """Zapytania dla kolejnych dat wylotu (bez dat z przeszłości) - data powrotu przesuwana o tyle samo dni"""
+        days = max(0, min(days, Config.FLEX_DATE_MAX_DAYS))
+        departure = datetime.strptime(query.departure_date, "%Y-%m-%d").date()
+        trip_length = None
+        if query.return_date:
+            trip_length = datetime.strptime(query.return_date, "%Y-%m-%d").date() - departure
+        
+        queries = []
+        for offset in range(-days, days + 1):
+            day = departure + timedelta(days=offset)
+            if day < date.today():
+                continue
+            update = {"departure_date": day.isoformat(), "flexible_days": 0}
+            if trip_length is not None:
+                update["return_date"] = (day + trip_length).isoformat()
+            queries.append(query.model_copy(update=update))
+        return queries
+    
+    @staticmethod
+    def _fare_day(query: FlightQuery, data: Optional[dict]) -> dict:
+        """Podsumowanie jednego dnia kalendarza cen"""
+        offers = ((data or {}).get('data') or {}).get('flightOffers') or []
+        fares = [fare for fare in map(FlightAPIBase._offer_fare, offers) if fare]
+        cheapest = min(fares, key=lambda fare: fare['price'], default=None)
+        nonstop = min((fare for fare in fares if fare['stops'] == 0), key=lambda fare: fare['price'], default=None)
+        return {
+            "date": query.departure_date,
+            "return_date": query.return_date,
+            "offers": len(offers),
+            "cheapest": cheapest['price'] if cheapest else None,
+            "airline": cheapest['airline'] if cheapest else None,
+            "nonstop": nonstop['price'] if nonstop else None
+        }
+    
+    @staticmethod
+    def _offer_fare(offer: dict) -> Optional[dict]:
+        """Cena, przesiadki i linia oferty (te same pola co w _extract_flight_essentials)"""
+        try:
+            total = offer.get('priceBreakdown', {}).get('total', {})
+            legs = offer['segments'][0]['legs']
+            return {
+                "price": float(total.get('units', 0)) + float(total.get('nanos', 0)) / 1000000000,
+                "stops": max(0, len(legs) - 1),
+                "airline": legs[0].get('carriersData', [{}])[0].get('name', 'Unknown')
+            }
+        except (KeyError, IndexError, TypeError, AttributeError):
+            return None
+    
+    @staticmethod
+    def _search_params(origin_id: str, destination_id: str, query: FlightQuery) -> dict:
+        """Parametry searchFlights"""
+        # Podstawowe parametry
+        params = {
+            "fromId": origin_id,
+            "toId": destination_id,
+            "departDate": query.departure_date,
+            "adults": str(query.adults),
+            "sort": query.sort_option.value,
+            "cabinClass": query.cabin_class.value,
+            "currency_code": query.currency_code,
+            "pageNo": "1"
+        }
+        
+        # Opcjonalne parametry
+        if query.return_date:
+            params["returnDate"] = query.return_date
+        
+        if query.children:
+            params["children"] = query.children
+        
+        if query.stops:
+            params["stops"] = query.stops.value
+        
+        return params
+    
+    @staticmethod
+    def _parse_search_response(response, data: Optional[dict] = None) -> Optional[dict]:
+        """Interpretacja odpowiedzi searchFlights (requests i httpx) - zwraca surowe dane JSON.
+        data - treść już sparsowana strumieniowo (w przeciwnym razie response.json())"""
+        if response.status_code == 200:
+            data = data if data is not None else response.json()
+            print(f"DEBUG: API Response status: {data.get('status', 'unknown')}")
+            if data.get('status') != False:
+                print(f"DEBUG: API returned raw data with {len(data.get('data', {}).get('flightOffers', []))} flight offers")
+                return data  # Zwracamy surowe dane JSON
+            else:
+                print(f"DEBUG: API returned status: False, message: {data.get('message', 'no message')}")
+        else:
+            print(f"DEBUG: API returned status code: {response.status_code}")
+            print(f"DEBUG: Response: {response.text[:200]}...")
+        return None
+
+
+class FlightAPI(FlightAPIBase):
+    """Synchroniczny klient lotów (requests, równoległe wywołania w puli wątków)"""
+    
+    def __init__(self, api_key: str, session: Optional[requests.Session] = None,
+                 location_cache: Optional[LocationCache] = None, result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None):
+        super().__init__(api_key, location_cache=location_cache, result_cache=result_cache,
+                         single_flight=single_flight)
+        self._session = session
+    
+    @property
+    def session(self) -> requests.Session:
+        return self._session or get_session()
     
     def search_location(self, iata_code: str, language_code: Optional[str] = None) -> Optional[str]:
         """Wyszukiwanie lokalizacji z obsługą kodu języka"""
-        cache_key = f"{iata_code}_{language_code or 'default'}"
-        if cache_key in self.location_cache:
-            return self.location_cache[cache_key]
+        cache_key = self._location_cache_key(iata_code, language_code)
+        cached = self.location_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
+        return self.single_flight.do(cache_key, lambda: self._fetch_location(iata_code, language_code, cache_key))
+    
+    def _fetch_location(self, iata_code: str, language_code: Optional[str], cache_key: str) -> Optional[str]:
+        """Zapytanie searchDestination - wynik trafia do cache lokalizacji"""
         try:
-            params = {"query": iata_code}
-            if language_code:
-                params["languagecode"] = language_code
-                
-            response = requests.get(
+            response = call_with_retry("flights/searchDestination", lambda: self.session.get(
                 f"{self.base_url}/searchDestination",
                 headers=self.headers,
-                params=params,
-                timeout=15
-            )
+                params=self._location_params(iata_code, language_code),
+                timeout=request_timeout(Config.LOCATION_TIMEOUT)
+            ), RetryPolicy(max_retries=Config.LOCATION_MAX_RETRIES))
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('data'):
-                    # Preferuj lotniska
-                    for location in data['data']:
-                        if location.get('type') == 'AIRPORT':
-                            location_id = location.get('id', '')
-                            self.location_cache[cache_key] = location_id
-                            return location_id
-                    
-                    # Jeśli nie ma lotniska, weź pierwszą dostępną lokalizację
-                    location_id = data['data'][0].get('id', '')
-                    self.location_cache[cache_key] = location_id
+            if response is not None and response.status_code == 200:
+                location_id = self._pick_location_id(response.json())
+                if location_id is not None:
+                    self.location_cache.set(cache_key, location_id)
                     return location_id
         except Exception as e:
             print(f"Error searching location {iata_code}: {e}")
         return None
     
+    def search_locations(self, iata_codes: List[str], language_code: Optional[str] = None,
+                         timeout: float = Config.LOCATION_BATCH_TIMEOUT) -> Dict[str, Optional[str]]:
+        """Równoległe wyszukiwanie wielu lokalizacji ze wspólnym limitem czasu"""
+        calls = {
+            code: (lambda code=code: self.search_location(code, language_code))
+            for code in dict.fromkeys(iata_codes)
+        }
+        return gather_with_deadline(calls, timeout)
+    
+    def warm_up(self, iata_codes: List[str] = Config.WARM_UP_AIRPORTS) -> int:
+        """Wstępnie wypełnia cache lokalizacji - pobiera tylko brakujące wpisy, zwraca ich liczbę"""
+        missing = [code for code in iata_codes if self.location_cache.get(self._location_cache_key(code, None)) is None]
+        if missing:
+            with request_priority(BACKGROUND):
+                self.search_locations(missing)
+        return len(missing)
+    
     def search_flights(self, query: FlightQuery) -> Optional[dict]:
         """Wyszukiwanie lotów - zwraca surowe dane z API"""
-        origin_id = self.search_location(query.origin, query.language_code)
-        destination_id = self.search_location(query.destination, query.language_code)
-        
-        if not origin_id or not destination_id:
-            print(f"Could not find location IDs for {query.origin} -> {query.destination}")
+        ids = self._location_ids(self.search_locations([query.origin, query.destination], query.language_code), query)
+        if ids is None:
+            return None
+        return self._search_offers(*ids, query)
+    
+    def search_flexible_dates(self, query: FlightQuery, days: Optional[int] = None,
+                              concurrency: int = Config.FLEX_DATE_CONCURRENCY) -> Optional[List[dict]]:
+        """Kalendarz cen: wyszukiwanie dla dat wylotu departure_date ± days (domyślnie query.flexible_days).
+        Lokalizacje ustalane raz, daty sprawdzane równolegle (po `concurrency`).
+        Zwraca dla każdego dnia najtańszą ofertę i najtańszą bez przesiadek (None gdy brak lokalizacji)"""
+        ids = self._location_ids(self.search_locations([query.origin, query.destination], query.language_code), query)
+        if ids is None:
             return None
         
-        return self._call_api_with_retry(origin_id, destination_id, query)
+        date_queries = self._flexible_date_queries(query, query.flexible_days if days is None else days)
+        results = {}
+        for start in range(0, len(date_queries), concurrency):
+            calls = {
+                date_query.departure_date: (lambda date_query=date_query: self._search_offers(*ids, date_query))
+                for date_query in date_queries[start:start + concurrency]
+            }
+            results.update(gather_with_deadline(calls, Config.FLEX_DATE_TIMEOUT))
+        return [self._fare_day(date_query, results.get(date_query.departure_date)) for date_query in date_queries]
+    
+    def _search_offers(self, origin_id: str, destination_id: str, query: FlightQuery) -> Optional[dict]:
+        """searchFlights dla ustalonych lokalizacji (cache wyników + jedno zapytanie dla równoczesnych wywołań)"""
+        cache_key = self._search_cache_key(origin_id, destination_id, query)
+        return self.result_cache.get_or_fetch(
+            cache_key,
+            lambda: self.single_flight.do(cache_key, lambda: self._call_api_with_retry(origin_id, destination_id, query))
+        )
     
     def _call_api_with_retry(self, origin_id: str, destination_id: str, query: FlightQuery) -> Optional[dict]:
-        """Wywołanie API z retry - zwraca surowe dane JSON"""
-        for attempt in range(Config.MAX_RETRIES + 1):
-            try:
-                if attempt > 0:
-                    time.sleep(Config.RETRY_DELAY)
-                
-                # Podstawowe parametry
-                params = {
-                    "fromId": origin_id,
-                    "toId": destination_id,
-                    "departDate": query.departure_date,
-                    "adults": str(query.adults),
-                    "sort": query.sort_option.value,
-                    "cabinClass": query.cabin_class.value,
-                    "currency_code": query.currency_code,
-                    "pageNo": "1"
-                }
-                
-                # Opcjonalne parametry
-                if query.return_date:
-                    params["returnDate"] = query.return_date
-                
-                if query.children:
-                    params["children"] = query.children
-                
-                if query.stops:
-                    params["stops"] = query.stops.value
-                
-                print(f"API Request params: {params}")
-                
-                response = requests.get(
-                    f"{self.base_url}/searchFlights", 
-                    headers=self.headers, 
-                    params=params, 
-                    timeout=Config.REQUEST_TIMEOUT
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    print(f"DEBUG: API Response status: {data.get('status', 'unknown')}")
-                    if data.get('status') != False:
-                        print(f"DEBUG: API returned raw data with {len(data.get('data', {}).get('flightOffers', []))} flight offers")
-                        return data  # Zwracamy surowe dane JSON
-                    else:
-                        print(f"DEBUG: API returned status: False, message: {data.get('message', 'no message')}")
-                else:
-                    print(f"DEBUG: API returned status code: {response.status_code}")
-                    print(f"DEBUG: Response: {response.text[:200]}...")
-                return None
-                
-            except Exception as e:
-                print(f"API call attempt {attempt + 1} failed: {e}")
-                if attempt >= Config.MAX_RETRIES:
-                    return None
-                continue
-        return None
\ No newline at end of file
+        """Wywołanie API z retry (backoff, Retry-After, circuit breaker) - zwraca surowe dane JSON"""
+        params = self._search_params(origin_id, destination_id, query)
+        print(f"API Request params: {params}")
+        
+        stream = streaming_available()
+        response = call_with_retry("searchFlights", lambda: self.session.get(
+            f"{self.base_url}/searchFlights",
+            headers=self.headers,
+            params=params,
+            timeout=request_timeout(Config.REQUEST_TIMEOUT),
+            stream=stream
+        ))
+        if response is None:
+            return None
+        
+        try:
+            data = None
+            if stream and response.status_code == 200:
+                data = parse_streamed(response.iter_content(Config.STREAM_CHUNK_SIZE), "flightOffers", fields=OFFER_FIELDS)
+            return self._parse_search_response(response, data)
+        except Exception as e:
+            print(f"API response could not be parsed: {e}")
+            return None
+        finally:
+            # Odpowiedź odczytana do końca zwalnia połączenie do puli, przerwana je zamyka
+            response.close()
+
+
+class AsyncFlightAPI(FlightAPIBase):
+    """Asynchroniczny klient lotów (httpx) - metody jak w FlightAPI, ale jako korutyny"""
+    
+    def __init__(self, api_key: str, client: Optional[httpx.AsyncClient] = None,
+                 location_cache: Optional[LocationCache] = None, result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None):
+        super().__init__(api_key, location_cache=location_cache, result_cache=result_cache,
+                         single_flight=single_flight)
+        self._client = client
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_async_client()
+    
+    async def search_location(self, iata_code: str, language_code: Optional[str] = None) -> Optional[str]:
+        """Wyszukiwanie lokalizacji z obsługą kodu języka"""
+        cache_key = self._location_cache_key(iata_code, language_code)
+        # SQLite poza pętlą zdarzeń
+        cached = await asyncio.to_thread(self.location_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        
+        return await self.single_flight.ado(cache_key, lambda: self._fetch_location(iata_code, language_code, cache_key))
+    
+    async def _fetch_location(self, iata_code: str, language_code: Optional[str], cache_key: str) -> Optional[str]:
+        """Zapytanie searchDestination - wynik trafia do cache lokalizacji"""
+        try:
+            response = await acall_with_retry("flights/searchDestination", lambda: self.client.get(
+                f"{self.base_url}/searchDestination",
+                headers=self.headers,
+                params=self._location_params(iata_code, language_code),
+                timeout=async_timeout(Config.LOCATION_TIMEOUT)
+            ), RetryPolicy(max_retries=Config.LOCATION_MAX_RETRIES))
+            
+            if response is not None and response.status_code == 200:
+                location_id = self._pick_location_id(response.json())
+                if location_id is not None:
+                    await asyncio.to_thread(self.location_cache.set, cache_key, location_id)
+                    return location_id
+        except Exception as e:
+            print(f"Error searching location {iata_code}: {e}")
+        return None
+    
+    async def search_locations(self, iata_codes: List[str], language_code: Optional[str] = None,
+                               timeout: float = Config.LOCATION_BATCH_TIMEOUT) -> Dict[str, Optional[str]]:
+        """Równoległe wyszukiwanie wielu lokalizacji ze wspólnym limitem czasu"""
+        calls = {
+            code: (lambda code=code: self.search_location(code, language_code))
+            for code in dict.fromkeys(iata_codes)
+        }
+        return await agather_with_deadline(calls, timeout)
+    
+    async def warm_up(self, iata_codes: List[str] = Config.WARM_UP_AIRPORTS) -> int:
+        """Wstępnie wypełnia cache lokalizacji - pobiera tylko brakujące wpisy, zwraca ich liczbę"""
+        missing = [code for code in iata_codes
+                   if await asyncio.to_thread(self.location_cache.get, self._location_cache_key(code, None)) is None]
+        if missing:
+            with request_priority(BACKGROUND):
+                await self.search_locations(missing)
+        return len(missing)
+    
+    async def search_flights(self, query: FlightQuery) -> Optional[dict]:
+        """Wyszukiwanie lotów - zwraca surowe dane z API"""
+        ids = self._location_ids(await self.search_locations([query.origin, query.destination], query.language_code), query)
+        if ids is None:
+            return None
+        return await self._search_offers(*ids, query)
+    
+    async def search_flexible_dates(self, query: FlightQuery, days: Optional[int] = None,
+                                    concurrency: int = Config.FLEX_DATE_CONCURRENCY) -> Optional[List[dict]]:
+        """Kalendarz cen - jak FlightAPI.search_flexible_dates"""
+        ids = self._location_ids(await self.search_locations([query.origin, query.destination], query.language_code), query)
+        if ids is None:
+            return None
+        
+        date_queries = self._flexible_date_queries(query, query.flexible_days if days is None else days)
+        results = {}
+        for start in range(0, len(date_queries), concurrency):
+            calls = {
+                date_query.departure_date: (lambda date_query=date_query: self._search_offers(*ids, date_query))
+                for date_query in date_queries[start:start + concurrency]
+            }
+            results.update(await agather_with_deadline(calls, Config.FLEX_DATE_TIMEOUT))
+        return [self._fare_day(date_query, results.get(date_query.departure_date)) for date_query in date_queries]
+    
+    async def _search_offers(self, origin_id: str, destination_id: str, query: FlightQuery) -> Optional[dict]:
+        """searchFlights dla ustalonych lokalizacji (cache wyników + jedno zapytanie dla równoczesnych wywołań)"""
+        cache_key = self._search_cache_key(origin_id, destination_id, query)
+        return await self.result_cache.aget_or_fetch(
+            cache_key,
+            lambda: self.single_flight.ado(cache_key, lambda: self._call_api_with_retry(origin_id, destination_id, query))
+        )
+    
+    async def _call_api_with_retry(self, origin_id: str, destination_id: str, query: FlightQuery) -> Optional[dict]:
+        """Wywołanie API z retry (backoff, Retry-After, circuit breaker) - zwraca surowe dane JSON"""
+        params = self._search_params(origin_id, destination_id, query)
+        print(f"API Request params: {params}")
+        
+        stream = streaming_available()
+        response = await acall_with_retry("searchFlights", lambda: self.client.send(self.client.build_request(
+            "GET",
+            f"{self.base_url}/searchFlights",
+            headers=self.headers,
+            params=params,
+            timeout=async_timeout(Config.REQUEST_TIMEOUT)
+        ), stream=stream))
+        if response is None:
+            return None
+        
+        try:
+            data = None
+            if stream and response.status_code == 200:
+                data = await aparse_streamed(response.aiter_bytes(Config.STREAM_CHUNK_SIZE), "flightOffers", fields=OFFER_FIELDS)
+            elif stream:
+                await response.aread()
+            return self._parse_search_response(response, data)
+        except Exception as e:
+            print(f"API response could not be parsed: {e}")
+            return None
+        finally:
+            await response.aclose()
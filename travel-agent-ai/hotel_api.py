@@ -1,58 +1,238 @@
+import asyncio
 import requests
-import time
-from typing import Optional, Dict, Tuple
+import httpx
+from typing import Optional, Dict, Tuple, List
 from models import HotelQuery
 from config import Config
+from http_session import get_session, request_timeout, get_async_client, async_timeout
+from concurrency import gather_with_deadline, agather_with_deadline
+from location_cache import LocationCache, get_location_cache
+from result_cache import ResultCache, get_result_cache, canonical_key
+from single_flight import SingleFlight, get_single_flight
+from resilience import RetryPolicy, call_with_retry, acall_with_retry
+from rate_limiter import BACKGROUND, request_priority
+from stream_parser import streaming_available, parse_streamed, aparse_streamed
 
-class HotelAPI:
-    def __init__(self, api_key: str):
+# Pola hotelu czytane przez TravelAgent._extract_hotel_essentials, _hotel_key i _matches_filters - tylko one
+# są budowane przy parsowaniu strumieniowym
+HOTEL_FIELDS = (
+    "hotel_id", "name", "accessibilityLabel", "property.id", "property.name",
+    "property.priceBreakdown.grossPrice.value",
+)
+
+class HotelAPIBase:
+    """Część wspólna klientów hoteli bez I/O: parametry zapytań, klucze cache, łączenie stron wyników.
+    HotelAPI (requests) i AsyncHotelAPI (httpx) dodają tylko transport"""
+    
+    def __init__(self, api_key: str, destination_cache: Optional[LocationCache] = None,
+                 result_cache: Optional[ResultCache] = None, single_flight: Optional[SingleFlight] = None):
         self.api_key = api_key
         self.base_url = Config.BOOKING_API_HOTEL_URL
         self.headers = {
             'x-rapidapi-host': Config.BOOKING_API_HOST,
             'x-rapidapi-key': api_key
         }
-        self.destination_cache: Dict[str, Tuple[str, str]] = {}
+        self.destination_cache = destination_cache if destination_cache is not None else get_location_cache()
+        self.result_cache = result_cache if result_cache is not None else get_result_cache()
+        self.single_flight = single_flight if single_flight is not None else get_single_flight()
+    
+    @staticmethod
+    def _destination_cache_key(query: str) -> str:
+        return f"hotel:{query}"
+    
+    @classmethod
+    def _search_cache_key(cls, dest_id: str, search_type: str, query: HotelQuery) -> str:
+        return canonical_key("searchHotels", cls._search_params(dest_id, search_type, query))
+    
+    @staticmethod
+    def _pick_destination(data: dict) -> Optional[Tuple[str, str]]:
+        """Wybiera (dest_id, search_type) z odpowiedzi searchDestination"""
+        if not data.get('data'):
+            return None
+        
+        # Preferuj miasta i regiony nad hotelami
+        for destination in data['data']:
+            dest_type = destination.get('dest_type', '').upper()
+            if dest_type in ['CITY', 'REGION', 'DISTRICT']:
+                dest_id = destination.get('dest_id')
+                if dest_id:
+                    return (str(dest_id), dest_type)
+        
+        # Jeśli nie ma miasta, weź pierwszą dostępną destynację
+        first_dest = data['data'][0]
+        dest_id = first_dest.get('dest_id')
+        search_type = first_dest.get('dest_type', 'CITY').upper()
+        if dest_id:
+            return (str(dest_id), search_type)
+        return None
+    
+    @staticmethod
+    def _page_query(query: HotelQuery, page: int) -> HotelQuery:
+        return query.model_copy(update={"page_number": page})
+    
+    @staticmethod
+    def _page_hotels(page: Optional[dict]) -> list:
+        return ((page or {}).get('data') or {}).get('hotels') or []
+    
+    @staticmethod
+    def _hotel_key(hotel: dict) -> str:
+        """Identyfikator do usuwania duplikatów między stronami"""
+        prop = hotel.get('property') if isinstance(hotel.get('property'), dict) else {}
+        return str(hotel.get('hotel_id') or prop.get('id') or prop.get('name') or hotel.get('name'))
+    
+    @staticmethod
+    def _matches_filters(hotel: dict, query: HotelQuery) -> bool:
+        """Czy hotel spełnia filtry ceny zapytania (ta sama cena co w _extract_hotel_essentials)"""
+        if not query.price_min and not query.price_max:
+            return True
+        prop = hotel.get('property') if isinstance(hotel.get('property'), dict) else {}
+        price = ((prop.get('priceBreakdown') or {}).get('grossPrice') or {}).get('value')
+        if not price:
+            return False
+        return (not query.price_min or price >= query.price_min) and (not query.price_max or price <= query.price_max)
+    
+    @classmethod
+    def _needs_more_pages(cls, pages: List[Optional[dict]], query: HotelQuery, min_results: int) -> bool:
+        """Pusta lub nieudana ostatnia strona kończy wyszukiwanie - dalszych wyników nie ma"""
+        if not cls._page_hotels(pages[-1]):
+            return False
+        merged = cls._merge_pages(pages, query)
+        matching = sum(1 for hotel in cls._page_hotels(merged) if cls._matches_filters(hotel, query))
+        if matching >= min_results:
+            return False
+        print(f"DEBUG: {matching} matching hotels after {len(pages)} page(s), fetching more")
+        return True
+    
+    @classmethod
+    def _merge_pages(cls, pages: List[Optional[dict]], query: HotelQuery) -> Optional[dict]:
+        """Scala strony w jeden wynik: bez duplikatów, hotele spełniające filtry na początku (w kolejności stron)"""
+        base = next((page for page in pages if page), None)
+        if base is None or len(pages) == 1:
+            return base
+        
+        hotels, seen = [], set()
+        for page in pages:
+            for hotel in cls._page_hotels(page):
+                key = cls._hotel_key(hotel)
+                if key not in seen:
+                    seen.add(key)
+                    hotels.append(hotel)
+        hotels.sort(key=lambda hotel: not cls._matches_filters(hotel, query))
+        return {**base, "data": {**(base.get('data') or {}), "hotels": hotels}, "pages_fetched": len(pages)}
+    
+    @staticmethod
+    def _search_params(dest_id: str, search_type: str, query: HotelQuery) -> dict:
+        """Parametry searchHotels"""
+        # Podstawowe wymagane parametry
+        params = {
+            "dest_id": dest_id,
+            "search_type": search_type,
+            "arrival_date": query.arrival_date,
+            "departure_date": query.departure_date,
+            "adults": str(query.adults),
+            "room_qty": str(query.room_qty),
+            "page_number": str(query.page_number),
+            "units": query.units.value,
+            "temperature_unit": query.temperature_unit.value,
+            "languagecode": query.language_code,
+            "currency_code": query.currency_code
+        }
+        
+        # Opcjonalne parametry
+        if query.children_age:
+            params["children_age"] = query.children_age
+        
+        if query.price_min:
+            params["price_min"] = str(query.price_min)
+        
+        if query.price_max:
+            params["price_max"] = str(query.price_max)
+        
+        if query.sort_by:
+            params["sort_by"] = query.sort_by
+        
+        if query.categories_filter:
+            params["categories_filter"] = query.categories_filter
+        
+        if query.location:
+            params["location"] = query.location
+        
+        return params
+    
+    @staticmethod
+    def _parse_search_response(response, data: Optional[dict] = None) -> Optional[dict]:
+        """Interpretacja odpowiedzi searchHotels (requests i httpx) - zwraca surowe dane JSON.
+        data - treść już sparsowana strumieniowo (w przeciwnym razie response.json())"""
+        if response.status_code == 200:
+            data = data if data is not None else response.json()
+            print(f"DEBUG: Hotel API Response status: {data.get('status', 'unknown')}")
+            if data.get('status') != False:
+                hotel_offers = data.get('data', {}).get('hotels', [])
+                print(f"DEBUG: API returned raw data with {len(hotel_offers)} hotel offers")
+                return data  # Zwracamy surowe dane JSON
+            else:
+                print(f"DEBUG: Hotel API returned status: False, message: {data.get('message', 'no message')}")
+        else:
+            print(f"DEBUG: Hotel API returned status code: {response.status_code}")
+            print(f"DEBUG: Response: {response.text[:200]}...")
+        return None
+
+
+class HotelAPI(HotelAPIBase):
+    """Synchroniczny klient hoteli (requests, równoległe wywołania w puli wątków)"""
+    
+    def __init__(self, api_key: str, session: Optional[requests.Session] = None,
+                 destination_cache: Optional[LocationCache] = None, result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None):
+        super().__init__(api_key, destination_cache=destination_cache, result_cache=result_cache,
+                         single_flight=single_flight)
+        self._session = session
+    
+    @property
+    def session(self) -> requests.Session:
+        return self._session or get_session()
     
     def search_destination(self, query: str) -> Optional[Tuple[str, str]]:
         """Wyszukiwanie destynacji hotelowej - zwraca (dest_id, search_type)"""
-        if query in self.destination_cache:
-            return self.destination_cache[query]
+        cached = self.destination_cache.get(self._destination_cache_key(query))
+        if cached is not None:
+            return tuple(cached)
         
+        return self.single_flight.do(self._destination_cache_key(query), lambda: self._fetch_destination(query))
+    
+    def _fetch_destination(self, query: str) -> Optional[Tuple[str, str]]:
+        """Zapytanie searchDestination - wynik trafia do cache destynacji"""
         try:
-            response = requests.get(
+            response = call_with_retry("hotels/searchDestination", lambda: self.session.get(
                 f"{self.base_url}/searchDestination",
                 headers=self.headers,
                 params={"query": query},
-                timeout=15
-            )
+                timeout=request_timeout(Config.LOCATION_TIMEOUT)
+            ), RetryPolicy(max_retries=Config.LOCATION_MAX_RETRIES))
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('data'):
-                    # Preferuj miasta i regiony nad hotelami
-                    for destination in data['data']:
-                        dest_type = destination.get('dest_type', '').upper()
-                        if dest_type in ['CITY', 'REGION', 'DISTRICT']:
-                            dest_id = destination.get('dest_id')
-                            search_type = dest_type
-                            if dest_id:
-                                result = (str(dest_id), search_type)
-                                self.destination_cache[query] = result
-                                return result
-                    
-                    # Jeśli nie ma miasta, weź pierwszą dostępną destynację
-                    first_dest = data['data'][0]
-                    dest_id = first_dest.get('dest_id')
-                    search_type = first_dest.get('dest_type', 'CITY').upper()
-                    if dest_id:
-                        result = (str(dest_id), search_type)
-                        self.destination_cache[query] = result
-                        return result
+            if response is not None and response.status_code == 200:
+                result = self._pick_destination(response.json())
+                if result:
+                    self.destination_cache.set(self._destination_cache_key(query), result)
+                    return result
         except Exception as e:
             print(f"Error searching hotel destination {query}: {e}")
         return None
     
+    def search_destinations(self, queries: List[str],
+                            timeout: float = Config.LOCATION_BATCH_TIMEOUT) -> Dict[str, Optional[Tuple[str, str]]]:
+        """Równoległe wyszukiwanie wielu destynacji (np. podróż przez kilka miast) ze wspólnym limitem czasu"""
+        calls = {query: (lambda query=query: self.search_destination(query)) for query in dict.fromkeys(queries)}
+        return gather_with_deadline(calls, timeout)
+    
+    def warm_up(self, destinations: List[str] = Config.WARM_UP_CITIES) -> int:
+        """Wstępnie wypełnia cache destynacji - pobiera tylko brakujące wpisy, zwraca ich liczbę"""
+        missing = [query for query in destinations if self.destination_cache.get(self._destination_cache_key(query)) is None]
+        if missing:
+            with request_priority(BACKGROUND):
+                self.search_destinations(missing)
+        return len(missing)
+    
     def search_hotels(self, query: HotelQuery) -> Optional[dict]:
         """Wyszukiwanie hoteli - zwraca surowe dane z API"""
         destination_info = self.search_destination(query.destination)
@@ -62,75 +242,196 @@ class HotelAPI:
             return None
         
         dest_id, search_type = destination_info
-        return self._call_api_with_retry(dest_id, search_type, query)
+        return self._search_page(dest_id, search_type, query)
+    
+    def search_hotels_pages(self, query: HotelQuery, max_pages: int = Config.HOTEL_MAX_PAGES,
+                            min_results: int = Config.HOTEL_MIN_RESULTS,
+                            concurrency: int = Config.HOTEL_PAGE_CONCURRENCY) -> Optional[dict]:
+        """Wyszukiwanie hoteli na kilku stronach wyników - zwraca jeden scalony wynik (bez duplikatów).
+        Kolejne strony są pobierane równolegle (po `concurrency`) tylko wtedy, gdy dotychczasowe
+        dały mniej niż min_results hoteli spełniających filtry ceny"""
+        destination_info = self.search_destination(query.destination)
+        
+        if not destination_info:
+            print(f"Could not find destination for: {query.destination}")
+            return None
+        
+        dest_id, search_type = destination_info
+        pages = [self._search_page(dest_id, search_type, query)]
+        next_page, last_page = query.page_number + 1, query.page_number + max_pages - 1
+        while next_page <= last_page and self._needs_more_pages(pages, query, min_results):
+            batch = range(next_page, min(next_page + concurrency, last_page + 1))
+            calls = {
+                page: (lambda page=page: self._search_page(dest_id, search_type, self._page_query(query, page)))
+                for page in batch
+            }
+            results = gather_with_deadline(calls, Config.HOTEL_PAGES_TIMEOUT)
+            pages.extend(results[page] for page in batch)
+            next_page = batch.stop
+        return self._merge_pages(pages, query)
+    
+    def _search_page(self, dest_id: str, search_type: str, query: HotelQuery) -> Optional[dict]:
+        """Jedna strona wyników searchHotels (cache wyników + jedno zapytanie dla równoczesnych wywołań)"""
+        cache_key = self._search_cache_key(dest_id, search_type, query)
+        return self.result_cache.get_or_fetch(
+            cache_key,
+            lambda: self.single_flight.do(cache_key, lambda: self._call_api_with_retry(dest_id, search_type, query))
+        )
     
     def _call_api_with_retry(self, dest_id: str, search_type: str, query: HotelQuery) -> Optional[dict]:
-        """Wywołanie API z retry - zwraca surowe dane JSON"""
-        for attempt in range(Config.MAX_RETRIES + 1):
-            try:
-                if attempt > 0:
-                    time.sleep(Config.RETRY_DELAY)
-                
-                # Podstawowe wymagane parametry
-                params = {
-                    "dest_id": dest_id,
-                    "search_type": search_type,
-                    "arrival_date": query.arrival_date,
-                    "departure_date": query.departure_date,
-                    "adults": str(query.adults),
-                    "room_qty": str(query.room_qty),
-                    "page_number": str(query.page_number),
-                    "units": query.units.value,
-                    "temperature_unit": query.temperature_unit.value,
-                    "languagecode": query.language_code,
-                    "currency_code": query.currency_code
-                }
-                
-                # Opcjonalne parametry
-                if query.children_age:
-                    params["children_age"] = query.children_age
-                
-                if query.price_min:
-                    params["price_min"] = str(query.price_min)
-                
-                if query.price_max:
-                    params["price_max"] = str(query.price_max)
-                
-                if query.sort_by:
-                    params["sort_by"] = query.sort_by
-                
-                if query.categories_filter:
-                    params["categories_filter"] = query.categories_filter
-                
-                if query.location:
-                    params["location"] = query.location
-                
-                print(f"Hotel API Request params: {params}")
-                
-                response = requests.get(
-                    f"{self.base_url}/searchHotels",
-                    headers=self.headers,
-                    params=params,
-                    timeout=Config.REQUEST_TIMEOUT
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    print(f"DEBUG: Hotel API Response status: {data.get('status', 'unknown')}")
-                    if data.get('status') != False:
-                        hotel_offers = data.get('data', {}).get('hotels', [])
-                        print(f"DEBUG: API returned raw data with {len(hotel_offers)} hotel offers")
-                        return data  # Zwracamy surowe dane JSON
-                    else:
-                        print(f"DEBUG: Hotel API returned status: False, message: {data.get('message', 'no message')}")
-                else:
-                    print(f"DEBUG: Hotel API returned status code: {response.status_code}")
-                    print(f"DEBUG: Response: {response.text[:200]}...")
-                return None
-                
-            except Exception as e:
-                print(f"Hotel API call attempt {attempt + 1} failed: {e}")
-                if attempt >= Config.MAX_RETRIES:
-                    return None
-                continue
-        return None
\ No newline at end of file
+        """Wywołanie API z retry (backoff, Retry-After, circuit breaker) - zwraca surowe dane JSON"""
+        params = self._search_params(dest_id, search_type, query)
+        print(f"Hotel API Request params: {params}")
+        
+        stream = streaming_available()
+        response = call_with_retry("searchHotels", lambda: self.session.get(
+            f"{self.base_url}/searchHotels",
+            headers=self.headers,
+            params=params,
+            timeout=request_timeout(Config.REQUEST_TIMEOUT),
+            stream=stream
+        ))
+        if response is None:
+            return None
+        
+        try:
+            data = None
+            if stream and response.status_code == 200:
+                data = parse_streamed(response.iter_content(Config.STREAM_CHUNK_SIZE), "hotels", fields=HOTEL_FIELDS)
+            return self._parse_search_response(response, data)
+        except Exception as e:
+            print(f"Hotel API response could not be parsed: {e}")
+            return None
+        finally:
+            # Odpowiedź odczytana do końca zwalnia połączenie do puli, przerwana je zamyka
+            response.close()
+
+
+class AsyncHotelAPI(HotelAPIBase):
+    """Asynchroniczny klient hoteli (httpx) - metody jak w HotelAPI, ale jako korutyny"""
+    
+    def __init__(self, api_key: str, client: Optional[httpx.AsyncClient] = None,
+                 destination_cache: Optional[LocationCache] = None, result_cache: Optional[ResultCache] = None,
+                 single_flight: Optional[SingleFlight] = None):
+        super().__init__(api_key, destination_cache=destination_cache, result_cache=result_cache,
+                         single_flight=single_flight)
+        self._client = client
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        return self._client or get_async_client()
+    
+    async def search_destination(self, query: str) -> Optional[Tuple[str, str]]:
+        """Wyszukiwanie destynacji hotelowej - zwraca (dest_id, search_type)"""
+        # SQLite poza pętlą zdarzeń
+        cached = await asyncio.to_thread(self.destination_cache.get, self._destination_cache_key(query))
+        if cached is not None:
+            return tuple(cached)
+        
+        return await self.single_flight.ado(self._destination_cache_key(query), lambda: self._fetch_destination(query))
+    
+    async def _fetch_destination(self, query: str) -> Optional[Tuple[str, str]]:
+        """Zapytanie searchDestination - wynik trafia do cache destynacji"""
+        try:
+            response = await acall_with_retry("hotels/searchDestination", lambda: self.client.get(
+                f"{self.base_url}/searchDestination",
+                headers=self.headers,
+                params={"query": query},
+                timeout=async_timeout(Config.LOCATION_TIMEOUT)
+            ), RetryPolicy(max_retries=Config.LOCATION_MAX_RETRIES))
+            
+            if response is not None and response.status_code == 200:
+                result = self._pick_destination(response.json())
+                if result:
+                    await asyncio.to_thread(self.destination_cache.set, self._destination_cache_key(query), result)
+                    return result
+        except Exception as e:
+            print(f"Error searching hotel destination {query}: {e}")
+        return None
+    
+    async def search_destinations(self, queries: List[str],
+                                  timeout: float = Config.LOCATION_BATCH_TIMEOUT) -> Dict[str, Optional[Tuple[str, str]]]:
+        """Równoległe wyszukiwanie wielu destynacji ze wspólnym limitem czasu"""
+        calls = {query: (lambda query=query: self.search_destination(query)) for query in dict.fromkeys(queries)}
+        return await agather_with_deadline(calls, timeout)
+    
+    async def warm_up(self, destinations: List[str] = Config.WARM_UP_CITIES) -> int:
+        """Wstępnie wypełnia cache destynacji - pobiera tylko brakujące wpisy, zwraca ich liczbę"""
+        missing = [query for query in destinations
+                   if await asyncio.to_thread(self.destination_cache.get, self._destination_cache_key(query)) is None]
+        if missing:
+            with request_priority(BACKGROUND):
+                await self.search_destinations(missing)
+        return len(missing)
+    
+    async def search_hotels(self, query: HotelQuery) -> Optional[dict]:
+        """Wyszukiwanie hoteli - zwraca surowe dane z API"""
+        destination_info = await self.search_destination(query.destination)
+        
+        if not destination_info:
+            print(f"Could not find destination for: {query.destination}")
+            return None
+        
+        dest_id, search_type = destination_info
+        return await self._search_page(dest_id, search_type, query)
+    
+    async def search_hotels_pages(self, query: HotelQuery, max_pages: int = Config.HOTEL_MAX_PAGES,
+                                  min_results: int = Config.HOTEL_MIN_RESULTS,
+                                  concurrency: int = Config.HOTEL_PAGE_CONCURRENCY) -> Optional[dict]:
+        """Wyszukiwanie na kilku stronach wyników - jak HotelAPI.search_hotels_pages"""
+        destination_info = await self.search_destination(query.destination)
+        
+        if not destination_info:
+            print(f"Could not find destination for: {query.destination}")
+            return None
+        
+        dest_id, search_type = destination_info
+        pages = [await self._search_page(dest_id, search_type, query)]
+        next_page, last_page = query.page_number + 1, query.page_number + max_pages - 1
+        while next_page <= last_page and self._needs_more_pages(pages, query, min_results):
+            batch = range(next_page, min(next_page + concurrency, last_page + 1))
+            calls = {
+                page: (lambda page=page: self._search_page(dest_id, search_type, self._page_query(query, page)))
+                for page in batch
+            }
+            results = await agather_with_deadline(calls, Config.HOTEL_PAGES_TIMEOUT)
+            pages.extend(results[page] for page in batch)
+            next_page = batch.stop
+        return self._merge_pages(pages, query)
+    
+    async def _search_page(self, dest_id: str, search_type: str, query: HotelQuery) -> Optional[dict]:
+        """Jedna strona wyników searchHotels (cache wyników + jedno zapytanie dla równoczesnych wywołań)"""
+        cache_key = self._search_cache_key(dest_id, search_type, query)
+        return await self.result_cache.aget_or_fetch(
+            cache_key,
+            lambda: self.single_flight.ado(cache_key, lambda: self._call_api_with_retry(dest_id, search_type, query))
+        )
+    
+    async def _call_api_with_retry(self, dest_id: str, search_type: str, query: HotelQuery) -> Optional[dict]:
+        """Wywołanie API z retry (backoff, Retry-After, circuit breaker) - zwraca surowe dane JSON"""
+        params = self._search_params(dest_id, search_type, query)
+        print(f"Hotel API Request params: {params}")
+        
+        stream = streaming_available()
+        response = await acall_with_retry("searchHotels", lambda: self.client.send(self.client.build_request(
+            "GET",
+            f"{self.base_url}/searchHotels",
+            headers=self.headers,
+            params=params,
+            timeout=async_timeout(Config.REQUEST_TIMEOUT)
+        ), stream=stream))
+        if response is None:
+            return None
+        
+        try:
+            data = None
+            if stream and response.status_code == 200:
+                data = await aparse_streamed(response.aiter_bytes(Config.STREAM_CHUNK_SIZE), "hotels", fields=HOTEL_FIELDS)
+            elif stream:
+                await response.aread()
+            return self._parse_search_response(response, data)
+        except Exception as e:
+            print(f"Hotel API response could not be parsed: {e}")
+            return None
+        finally:
+            await response.aclose()
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import weakref
+from typing import Optional, Tuple
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import Config
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Wspólna sesja HTTP (pula połączeń keep-alive) dla FlightAPI i HotelAPI"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_session()
+    return _session
+
+
+def _create_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=Config.HTTP_POOL_CONNECTIONS,
+        pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+        pool_block=Config.HTTP_POOL_BLOCK
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "Accept-Encoding": "gzip, deflate",
+        "Connection": "keep-alive"
+    })
+    return session
+
+
+def request_timeout(read_timeout: float) -> Tuple[float, float]:
+    """Timeout (connect, read) - nawiązanie połączenia ma osobny, krótszy limit"""
+    return (Config.HTTP_CONNECT_TIMEOUT, read_timeout)
+
+
+def close_session():
+    """Zamyka pulę połączeń (np. przy wyłączaniu aplikacji)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Wspólny klient httpx dla bieżącej pętli zdarzeń (połączenia są związane z pętlą)"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=Config.HTTP_POOL_MAXSIZE,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=async_timeout(Config.REQUEST_TIMEOUT),
+            headers={"Accept-Encoding": "gzip, deflate"}
+        )
+        _async_clients[loop] = client
+    return client
+
+
+def async_timeout(read_timeout: float) -> httpx.Timeout:
+    """Odpowiednik request_timeout dla httpx"""
+    return httpx.Timeout(read_timeout, connect=Config.HTTP_CONNECT_TIMEOUT)
+
+
+async def aclose_async_client():
+    """Zamyka klienta httpx bieżącej pętli zdarzeń"""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
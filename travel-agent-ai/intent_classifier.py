@@ -0,0 +1,136 @@
+import re
+from typing import Optional, Dict, List, Tuple, NamedTuple
+
+# Usuwanie polskich znaków - dopasowujemy rdzenie niezależnie od pisowni ("lotów" == "lotow")
+_PL_CHARS = str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzACELNOSZZ")
+
+# Wzorce (rdzeń + odmiany) z wagami. Waga 1.0 = jednoznaczne słowo kluczowe, 0.5 = słaba wskazówka
+INTENT_PATTERNS: Dict[str, List[Tuple[str, float]]] = {
+    "LOTY": [
+        (r"\blot(y|u|em|ow|ach|ami|nisk\w*|nicz\w*)?\b", 1.0),
+        (r"\b(samolot|przelot|wylot|odlot)\w*", 1.0),
+        (r"\blec(iec|e|imy|icie|isz|i|ial\w*|iel\w*)\b", 1.0),
+        (r"\b(po|wy|przy)leciec\b", 1.0),
+        (r"\b(airline|airlines|flight|flights)\b", 1.0),
+        (r"\bbilet\w*", 0.5),
+        (r"\bprzesiad\w*", 0.5),
+        (r"\bbezposredni\w*", 0.5),
+    ],
+    "HOTELE": [
+        (r"\b(hotel|hostel|nocleg|zakwaterow|apartament)\w*", 1.0),
+        (r"\b(prze)?spa(c|nie|nia)\b", 1.0),
+        (r"\bpokoj\w*|\bpokoi\b", 0.5),
+        (r"\bpobyt\w*", 0.5),
+        (r"\bnoc(e|y)?\b", 0.5),
+        (r"\b(zameld|wymeld)\w*", 0.5),
+    ],
+    "ATRAKCJE": [
+        (r"\batrakcj\w*", 1.0),
+        (r"\bzwiedz\w*", 1.0),
+        (r"\bzobaczyc\b", 1.0),
+        (r"\bco (warto )?(robic|porobic)\b", 1.0),
+        (r"\bwycieczk\w*", 1.0),
+        (r"\b(muzeum|muzea|muzeow|zabyt\w*)", 1.0),
+        (r"\b(sightseeing|attractions?)\b", 1.0),
+        (r"\bprzewodnik\w*", 0.5),
+        (r"\brestauracj\w*|\bgdzie (zjesc|jesc)\b", 0.5),
+        (r"\bplaz\w*", 0.5),
+    ],
+    # Lot i nocleg razem - wskazówki podróży; same słowa lotu i hotelu jej nie oznaczają (patrz _decide)
+    "PODROZ": [
+        (r"\b(wyjazd|wakacj|urlop|podroz)\w*", 0.5),
+        (r"\b(lot|loty|lotu|lotem|przelot\w*)( i| oraz| plus| z)? (hotel|nocleg|zakwaterow)\w*", 0.5),
+        (r"\b(hotel|nocleg)\w* (i|oraz|plus|z) (lot|loty|lotem|przelot\w*)\b", 0.5),
+        (r"\bz (noclegiem|hotelem|zakwaterowaniem)\b", 0.5),
+    ],
+}
+
+# Kody IATA pisane wielkimi literami ("WAW", "CDG") - słaba wskazówka lotów
+_IATA_PATTERN = re.compile(r"\b[A-Z]{3}\b")
+_NOT_IATA = {"PLN", "EUR", "USD", "GBP", "CHF", "CZK", "HUF", "SPA", "VIP"}
+
+# Krótkie odpowiedzi potwierdzające - intencję bierzemy z ostatniego pytania Agenta
+AFFIRMATIVE_REPLIES = {
+    "tak", "ok", "okej", "okay", "jasne", "pewnie", "poprosze", "prosze", "dawaj",
+    "chetnie", "zgoda", "dobrze", "super", "szukaj", "pokaz", "yes", "sure", "no", "to",
+}
+
+# Wygładzenie - pojedyncza słaba wskazówka nie wystarcza do szybkiej ścieżki
+_SMOOTHING = 0.5
+
+
+class IntentDecision(NamedTuple):
+    intent: Optional[str]  # "LOTY" / "HOTELE" / "PODROZ" / "ATRAKCJE" lub None gdy niejednoznaczne
+    confidence: float
+    scores: Dict[str, float]
+    source: str  # "keywords" / "context" / "none"
+
+
+class IntentClassifier:
+    """Lokalny klasyfikator intencji oparty na słowach kluczowych i rdzeniach polskich słów"""
+
+    def __init__(self, threshold: float = 0.6):
+        self.threshold = threshold
+        self._patterns = {
+            intent: [(re.compile(pattern), weight) for pattern, weight in patterns]
+            for intent, patterns in INTENT_PATTERNS.items()
+        }
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Małe litery, bez polskich znaków, pojedyncze spacje"""
+        text = text.translate(_PL_CHARS).lower()
+        return " ".join(re.findall(r"[a-z0-9]+", text))
+
+    def score(self, text: str, iata_hint: bool = True) -> Dict[str, float]:
+        """Suma wag dopasowanych wzorców dla każdej intencji (iata_hint - kody IATA jako wskazówka lotów)"""
+        normalized = self.normalize(text)
+        scores = {intent: 0.0 for intent in self._patterns}
+        for intent, patterns in self._patterns.items():
+            for pattern, weight in patterns:
+                if pattern.search(normalized):
+                    scores[intent] += weight
+
+        if iata_hint and any(code not in _NOT_IATA for code in _IATA_PATTERN.findall(text)):
+            scores["LOTY"] += 0.5
+        return scores
+
+    def classify(self, user_input: str, last_agent_message: Optional[str] = None) -> IntentDecision:
+        """Klasyfikuje zapytanie; intent=None oznacza, że decyzję musi podjąć LLM"""
+        tokens = self.normalize(user_input).split()
+
+        # Krótka odpowiedź ("Tak", "OK, poproszę") - patrzymy na ostatnie pytanie Agenta
+        if tokens and len(tokens) <= 3 and all(token in AFFIRMATIVE_REPLIES for token in tokens):
+            if last_agent_message:
+                # Bez wskazówki IATA - pytanie o hotele po lotach może zawierać kod lotniska
+                return self._decide(self.score(self._last_question(last_agent_message), iata_hint=False), "context")
+            return IntentDecision(None, 0.0, {}, "none")
+
+        return self._decide(self.score(user_input), "keywords")
+
+    def _decide(self, scores: Dict[str, float], source: str) -> IntentDecision:
+        total = sum(scores.values())
+        if total == 0:
+            return IntentDecision(None, 0.0, scores, "none")
+
+        # Lot i nocleg w jednym zapytaniu to podróż tylko przy wyraźnej wskazówce ("lot i hotel", "wyjazd").
+        # Bez niej ("hotel blisko lotniska") obie intencje mają niską pewność i decyduje LLM
+        if scores.get("LOTY", 0) >= 1.0 and scores.get("HOTELE", 0) >= 1.0 and scores.get("PODROZ", 0) > 0:
+            scores = dict(scores)
+            scores["PODROZ"] = scores.get("PODROZ", 0) + scores.pop("LOTY") + scores.pop("HOTELE")
+
+        intent, top = max(scores.items(), key=lambda item: item[1])
+        confidence = round(top / (total + _SMOOTHING), 2)
+        if confidence < self.threshold:
+            return IntentDecision(None, confidence, scores, source)
+        return IntentDecision(intent, confidence, scores, source)
+
+    @staticmethod
+    def _last_question(agent_message: str) -> str:
+        """Końcówka odpowiedzi Agenta - ostatnie pytanie lub propozycja następnego kroku"""
+        tail = agent_message[-300:]
+        if "?" in tail:
+            before_question = tail[:tail.rfind("?")]
+            line_start = max(before_question.rfind("\n"), before_question.rfind(". "))
+            return before_question[line_start + 1:]
+        return tail.splitlines()[-1] if tail.strip() else ""
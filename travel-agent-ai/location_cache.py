@@ -0,0 +1,113 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from config import Config
+
+
+class LocationCache:
+    """Trwały cache ID lokalizacji/destynacji (SQLite) z TTL i usuwaniem najdawniej używanych wpisów.
+    Bezpieczny dla wątków; plik może być współdzielony przez kilka procesów.
+    Trafienie nie zapisuje nic od razu - czasy użycia są zbierane i zapisywane zbiorczo
+    (co touch_batch odczytów i przed usuwaniem wpisów), a wpisy wygasłe i nadmiarowe usuwane co evict_every
+    zapisów (limit max_entries może być chwilowo przekroczony o mniej niż evict_every wpisów)"""
+    
+    def __init__(self, path: str = Config.LOCATION_CACHE_PATH, ttl: float = Config.LOCATION_CACHE_TTL,
+                 max_entries: int = Config.LOCATION_CACHE_MAX_ENTRIES, touch_batch: int = Config.LOCATION_CACHE_TOUCH_BATCH,
+                 evict_every: int = Config.LOCATION_CACHE_EVICT_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.evict_every = evict_every
+        self._writes = 0  # zapisy od ostatniego usuwania wpisów
+        self._touched: Dict[str, float] = {}  # klucz -> czas ostatniego trafienia, jeszcze nie zapisany
+        self._lock = threading.Lock()
+        
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS locations (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_locations_last_access ON locations(last_access)")
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Zwraca wartość lub None gdy brak wpisu albo wpis wygasł"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created_at FROM locations WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            
+            value, created_at = row
+            if now - created_at > self.ttl:
+                self._conn.execute("DELETE FROM locations WHERE key = ?", (key,))
+                return None
+            
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch:
+                self._flush_touched()
+        return json.loads(value)
+    
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO locations (key, value, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._writes += 1
+            if self._writes >= self.evict_every:
+                self._evict()
+    
+    def _flush_touched(self):
+        """Zapisuje zebrane czasy trafień jednym wywołaniem"""
+        if self._touched:
+            self._conn.executemany("UPDATE locations SET last_access = ? WHERE key = ?",
+                                   [(last_access, key) for key, last_access in self._touched.items()])
+            self._touched.clear()
+    
+    def _evict(self):
+        """Usuwa wpisy wygasłe, a przy przekroczeniu limitu - najdawniej używane"""
+        self._writes = 0
+        self._flush_touched()
+        self._conn.execute("DELETE FROM locations WHERE created_at < ?", (time.time() - self.ttl,))
+        excess = self._conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM locations WHERE key IN (SELECT key FROM locations ORDER BY last_access ASC LIMIT ?)",
+                (excess,)
+            )
+    
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM locations")
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM locations").fetchone()[0]
+
+
+_location_cache: Optional[LocationCache] = None
+_location_cache_lock = threading.Lock()
+
+
+def get_location_cache() -> LocationCache:
+    """Wspólny cache lokalizacji dla FlightAPI i HotelAPI"""
+    global _location_cache
+    if _location_cache is None:
+        with _location_cache_lock:
+            if _location_cache is None:
+                _location_cache = LocationCache()
+    return _location_cache
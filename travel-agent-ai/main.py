@@ -17,7 +17,10 @@ def main():
                 break
             
             if user_input:
-                print(f"\n🤖 Agent:\n{agent.process_query(user_input)}")
+                print("\n🤖 Agent:")
+                for chunk in agent.process_query_stream(user_input):
+                    print(chunk, end="", flush=True)
+                print()
                 
     except Exception as e:
         print(f"❌ Błąd: {e}")
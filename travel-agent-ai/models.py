@@ -1,4 +1,4 @@
-from typing import Optional, List
+from typing import Optional, List, Union, Literal
 from pydantic import BaseModel, Field
 from enum import Enum
 
@@ -41,6 +41,7 @@ class FlightQuery(BaseModel):
     stops: Optional[StopOption] = Field(default=None, description="Preferencje dotyczące przesiadek")
     currency_code: str = Field(default="PLN", description="Kod waluty")
     language_code: Optional[str] = Field(default=None, description="Kod języka dla wyników")
+    flexible_days: int = Field(default=0, description="Elastyczna data wylotu: szukaj ± tyle dni wokół departure_date (0 = dokładna data)")
 
     @property
     def passengers(self) -> int:
@@ -117,4 +118,110 @@ class HotelResult(BaseModel):
     check_out: str
     room_type: Optional[str] = Field(default=None)
     free_cancellation: bool = Field(default=False)
-    breakfast_included: bool = Field(default=False)
\ No newline at end of file
+    breakfast_included: bool = Field(default=False)
+
+
+class TripQuery(BaseModel):
+    """Podróż: lot i nocleg w miejscu docelowym wyszukiwane razem (daty hotelu wynikają z dat lotu)"""
+    flight: FlightQuery = Field(description="Parametry lotu (z datą powrotu, jeśli podano długość pobytu)")
+    city: str = Field(description="Miasto noclegu - zwykle miasto docelowe lotu")
+    room_qty: int = Field(default=1, description="Liczba pokoi")
+    hotel_price_max: Optional[float] = Field(default=None, description="Maksymalna cena hotelu za noc")
+    total_budget: Optional[float] = Field(default=None, description="Budżet całej podróży (lot + hotel, wszystkie osoby) w PLN")
+
+    def hotel_query(self) -> HotelQuery:
+        """Zapytanie o hotel na czas pobytu: od dnia wylotu do dnia powrotu (bez powrotu - domyślna liczba nocy)"""
+        return HotelQuery(
+            destination=self.city,
+            arrival_date=self.flight.departure_date,
+            departure_date=self.flight.return_date or "",
+            adults=self.flight.adults,
+            children_age=self.flight.children,
+            room_qty=self.room_qty,
+            price_max=self.hotel_price_max,
+            currency_code=self.flight.currency_code
+        )
+
+
+class FlightRequest(BaseModel):
+    intent: Literal["LOTY"] = Field(description="Zapytanie o loty")
+    query: FlightQuery = Field(description="Parametry wyszukiwania lotów")
+
+class HotelRequest(BaseModel):
+    intent: Literal["HOTELE"] = Field(description="Zapytanie o hotele")
+    query: HotelQuery = Field(description="Parametry wyszukiwania hoteli")
+
+class TripRequest(BaseModel):
+    intent: Literal["PODROZ"] = Field(description="Zapytanie o lot i hotel jednocześnie")
+    query: TripQuery = Field(description="Parametry lotu i noclegu")
+
+class AttractionsRequest(BaseModel):
+    intent: Literal["ATRAKCJE"] = Field(description="Zapytanie o atrakcje")
+
+class RoutedRequest(BaseModel):
+    """Typ zapytania razem z parametrami wyszukiwania - wynik jednego wywołania LLM"""
+    request: Union[FlightRequest, HotelRequest, TripRequest, AttractionsRequest] = Field(
+        discriminator="intent",
+        description="Rozpoznane zapytanie użytkownika"
+    )
+
+
+class TripState(BaseModel):
+    """Zwięzły stan podróży ustalony w rozmowie - trafia do promptów zamiast całej historii"""
+    origin: Optional[str] = Field(default=None, description="Kod IATA lotniska wylotu")
+    destination_airport: Optional[str] = Field(default=None, description="Kod IATA lotniska docelowego")
+    destination_city: Optional[str] = Field(default=None, description="Miasto docelowe (hotele)")
+    start_date: Optional[str] = Field(default=None, description="Początek podróży YYYY-MM-DD")
+    end_date: Optional[str] = Field(default=None, description="Koniec podróży YYYY-MM-DD")
+    adults: Optional[int] = Field(default=None, description="Liczba dorosłych")
+    children: Optional[str] = Field(default=None, description="Wiek dzieci oddzielone przecinkami")
+    flight_budget: Optional[float] = Field(default=None, description="Budżet lotu w PLN")
+    hotel_price_max: Optional[float] = Field(default=None, description="Maksymalna cena hotelu za noc")
+    last_search: Optional[str] = Field(default=None, description="Typ ostatniego zapytania (LOTY/HOTELE/PODROZ/ATRAKCJE)")
+    last_agent_question: Optional[str] = Field(default=None, description="Ostatnie pytanie Agenta")
+
+    def update_from_flight(self, query: FlightQuery):
+        # Lot w jedną stronę do tego samego miejsca nie kasuje wcześniej ustalonego końca podróży
+        if not query.return_date and query.destination != self.destination_airport:
+            self.end_date = None
+        self.origin = query.origin
+        self.destination_airport = query.destination
+        self.start_date = query.departure_date
+        self.end_date = query.return_date or self.end_date
+        self.adults = query.adults
+        self.children = query.children
+        self.flight_budget = query.budget or self.flight_budget
+
+    def update_from_hotel(self, query: HotelQuery):
+        self.destination_city = query.destination
+        self.start_date = query.arrival_date
+        self.end_date = query.departure_date
+        self.adults = query.adults
+        self.children = query.children_age
+        self.hotel_price_max = query.price_max or self.hotel_price_max
+
+    def record_turn(self, query_type: Optional[str], response: str):
+        """Typ zapytania i ostatnie pytanie z odpowiedzi Agenta (do rozumienia krótkich odpowiedzi typu "Tak")"""
+        if query_type:
+            self.last_search = query_type
+        questions = [line.strip() for line in response.splitlines() if line.strip().endswith("?")]
+        self.last_agent_question = questions[-1][:200] if questions else None
+
+    def to_prompt(self) -> str:
+        """Stan w formie kilku linii do promptu"""
+        fields = [
+            ("Wylot z", self.origin),
+            ("Lotnisko docelowe", self.destination_airport),
+            ("Miasto docelowe", self.destination_city),
+            ("Od", self.start_date),
+            ("Do", self.end_date),
+            ("Dorośli", self.adults),
+            ("Wiek dzieci", self.children),
+            ("Budżet lotu (PLN)", self.flight_budget),
+            ("Maks. cena hotelu za noc", self.hotel_price_max),
+            ("Ostatnie wyszukiwanie", self.last_search),
+            ("Ostatnie pytanie Agenta", self.last_agent_question),
+        ]
+        lines = [f"- {label}: {value:g}" if isinstance(value, float) else f"- {label}: {value}"
+                 for label, value in fields if value not in (None, "")]
+        return "\n".join(lines) if lines else "Brak ustalonych parametrów podróży."
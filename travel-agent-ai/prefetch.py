@@ -0,0 +1,109 @@
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Hashable, Iterable, Optional
+
+from config import Config
+from rate_limiter import BACKGROUND, get_rate_limiter, request_priority
+
+STARTED = "started"
+SKIPPED_PENDING = "skipped_pending"
+SKIPPED_BUDGET = "skipped_budget"
+DONE = "done"
+FAILED = "failed"
+
+
+class Prefetcher:
+    """Wyszukiwania spekulatywne w tle (np. hotele po pokazaniu lotów) - wynik trafia do cache wyników,
+    więc odpowiedź na "Tak" nie czeka na API.
+    Budżet: osobna mała pula, limit zadań w toku i start tylko wtedy, gdy kubełki rate limitera
+    mają wolne tokeny i nikt w nich nie czeka - prefetch nie odbiera tokenów zapytaniom użytkowników"""
+
+    def __init__(self, workers: int = Config.PREFETCH_WORKERS, max_pending: int = Config.PREFETCH_MAX_PENDING,
+                 min_tokens: float = Config.PREFETCH_MIN_TOKENS):
+        self.max_pending = max_pending
+        self.min_tokens = min_tokens
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._pending = set()
+        self._tasks = set()  # referencje do zadań asyncio, żeby nie zostały usunięte przed końcem
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def submit(self, key: Hashable, call: Callable[[], Optional[object]], buckets: Iterable[str]) -> bool:
+        """Uruchamia call() w tle z priorytetem BACKGROUND; False gdy pominięte (już w toku lub brak budżetu)"""
+        if not self._start(key, buckets):
+            return False
+        self._executor.submit(self._run, key, call)
+        return True
+
+    def asubmit(self, key: Hashable, call: Callable[[], Awaitable[Optional[object]]], buckets: Iterable[str]) -> bool:
+        """Asynchroniczna wersja submit - zadanie w bieżącej pętli zdarzeń"""
+        if not self._start(key, buckets):
+            return False
+        task = asyncio.ensure_future(self._arun(key, call))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    def has_budget(self, buckets: Iterable[str]) -> bool:
+        """Wolne tokeny i pusta kolejka we wszystkich kubełkach, z których skorzysta wyszukiwanie"""
+        for bucket in buckets:
+            stats = get_rate_limiter(bucket).stats()
+            if stats["queue_depth"] > 0 or stats["tokens"] < self.min_tokens:
+                print(f"DEBUG: Prefetch skipped, rate limit {bucket} busy "
+                      f"(queue {stats['queue_depth']}, tokens {stats['tokens']})")
+                return False
+        return True
+
+    def _start(self, key: Hashable, buckets: Iterable[str]) -> bool:
+        with self._lock:
+            if key in self._pending or len(self._pending) >= self.max_pending:
+                self.stats[SKIPPED_PENDING] += 1
+                return False
+            if not self.has_budget(buckets):
+                self.stats[SKIPPED_BUDGET] += 1
+                return False
+            self._pending.add(key)
+            self.stats[STARTED] += 1
+        print(f"DEBUG: Prefetch started: {key}")
+        return True
+
+    def _finish(self, key: Hashable, state: str):
+        with self._lock:
+            self._pending.discard(key)
+            self.stats[state] += 1
+
+    def _run(self, key: Hashable, call: Callable[[], Optional[object]]):
+        state = FAILED
+        try:
+            with request_priority(BACKGROUND):
+                state = DONE if call() is not None else FAILED
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+        finally:
+            self._finish(key, state)
+
+    async def _arun(self, key: Hashable, call: Callable[[], Awaitable[Optional[object]]]):
+        state = FAILED
+        try:
+            with request_priority(BACKGROUND):
+                state = DONE if await call() is not None else FAILED
+        except Exception as e:
+            print(f"Prefetch failed: {e}")
+        finally:
+            self._finish(key, state)
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Wspólny prefetcher dla wszystkich sesji - jeden budżet dla całego klucza RapidAPI"""
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher()
+    return _prefetcher
@@ -0,0 +1,153 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from config import Config
+
+# Priorytety kolejki - mniejsza liczba obsługiwana wcześniej
+INTERACTIVE = 0
+BACKGROUND = 10
+
+_priority: ContextVar[int] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Ustawia priorytet zapytań do API w bieżącym kontekście (wątek / zadanie asyncio)"""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class RateLimiter:
+    """Token bucket dla jednego endpointu: rate zapytań na sekundę, chwilowo do burst naraz.
+    Oczekujący są obsługiwani według priorytetu, a w obrębie priorytetu - kolejności zgłoszenia.
+    Wspólny dla wątków i pętli asyncio"""
+    
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._queue = []  # kopiec (priorytet, numer zgłoszenia)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._acquired = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+    
+    def acquire(self, priority: Optional[int] = None, timeout: float = Config.RATE_LIMIT_MAX_WAIT) -> bool:
+        """Czeka na token; False gdy nie udało się go uzyskać w czasie timeout"""
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(priority)
+            try:
+                while True:
+                    wait = self._try_take(ticket, start)
+                    if wait == 0:
+                        return True
+                    remaining = start + timeout - time.monotonic()
+                    if remaining <= 0:
+                        print(f"DEBUG: Rate limit {self.name}: no token within {timeout}s")
+                        return False
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self._discard(ticket)
+    
+    async def aacquire(self, priority: Optional[int] = None, timeout: float = Config.RATE_LIMIT_MAX_WAIT) -> bool:
+        """Asynchroniczna wersja acquire - czeka bez blokowania pętli zdarzeń"""
+        start = time.monotonic()
+        with self._cond:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_take(ticket, start)
+                if wait == 0:
+                    return True
+                remaining = start + timeout - time.monotonic()
+                if remaining <= 0:
+                    print(f"DEBUG: Rate limit {self.name}: no token within {timeout}s")
+                    return False
+                await asyncio.sleep(min(wait, remaining))
+        finally:
+            with self._cond:
+                self._discard(ticket)
+    
+    def stats(self) -> dict:
+        """Stan kolejki: liczba oczekujących, dostępne tokeny, czasy oczekiwania"""
+        with self._cond:
+            self._refill()
+            return {
+                "queue_depth": len(self._queue),
+                "queued_by_priority": dict(Counter(priority for priority, _ in self._queue)),
+                "tokens": round(self._tokens, 2),
+                "acquired": self._acquired,
+                "avg_wait": round(self._total_wait / self._acquired, 3) if self._acquired else 0.0,
+                "max_wait": round(self._max_wait, 3),
+                # ile poczeka nowe zapytanie ustawione na końcu kolejki
+                "estimated_wait": round(max(0.0, (len(self._queue) + 1 - self._tokens) / self.rate), 3),
+            }
+    
+    def _enqueue(self, priority: Optional[int]) -> Tuple[int, int]:
+        ticket = (_priority.get() if priority is None else priority, next(self._seq))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+    
+    def _discard(self, ticket: Tuple[int, int]):
+        """Usuwa zgłoszenie, które zrezygnowało z czekania"""
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._cond.notify_all()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def _try_take(self, ticket: Tuple[int, int], start: float) -> float:
+        """Pobiera token, gdy zgłoszenie jest pierwsze w kolejce - zwraca 0,
+        w przeciwnym razie przybliżony czas do ponownej próby"""
+        self._refill()
+        if self._queue[0] == ticket and self._tokens >= 1:
+            heapq.heappop(self._queue)
+            self._tokens -= 1
+            waited = time.monotonic() - start
+            self._acquired += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            self._cond.notify_all()
+            return 0
+        return max((1 - self._tokens) / self.rate, 0.005)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(endpoint: str) -> RateLimiter:
+    """Wspólny limiter dla endpointu - np. 'flights/searchDestination' i 'hotels/searchDestination'
+    korzystają z jednego kubełka 'searchDestination' (limity z Config.RATE_LIMITS)"""
+    bucket = endpoint.rsplit("/", 1)[-1]
+    with _limiters_lock:
+        if bucket not in _limiters:
+            rate, burst = Config.RATE_LIMITS.get(bucket, Config.RATE_LIMITS['default'])
+            _limiters[bucket] = RateLimiter(bucket, rate, burst)
+        return _limiters[bucket]
+
+
+def get_rate_limit_stats() -> Dict[str, dict]:
+    """Statystyki wszystkich kubełków"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,224 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional
+
+from config import Config
+from rate_limiter import get_rate_limiter
+
+# Statusy, przy których ponowienie ma sens (przeciążenie, chwilowa awaria upstreamu)
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+# Statusy świadczące o awarii upstreamu - liczone przez circuit breaker (429 oznacza, że API żyje)
+UPSTREAM_FAILURE_STATUSES = {408, 500, 502, 503, 504}
+
+
+def is_retryable(status_code: int) -> bool:
+    return status_code in RETRYABLE_STATUSES
+
+
+class CircuitBreaker:
+    """Circuit breaker dla jednego endpointu: po serii awarii odrzuca wywołania od razu,
+    po reset_timeout przepuszcza jedno wywołanie próbne (half-open)"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, failure_threshold: int = Config.CIRCUIT_FAILURE_THRESHOLD,
+                 reset_timeout: float = Config.CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Czy wywołanie może pójść do upstreamu"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            # Kolejna próba także gdy poprzednia próbna nie zakończyła się (np. anulowana)
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = time.monotonic()
+                print(f"DEBUG: Circuit {self.name} half-open, probing upstream")
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print(f"DEBUG: Circuit {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    print(f"DEBUG: Circuit {self.name} open after {self.failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(endpoint: str) -> CircuitBreaker:
+    """Wspólny circuit breaker dla endpointu (wszystkie klienty i sesje)"""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(endpoint)
+        return _breakers[endpoint]
+
+
+class RetryPolicy:
+    """Wykładnicze opóźnienia z losowym rozrzutem (jitter) oraz obsługa Retry-After
+    i nagłówków limitów RapidAPI"""
+    
+    def __init__(self, max_retries: int = Config.MAX_RETRIES, base_delay: float = Config.RETRY_DELAY,
+                 max_delay: float = Config.RETRY_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def backoff(self, attempt: int) -> float:
+        """Opóźnienie przed ponowieniem nr attempt+1 (połowa stała, połowa losowa)"""
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+    
+    def delay(self, attempt: int, response=None) -> Optional[float]:
+        """Ile czekać przed kolejną próbą; None gdy serwer każe czekać dłużej niż max_delay"""
+        delay = self.backoff(attempt)
+        hint = server_retry_hint(response) if response is not None else None
+        if hint is not None:
+            if hint > self.max_delay:
+                return None
+            delay = max(delay, hint)
+        return delay
+
+
+def server_retry_hint(response) -> Optional[float]:
+    """Czas oczekiwania podany przez serwer: Retry-After albo reset limitu RapidAPI"""
+    headers = response.headers
+    retry_after = headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(retry_after)
+                return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    
+    # RapidAPI: X-RateLimit-Requests-Remaining / X-RateLimit-Requests-Reset (sekundy do odnowienia)
+    if headers.get("X-RateLimit-Requests-Remaining") == "0":
+        reset = headers.get("X-RateLimit-Requests-Reset")
+        if reset and reset.isdigit():
+            return float(reset)
+    return None
+
+
+def call_with_retry(endpoint: str, send: Callable[[], object], policy: Optional[RetryPolicy] = None):
+    """Wysyła zapytanie z ponowieniami, circuit breakerem i limitem zapytań (każda próba zużywa token).
+    Zwraca ostatnią odpowiedź (także błędną) albo None gdy nie udało się jej uzyskać"""
+    policy = policy or RetryPolicy()
+    breaker = get_circuit_breaker(endpoint)
+    limiter = get_rate_limiter(endpoint)
+    response = None
+    
+    for attempt in range(policy.max_retries + 1):
+        if not breaker.allow():
+            print(f"DEBUG: Circuit {endpoint} open, failing fast")
+            return response
+        if not limiter.acquire():
+            return response
+        
+        try:
+            response = send()
+        except Exception as e:
+            print(f"{endpoint} attempt {attempt + 1} failed: {e}")
+            breaker.record_failure()
+            response = None
+        else:
+            _record(breaker, response.status_code)
+            if not is_retryable(response.status_code):
+                return response
+            print(f"{endpoint} attempt {attempt + 1} returned {response.status_code}")
+            _release(response)
+        
+        if attempt >= policy.max_retries or breaker.state == CircuitBreaker.OPEN:
+            break
+        delay = policy.delay(attempt, response)
+        if delay is None:
+            print(f"DEBUG: {endpoint} asks to wait longer than {policy.max_delay}s, giving up")
+            break
+        time.sleep(delay)
+    return response
+
+
+async def acall_with_retry(endpoint: str, send: Callable[[], Awaitable[object]], policy: Optional[RetryPolicy] = None):
+    """Asynchroniczna wersja call_with_retry"""
+    policy = policy or RetryPolicy()
+    breaker = get_circuit_breaker(endpoint)
+    limiter = get_rate_limiter(endpoint)
+    response = None
+    
+    for attempt in range(policy.max_retries + 1):
+        if not breaker.allow():
+            print(f"DEBUG: Circuit {endpoint} open, failing fast")
+            return response
+        if not await limiter.aacquire():
+            return response
+        
+        try:
+            response = await send()
+        except Exception as e:
+            print(f"{endpoint} attempt {attempt + 1} failed: {e}")
+            breaker.record_failure()
+            response = None
+        else:
+            _record(breaker, response.status_code)
+            if not is_retryable(response.status_code):
+                return response
+            print(f"{endpoint} attempt {attempt + 1} returned {response.status_code}")
+            await _arelease(response)
+        
+        if attempt >= policy.max_retries or breaker.state == CircuitBreaker.OPEN:
+            break
+        delay = policy.delay(attempt, response)
+        if delay is None:
+            print(f"DEBUG: {endpoint} asks to wait longer than {policy.max_delay}s, giving up")
+            break
+        await asyncio.sleep(delay)
+    return response
+
+
+def _release(response):
+    """Odczytuje treść odrzuconej odpowiedzi - połączenie odpowiedzi strumieniowanej wraca do puli"""
+    try:
+        response.content
+    except Exception:
+        pass
+
+
+async def _arelease(response):
+    try:
+        await response.aread()
+    except Exception:
+        pass
+
+
+def _record(breaker: CircuitBreaker, status_code: int):
+    if status_code in UPSTREAM_FAILURE_STATUSES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+from config import Config
+from concurrency import get_io_executor
+from rate_limiter import BACKGROUND, request_priority
+
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+# Parametry z listą wieków dzieci - kolejność nie ma znaczenia dla wyniku
+_AGE_LIST_PARAMS = {"children", "children_age"}
+_DATE_PARAMS = {"departDate", "returnDate", "arrival_date", "departure_date"}
+_UPPERCASE_PARAMS = {"currency_code", "sort", "cabinClass", "search_type"}
+
+
+def canonical_key(endpoint: str, params: dict) -> str:
+    """Klucz cache z parametrów faktycznie wysyłanych do API (znormalizowane daty, waluta, pasażerowie)"""
+    normalized = {}
+    for name, value in params.items():
+        if value is None or value == "":
+            continue
+        value = str(value).strip()
+        if name in _DATE_PARAMS:
+            value = _normalize_date(value)
+        elif name in _UPPERCASE_PARAMS:
+            value = value.upper()
+        elif name in _AGE_LIST_PARAMS:
+            value = ",".join(sorted((age.strip() for age in value.split(",") if age.strip()), key=_age_sort_key))
+        elif name in ("price_min", "price_max"):
+            value = f"{float(value):.0f}"
+        normalized[name] = value
+    return f"{endpoint}:{json.dumps(normalized, sort_keys=True, ensure_ascii=False)}"
+
+
+def _age_sort_key(value: str):
+    return (0, int(value)) if value.isdigit() else (1, value)
+
+
+def _normalize_date(value: str) -> str:
+    for fmt in ("%Y-%m-%d", "%Y/%m/%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return value
+
+
+class ResultCache:
+    """Cache wyników wyszukiwania w pamięci: TTL, stale-while-revalidate i limit liczby wpisów (LRU).
+    Po upływie TTL wpis jest jeszcze przez stale_ttl zwracany od razu, a odświeżenie idzie w tle"""
+    
+    def __init__(self, ttl: float = Config.RESULT_CACHE_TTL, stale_ttl: float = Config.RESULT_CACHE_STALE_TTL,
+                 max_entries: int = Config.RESULT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._refreshing = set()
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+    
+    def get(self, key: str) -> Tuple[Optional[Any], str]:
+        """Zwraca (wartość, FRESH/STALE/MISS)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, MISS
+            
+            stored_at, value = entry
+            age = time.time() - stored_at
+            if age > self.ttl + self.stale_ttl:
+                del self._entries[key]
+                return None, MISS
+            
+            self._entries.move_to_end(key)
+            return value, FRESH if age <= self.ttl else STALE
+    
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def get_or_fetch(self, key: str, fetch: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Zwraca wynik z cache lub wywołuje fetch(); nieaktualny wpis odświeża w tle"""
+        value, state = self.get(key)
+        self.stats[state] += 1
+        if state == FRESH:
+            print(f"DEBUG: Result cache hit ({state})")
+            return value
+        if state == STALE:
+            print(f"DEBUG: Result cache hit ({state}), refreshing in background")
+            if self._start_refresh(key):
+                get_io_executor().submit(self._refresh, key, fetch)
+            return value
+        
+        result = fetch()
+        if result is not None:
+            self.set(key, result)
+        return result
+    
+    async def aget_or_fetch(self, key: str, fetch: Callable[[], Awaitable[Optional[Any]]]) -> Optional[Any]:
+        """Asynchroniczna wersja get_or_fetch"""
+        value, state = self.get(key)
+        self.stats[state] += 1
+        if state == FRESH:
+            print(f"DEBUG: Result cache hit ({state})")
+            return value
+        if state == STALE:
+            print(f"DEBUG: Result cache hit ({state}), refreshing in background")
+            if self._start_refresh(key):
+                task = asyncio.ensure_future(self._arefresh(key, fetch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            return value
+        
+        result = await fetch()
+        if result is not None:
+            self.set(key, result)
+        return result
+    
+    def _start_refresh(self, key: str) -> bool:
+        """Tylko jedno odświeżenie danego klucza naraz"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+    
+    def _refresh(self, key: str, fetch: Callable[[], Optional[Any]]):
+        try:
+            with request_priority(BACKGROUND):
+                result = fetch()
+            if result is not None:
+                self.set(key, result)
+        except Exception as e:
+            print(f"Result cache refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+    
+    async def _arefresh(self, key: str, fetch: Callable[[], Awaitable[Optional[Any]]]):
+        try:
+            with request_priority(BACKGROUND):
+                result = await fetch()
+            if result is not None:
+                self.set(key, result)
+        except Exception as e:
+            print(f"Result cache refresh failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Wspólny cache wyników dla klientów lotów i hoteli (sync i async)"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
@@ -0,0 +1,346 @@
+from typing import List, Optional
+from datetime import datetime
+
+from models import FlightQuery, HotelQuery
+from config import Config
+from conversation_memory import estimate_tokens
+
+TOP_OFFERS = 5
+TRIP_TOP_OFFERS = 3  # po tyle lotów i hoteli w odpowiedzi dla podróży
+
+# Kolumny zwięzłej tabeli ofert dla LLM - nazwy pól takie same jak w uproszczonych wynikach
+FLIGHT_COLUMNS = ["price", "airline", "departure_time", "arrival_time", "origin_airport", "destination_airport", "stops", "duration"]
+HOTEL_COLUMNS = ["name", "price_per_night", "rating", "accessibility_label"]
+
+FLIGHT_TIPS = [
+    "💡 Ceny lotów zmieniają się dynamicznie - jeśli oferta pasuje, nie zwlekaj z rezerwacją.",
+    "🧳 Sprawdź limity bagażu u przewoźnika - tanie linie często liczą bagaż rejestrowany osobno.",
+    "⏰ Na lotnisku bądź 2 godziny przed odlotem, przy lotach poza Schengen nawet wcześniej.",
+]
+
+HOTEL_TIPS = [
+    "💡 Sprawdź warunki anulowania - elastyczna rezerwacja bywa warta kilku złotych więcej.",
+    "📍 Porównaj odległość od centrum - tańszy hotel daleko od atrakcji może kosztować więcej w transporcie.",
+    "⭐ Zwróć uwagę na liczbę opinii, a nie tylko na samą ocenę.",
+]
+
+WEEKDAYS = ["pn", "wt", "śr", "cz", "pt", "sb", "nd"]
+
+CABIN_BADGES = {
+    "ECONOMY": "💺 Economy",
+    "PREMIUM_ECONOMY": "💺 Premium Economy",
+    "BUSINESS": "🛋️ Business",
+    "FIRST": "👑 First",
+}
+
+
+def render_results(search_type: str, query_params, results: list) -> str:
+    """Formatowanie wyników bez LLM - te same reguły wyboru co w trybie 'rich'"""
+    if search_type == "LOTY":
+        return render_flights(query_params, results)
+    return render_hotels(query_params, results)
+
+
+def rank_flights(flights: List[dict], limit: Optional[int] = TOP_OFFERS) -> List[dict]:
+    """Priorytet: 1) bez przesiadek, 2) najniższa cena"""
+    return sorted(flights, key=lambda f: (f.get('stops', 0) > 0, f.get('price', 0)))[:limit]
+
+
+def rank_hotels(hotels: List[dict], limit: Optional[int] = TOP_OFFERS) -> List[dict]:
+    """Priorytet: najniższa cena (hotele bez ceny na końcu)"""
+    return sorted(hotels, key=lambda h: (not h.get('price_per_night'), h.get('price_per_night') or 0))[:limit]
+
+
+def compact_results(search_type: str, results: list, token_budget: int = Config.FORMAT_TOKEN_BUDGET) -> str:
+    """Oferty dla LLM jako tabela: wiersz nagłówka z nazwami pól, potem jedna oferta na wiersz ('|' między wartościami).
+    Krótkie godziny, zaokrąglone ceny; oferty w kolejności priorytetu - po przekroczeniu budżetu tokenów
+    odcinane są najsłabsze (co najmniej jedna zostaje)"""
+    if search_type == "LOTY":
+        columns, rows = FLIGHT_COLUMNS, [_compact_flight(flight) for flight in rank_flights(results, limit=None)]
+    else:
+        columns, rows = HOTEL_COLUMNS, [_compact_hotel(hotel) for hotel in rank_hotels(results, limit=None)]
+
+    lines = ["|".join(columns)]
+    used = estimate_tokens(lines[0])
+    for row in rows:
+        cost = estimate_tokens(row)
+        if len(lines) > 1 and used + cost > token_budget:
+            print(f"DEBUG: Format token budget {token_budget} reached, sending {len(lines) - 1}/{len(rows)} offers")
+            break
+        lines.append(row)
+        used += cost
+    return "\n".join(lines)
+
+
+def compact_params(query) -> str:
+    """Parametry wyszukiwania jako 'pole=wartość; ...' bez pustych pól"""
+    params = query.model_dump(mode="json", exclude_none=True) if hasattr(query, "model_dump") else dict(query)
+    return "; ".join(f"{name}={value}" for name, value in params.items())
+
+
+def _compact_flight(flight: dict) -> str:
+    return _compact_row([
+        round(flight.get('price') or 0),
+        flight.get('airline', ''),
+        _compact_datetime(flight.get('departure_time')),
+        _compact_datetime(flight.get('arrival_time')),
+        flight.get('origin_airport', ''),
+        flight.get('destination_airport', ''),
+        flight.get('stops', 0),
+        _compact_duration(flight.get('duration')),
+    ])
+
+
+def _compact_hotel(hotel: dict) -> str:
+    return _compact_row([
+        hotel.get('name', ''),
+        round(hotel.get('price_per_night') or 0),
+        f"{hotel['rating']:g}" if hotel.get('rating') else "",
+        (hotel.get('accessibility_label') or '')[:80],
+    ])
+
+
+def _compact_row(values: list) -> str:
+    return "|".join(str(value).replace("|", "/").replace("\n", " ") for value in values)
+
+
+def _compact_datetime(value: Optional[str]) -> str:
+    """'2025-06-01T07:15:00' → '01.06 07:15'"""
+    try:
+        return datetime.fromisoformat(value).strftime('%d.%m %H:%M')
+    except (TypeError, ValueError):
+        return value or ""
+
+
+def _compact_duration(seconds) -> str:
+    """9000 → '2h30'"""
+    try:
+        minutes = int(seconds) // 60
+    except (TypeError, ValueError):
+        return str(seconds)
+    return f"{minutes // 60}h{minutes % 60:02d}"
+
+
+def render_flights(query: FlightQuery, flights: List[dict]) -> str:
+    best = rank_flights(flights)
+    passengers = query.passengers
+    lines = [
+        f"✈️ **Loty {query.origin} → {query.destination}**",
+        f"📅 {_format_date(query.departure_date)}"
+        + (f" – powrót {_format_date(query.return_date)}" if query.return_date else "")
+        + f" | 👥 {passengers} {_plural(passengers, 'osoba', 'osoby', 'osób')}"
+        + f" | {CABIN_BADGES.get(query.cabin_class.value, '💺 Economy')}",
+        "",
+        f"🔝 **{len(best)} najlepszych ofert:**",
+    ]
+
+    for i, flight in enumerate(best, 1):
+        lines += _flight_offer_lines(i, flight, passengers)
+
+    lines += ["", "💵 **Budżet:**", _flight_budget_summary(query, best)]
+    lines += ["", "📌 **Wskazówki:**"] + FLIGHT_TIPS[:3]
+    # Nazwa miasta, nie kod IATA - kod w pytaniu wskazywałby klasyfikatorowi loty zamiast hoteli
+    city = Config.AIRPORT_CITIES.get(query.destination.upper(), query.destination)
+    lines += ["", f"➡️ Czy chcesz teraz poszukać hoteli ({city}) na te daty?"]
+    return "\n".join(lines)
+
+
+def render_hotels(query: HotelQuery, hotels: List[dict]) -> str:
+    best = rank_hotels(hotels)
+    nights = max(query.nights, 1)
+    guests = query.total_guests
+    lines = [
+        f"🏨 **Hotele: {query.destination}**",
+        f"📅 {_format_date(query.arrival_date)} – {_format_date(query.departure_date)}"
+        f" ({nights} {_plural(nights, 'noc', 'noce', 'nocy')}) | 👥 {guests} {_plural(guests, 'osoba', 'osoby', 'osób')}",
+        "",
+        f"🔝 **{len(best)} najtańszych ofert:**",
+    ]
+
+    for i, hotel in enumerate(best, 1):
+        lines += _hotel_offer_lines(i, hotel)
+
+    lines += ["", "💵 **Budżet:**", _hotel_budget_summary(query, best, nights)]
+    lines += ["", "📌 **Wskazówki:**"] + HOTEL_TIPS[:3]
+    lines += ["", f"➡️ Czy chcesz poszukać lotów do {query.destination} na te daty?",
+              "🎯 Mogę też podpowiedzieć, co warto zobaczyć na miejscu."]
+    return "\n".join(lines)
+
+
+def render_trip(flight_query: FlightQuery, hotel_query: HotelQuery, flights: List[dict], hotels: List[dict],
+                total_budget: Optional[float] = None) -> str:
+    """Podróż: najlepsze loty i hotele z jednego wyszukiwania oraz łączny koszt najtańszego zestawu"""
+    best_flights = rank_flights(flights, limit=TRIP_TOP_OFFERS)
+    best_hotels = rank_hotels(hotels, limit=TRIP_TOP_OFFERS)
+    nights = max(hotel_query.nights, 1)
+    passengers = flight_query.passengers
+    lines = [
+        f"🧳 **Podróż {flight_query.origin} → {flight_query.destination}, nocleg: {hotel_query.destination}**",
+        f"📅 {_format_date(flight_query.departure_date)}"
+        + (f" – powrót {_format_date(flight_query.return_date)}" if flight_query.return_date else "")
+        + f" ({nights} {_plural(nights, 'noc', 'noce', 'nocy')}) | 👥 {passengers} {_plural(passengers, 'osoba', 'osoby', 'osób')}",
+        "",
+        "✈️ **Loty:**",
+    ]
+
+    if best_flights:
+        for i, flight in enumerate(best_flights, 1):
+            lines += _flight_offer_lines(i, flight, passengers)
+    else:
+        lines.append(f"❌ Brak lotów {flight_query.origin} → {flight_query.destination} na {flight_query.departure_date}")
+
+    lines += ["", "🏨 **Hotele:**"]
+    if best_hotels:
+        for i, hotel in enumerate(best_hotels, 1):
+            lines += _hotel_offer_lines(i, hotel)
+    else:
+        lines.append(f"❌ Brak hoteli w {hotel_query.destination} na {hotel_query.arrival_date}")
+
+    lines += ["", "💵 **Budżet:**", _trip_budget_summary(best_flights, best_hotels, nights, total_budget)]
+    lines += ["", "📌 **Wskazówki:**", FLIGHT_TIPS[0], HOTEL_TIPS[0]]
+    lines += ["", "🎯 Czy chcesz, żebym podpowiedział, co warto zobaczyć na miejscu?"]
+    return "\n".join(lines)
+
+
+def render_fare_calendar(query: FlightQuery, days: List[dict]) -> str:
+    """Kalendarz cen (wynik FlightAPI.search_flexible_dates) - najtańsza oferta i najtańsza bez przesiadek dla każdego dnia"""
+    priced = [day for day in days if day.get('cheapest')]
+    best = min(priced, key=lambda day: day['cheapest']) if priced else None
+    window = max(0, min(query.flexible_days, Config.FLEX_DATE_MAX_DAYS))  # jak w FlightAPIBase._flexible_date_queries
+    lines = [
+        f"📅 **Kalendarz cen {query.origin} → {query.destination}** (±{window} dni)",
+        "",
+        "| Wylot | Najtaniej | Bez przesiadek |",
+        "|---|---|---|",
+    ]
+
+    for day in days:
+        departure = _format_weekday_date(day['date']) + (" ⭐" if day is best else "")
+        cheapest = f"{_format_price(day['cheapest'])} ({day['airline']})" if day.get('cheapest') else "brak lotów"
+        nonstop = _format_price(day['nonstop']) if day.get('nonstop') else "—"
+        lines.append(f"| {departure} | {cheapest} | {nonstop} |")
+
+    if best:
+        lines += ["", f"⭐ Najtańszy dzień: **{_format_weekday_date(best['date'])}** – od {_format_price(best['cheapest'])}"]
+    return "\n".join(lines)
+
+
+def _flight_offer_lines(i: int, flight: dict, passengers: int) -> List[str]:
+    stops = flight.get('stops', 0)
+    stops_text = "✅ bez przesiadek" if stops == 0 else f"🔄 przesiadki: {stops}"
+    price_text = f"💰 **{_format_price(flight.get('price', 0))}**"
+    if passengers > 1:
+        price_text += f" ({_format_price(flight.get('price', 0) / passengers)}/os.)"
+
+    return [
+        f"{i}. **{flight.get('airline', 'Unknown')}** {_format_time(flight.get('departure_time'))} → "
+        f"{_format_time(flight.get('arrival_time'))} ({_format_duration(flight.get('duration'))})",
+        f"   {flight.get('origin_airport', '')} → {flight.get('destination_airport', '')} | {stops_text} | {price_text}",
+    ]
+
+
+def _hotel_offer_lines(i: int, hotel: dict) -> List[str]:
+    rating = hotel.get('rating')
+    rating_text = f"⭐ {rating}" if rating else "⭐ brak oceny"
+    lines = [f"{i}. **{hotel.get('name', 'Unknown Hotel')}** | {rating_text} | 💰 **{_format_price(hotel.get('price_per_night', 0))}**/noc"]
+    if hotel.get('accessibility_label'):
+        lines.append(f"   📍 {hotel['accessibility_label']}")
+    return lines
+
+
+def _trip_budget_summary(flights: List[dict], hotels: List[dict], nights: int, total_budget: Optional[float]) -> str:
+    """Najtańszy lot + najtańszy hotel na cały pobyt, porównane z budżetem całej podróży"""
+    flight_prices = [f.get('price') for f in flights if f.get('price')]
+    hotel_prices = [h.get('price_per_night') for h in hotels if h.get('price_per_night')]
+    if not flight_prices or not hotel_prices:
+        return "Brak cen lotu lub hotelu - nie można policzyć kosztu całej podróży."
+
+    flight_cost = min(flight_prices)
+    stay_cost = min(hotel_prices) * nights
+    total = flight_cost + stay_cost
+    summary = (f"Najtańszy zestaw: lot {_format_price(flight_cost)} + hotel {_format_price(stay_cost)} "
+               f"({nights} {_plural(nights, 'noc', 'noce', 'nocy')}) = **{_format_price(total)}**.")
+    if total_budget:
+        if total <= total_budget:
+            summary += f" ✅ Mieści się w budżecie {_format_price(total_budget)}."
+        else:
+            summary += f" ⚠️ Przekracza budżet {_format_price(total_budget)} o {_format_price(total - total_budget)}."
+    return summary
+
+
+def _flight_budget_summary(query: FlightQuery, flights: List[dict]) -> str:
+    prices = [f.get('price', 0) for f in flights if f.get('price')]
+    if not prices:
+        return "Brak informacji o cenach."
+
+    cheapest = min(prices)
+    summary = f"Ceny od {_format_price(cheapest)} do {_format_price(max(prices))} łącznie."
+    if query.budget:
+        if cheapest <= query.budget:
+            summary += f" ✅ Najtańsza oferta mieści się w budżecie {_format_price(query.budget)}."
+        else:
+            summary += f" ⚠️ Najtańsza oferta przekracza budżet {_format_price(query.budget)} o {_format_price(cheapest - query.budget)}."
+    return summary
+
+
+def _hotel_budget_summary(query: HotelQuery, hotels: List[dict], nights: int) -> str:
+    prices = [h.get('price_per_night') for h in hotels if h.get('price_per_night')]
+    if not prices:
+        return "Brak informacji o cenach."
+
+    cheapest = min(prices)
+    summary = (f"Ceny od {_format_price(cheapest)} do {_format_price(max(prices))} za noc, "
+               f"czyli od ok. {_format_price(cheapest * nights)} za cały pobyt.")
+    if query.price_max:
+        if cheapest <= query.price_max:
+            summary += f" ✅ Najtańsza oferta mieści się w limicie {_format_price(query.price_max)}/noc."
+        else:
+            summary += f" ⚠️ Żadna oferta nie mieści się w limicie {_format_price(query.price_max)}/noc."
+    return summary
+
+
+def _plural(n: int, one: str, few: str, many: str) -> str:
+    """Polska odmiana: 1 osoba, 2-4 osoby, 5+ osób"""
+    if n == 1:
+        return one
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return few
+    return many
+
+
+def _format_price(value: Optional[float]) -> str:
+    return f"{round(value or 0):,} PLN".replace(",", " ")
+
+
+def _format_time(value: Optional[str]) -> str:
+    """'2025-06-01T07:15:00' → '07:15'"""
+    if not value:
+        return "--:--"
+    try:
+        return datetime.fromisoformat(value).strftime('%H:%M')
+    except ValueError:
+        return value
+
+
+def _format_date(value: Optional[str]) -> str:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%d.%m.%Y')
+    except (TypeError, ValueError):
+        return value or ""
+
+
+def _format_weekday_date(value: str) -> str:
+    """'2025-06-06' → 'pt 06.06'"""
+    try:
+        day = datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return value or ""
+    return f"{WEEKDAYS[day.weekday()]} {day.strftime('%d.%m')}"
+
+
+def _format_duration(seconds) -> str:
+    try:
+        minutes = int(seconds) // 60
+    except (TypeError, ValueError):
+        return str(seconds)
+    return f"{minutes // 60}h {minutes % 60:02d}min"
@@ -0,0 +1,309 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from config import Config
+from travel_agent import TravelAgent, TravelAgentFactory
+from rate_limiter import get_rate_limit_stats
+from http_session import aclose_async_client, close_session
+
+MAX_BODY_BYTES = Config.SERVER_MAX_MESSAGE_CHARS * 4 + 1024  # UTF-8 + narzut JSON
+
+
+class Session:
+    """Rozmowa jednego użytkownika - agent z własną pamięcią, jedna odpowiedź naraz"""
+
+    def __init__(self, agent: TravelAgent):
+        self.agent = agent
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+
+    @property
+    def busy(self) -> bool:
+        return self.lock.locked()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+
+class SessionManager:
+    """Sesje rozmów w jednym procesie: osobna pamięć i stan podróży na sesję (TravelAgent.new_session),
+    wspólne klienty LLM, pule HTTP i cache.
+    Sesje bezczynne dłużej niż ttl są zwalniane z pamięci, a po przekroczeniu max_sessions - najdawniej
+    używana bezczynna (LRU). Rozmowa zostaje w magazynie sesji - kolejne zapytanie z tym samym id
+    ją wznawia (także po restarcie lub w innym workerze przy Config.SESSION_STORE = 'sqlite').
+    Używany tylko z pętli zdarzeń serwera, więc bez blokad"""
+
+    def __init__(self, agent: TravelAgent, max_sessions: int = Config.SERVER_MAX_SESSIONS,
+                 ttl: float = Config.SERVER_SESSION_TTL):
+        self.agent = agent
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+
+    def create(self) -> Optional[Tuple[str, Session]]:
+        """Nowa sesja; None gdy limit osiągnięty, a wszystkie sesje właśnie odpowiadają"""
+        agent = self.agent.new_session()  # nowa rozmowa - bez odczytu magazynu
+        session = self._add(agent.session_id, agent)
+        return (agent.session_id, session) if session else None
+    
+    async def get(self, session_id: str) -> Optional[Session]:
+        """Sesja z pamięci lub wznowiona z magazynu; None gdy nieznana (lub brak miejsca na wznowienie).
+        Odczyt magazynu poza pętlą zdarzeń - w tym czasie inne zapytanie mogło już wznowić tę sesję"""
+        session = self._sessions.get(session_id)
+        if session is None and await asyncio.to_thread(self.agent.session_store.exists, session_id):
+            agent = await asyncio.to_thread(self.agent.new_session, session_id)
+            session = self._sessions.get(session_id)
+            if session is None:
+                print(f"DEBUG: Resuming stored session {session_id}")
+                return self._add(session_id, agent)
+        if session is not None:
+            self._sessions.move_to_end(session_id)
+            session.touch()
+        return session
+    
+    async def remove(self, session_id: str) -> bool:
+        """Usuwa sesję razem z zapisaną rozmową"""
+        session = self._sessions.pop(session_id, None)
+        if session is None:
+            await asyncio.to_thread(self.agent.session_store.delete, session_id)
+            return False
+        await asyncio.to_thread(session.agent.clear_memory)
+        return True
+    
+    def _add(self, session_id: str, agent: TravelAgent) -> Optional[Session]:
+        self.evict_expired()
+        if len(self._sessions) >= self.max_sessions and not self._evict_lru():
+            return None
+        session = Session(agent)
+        self._sessions[session_id] = session
+        return session
+
+    def evict_expired(self) -> int:
+        expired_before = time.monotonic() - self.ttl
+        expired = [session_id for session_id, session in self._sessions.items()
+                   if session.last_used < expired_before and not session.busy]
+        for session_id in expired:
+            del self._sessions[session_id]
+        if expired:
+            print(f"DEBUG: Evicted {len(expired)} idle sessions, {len(self._sessions)} left")
+        return len(expired)
+
+    def _evict_lru(self) -> bool:
+        for session_id, session in self._sessions.items():
+            if not session.busy:
+                del self._sessions[session_id]
+                print(f"DEBUG: Session limit {self.max_sessions} reached, evicted least recently used session")
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "busy": sum(1 for session in self._sessions.values() if session.busy),
+            "max_sessions": self.max_sessions
+        }
+
+
+class TravelAgentServer:
+    """Aplikacja ASGI (np. `uvicorn server:app`) - wiele równoległych rozmów w jednym procesie.
+
+    POST   /sessions                   -> {"session_id": ...}
+    POST   /sessions/{id}/messages     {"message": ...} -> odpowiedź strumieniowana (text/plain)
+    GET    /sessions/{id}/history      -> {"history": ...}
+    DELETE /sessions/{id}
+    GET    /health                     -> sesje, odpowiedzi w toku, statystyki routingu i rate limitów
+
+    Ograniczenia: najwyżej SERVER_MAX_CONCURRENT_REQUESTS odpowiedzi naraz (kolejne czekają do
+    SERVER_QUEUE_TIMEOUT, potem 503), jedna odpowiedź naraz w sesji (409), wiadomość do
+    SERVER_MAX_MESSAGE_CHARS znaków (413). Fragmenty odpowiedzi wysyłane w miarę generowania -
+    wolny klient spowalnia generowanie, a rozłączony je przerywa"""
+
+    def __init__(self, agent: Optional[TravelAgent] = None):
+        self._agent = agent
+        self.sessions: Optional[SessionManager] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            self._start()
+            await self._route(scope, receive, send)
+
+    def _start(self):
+        """Agent (klienty LLM i API) tworzony raz - przy starcie lub przy pierwszym zapytaniu"""
+        if self.sessions is None:
+            self.sessions = SessionManager(self._agent or TravelAgentFactory.create())
+            self._slots = asyncio.Semaphore(Config.SERVER_MAX_CONCURRENT_REQUESTS)
+            self._sweeper = asyncio.ensure_future(self._sweep())
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    self._start()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._sweeper:
+                    self._sweeper.cancel()
+                await aclose_async_client()
+                close_session()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(Config.SERVER_SWEEP_INTERVAL)
+            self.sessions.evict_expired()
+            purged = await asyncio.to_thread(self.sessions.agent.session_store.purge_expired)
+            if purged:
+                print(f"DEBUG: Purged {purged} expired sessions from session store")
+
+    async def _route(self, scope, receive, send):
+        method = scope["method"]
+        parts = scope["path"].strip("/").split("/")
+
+        if parts == ["health"] and method == "GET":
+            await _send_json(send, 200, self.stats())
+        elif parts == ["sessions"] and method == "POST":
+            created = self.sessions.create()
+            if created is None:
+                await _send_json(send, 503, {"error": "Zbyt wiele aktywnych sesji, spróbuj za chwilę"},
+                                 {"retry-after": str(Config.SERVER_QUEUE_TIMEOUT)})
+            else:
+                await _send_json(send, 201, {"session_id": created[0]})
+        elif len(parts) >= 2 and parts[0] == "sessions":
+            session = await self.sessions.get(parts[1])
+            if session is None:
+                await _send_json(send, 404, {"error": "Nieznana lub wygasła sesja (albo brak miejsca na jej wznowienie)"})
+            elif parts[2:] == ["messages"] and method == "POST":
+                await self._handle_message(session, parts[1], receive, send)
+            elif parts[2:] == ["history"] and method == "GET":
+                await _send_json(send, 200, {"history": await asyncio.to_thread(session.agent.get_chat_history)})
+            elif parts[2:] == [] and method == "DELETE":
+                await self.sessions.remove(parts[1])
+                await _send_json(send, 204, None)
+            else:
+                await _send_json(send, 404, {"error": "Nieznany adres"})
+        else:
+            await _send_json(send, 404, {"error": "Nieznany adres"})
+
+    async def _handle_message(self, session: Session, session_id: str, receive, send):
+        body = await _read_body(receive, MAX_BODY_BYTES)
+        try:
+            message = (json.loads(body)["message"] or "").strip() if body is not None else None
+        except (ValueError, KeyError, TypeError, AttributeError):
+            await _send_json(send, 400, {"error": 'Oczekiwano JSON {"message": "..."}'})
+            return
+        if message is None or len(message) > Config.SERVER_MAX_MESSAGE_CHARS:
+            await _send_json(send, 413, {"error": f"Wiadomość dłuższa niż {Config.SERVER_MAX_MESSAGE_CHARS} znaków"})
+            return
+        if not message:
+            await _send_json(send, 400, {"error": "Pusta wiadomość"})
+            return
+        # Sprawdzenie i zajęcie blokady bez oczekiwania (wolna blokada jest zajmowana od razu) - przed
+        # kolejką do slotów, więc druga wiadomość do tej samej sesji dostaje 409 i nie zajmuje slotu
+        if session.busy:
+            await _send_json(send, 409, {"error": "Poprzednia odpowiedź w tej sesji jeszcze trwa"})
+            return
+        await session.lock.acquire()
+
+        try:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), Config.SERVER_QUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"DEBUG: Server busy ({self._active} active responses), rejecting request")
+                await _send_json(send, 503, {"error": "Serwer jest przeciążony, spróbuj za chwilę"},
+                                 {"retry-after": str(Config.SERVER_QUEUE_TIMEOUT)})
+                return
+
+            self._active += 1
+            try:
+                await self._stream_response(session, session_id, message, receive, send)
+            finally:
+                self._active -= 1
+                self._slots.release()
+        finally:
+            session.lock.release()
+            session.touch()
+
+    async def _stream_response(self, session: Session, session_id: str, message: str, receive, send):
+        """Fragmenty odpowiedzi agenta jako kolejne części body (chunked); przerwanie przy rozłączeniu klienta"""
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        stream = session.agent.aprocess_query_stream(message)
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"cache-control", b"no-cache"),
+                            (b"x-session-id", session_id.encode())]
+            })
+            async for chunk in stream:
+                if disconnected.done():
+                    print("DEBUG: Client disconnected, response stopped")
+                    return
+                await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            disconnected.cancel()
+            # Zamknięcie generatora zapisuje dotychczasową odpowiedź w pamięci sesji
+            await stream.aclose()
+
+    def stats(self) -> dict:
+        agent = self.sessions.agent
+        return {
+            "status": "ok",
+            **self.sessions.stats(),
+            "active_responses": self._active,
+            "routing": agent.get_routing_stats(),
+            "prefetch": dict(agent.prefetcher.stats),
+            "rate_limits": get_rate_limit_stats()
+        }
+
+
+async def _read_body(receive, limit: int) -> Optional[bytes]:
+    """Body zapytania; None gdy przekracza limit bajtów"""
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return b""
+        body += message.get("body", b"")
+        if len(body) > limit:
+            return None
+        if not message.get("more_body"):
+            return body
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _send_json(send, status: int, payload, headers: Optional[dict] = None):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+    raw_headers = [(b"content-type", b"application/json; charset=utf-8")]
+    raw_headers += [(name.encode(), value.encode()) for name, value in (headers or {}).items()]
+    await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+app = TravelAgentServer()
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("server:app", host="0.0.0.0", port=8000)
@@ -0,0 +1,236 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Tuple
+
+from config import Config
+
+
+class StoredHistory(NamedTuple):
+    summary: str
+    summarized_turns: int  # liczba pierwszych tur zawartych w podsumowaniu
+    turns: List[Tuple[str, str]]  # tury po podsumowanych (użytkownik, agent), od najstarszej
+
+
+class SessionStore(ABC):
+    """Trwały zapis rozmów: tury tylko dopisywane (append-only), podsumowanie starszych tur
+    i stan podróży nadpisywane. Implementacje muszą być bezpieczne dla wątków
+    (podsumowania zapisywane są z puli w tle)"""
+
+    @abstractmethod
+    def load_history(self, session_id: str) -> Optional[StoredHistory]:
+        """Podsumowanie i niepodsumowane tury; None gdy sesji nie ma"""
+
+    @abstractmethod
+    def load_state(self, session_id: str) -> Optional[dict]:
+        """Zapisany stan podróży (TripState.model_dump()) lub None"""
+
+    @abstractmethod
+    def exists(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def append_turn(self, session_id: str, user_input: str, response: str):
+        pass
+
+    @abstractmethod
+    def save_summary(self, session_id: str, summary: str, summarized_turns: int):
+        pass
+
+    @abstractmethod
+    def save_state(self, session_id: str, state: dict):
+        pass
+
+    @abstractmethod
+    def delete(self, session_id: str):
+        pass
+
+    @abstractmethod
+    def purge_expired(self, max_idle: float = Config.SESSION_STORE_TTL) -> int:
+        """Usuwa sesje nieaktywne dłużej niż max_idle sekund, zwraca ich liczbę"""
+
+
+class InMemorySessionStore(SessionStore):
+    """Rozmowy w pamięci procesu - giną po restarcie (tryb CLI, testy).
+    Trzyma tylko niepodsumowane tury, a rozmowy nieaktywne dłużej niż ttl lub ponad max_sessions
+    (najdawniej aktywne) usuwa przy zakładaniu nowej - także bez okresowego purge_expired (CLI)"""
+
+    def __init__(self, ttl: float = Config.SESSION_STORE_MEMORY_TTL,
+                 max_sessions: int = Config.SESSION_STORE_MEMORY_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, dict]" = OrderedDict()  # od najdawniej aktywnej
+        self._lock = threading.Lock()
+
+    def load_history(self, session_id: str) -> Optional[StoredHistory]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            return StoredHistory(session["summary"], session["summarized_turns"], list(session["turns"]))
+
+    def load_state(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session["state"]) if session and session["state"] is not None else None
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._sessions
+
+    def append_turn(self, session_id: str, user_input: str, response: str):
+        with self._lock:
+            self._session(session_id)["turns"].append((user_input, response))
+
+    def save_summary(self, session_id: str, summary: str, summarized_turns: int):
+        with self._lock:
+            session = self._session(session_id)
+            # Tury zawarte w podsumowaniu nie są już potrzebne
+            del session["turns"][:summarized_turns - session["summarized_turns"]]
+            session["summary"] = summary
+            session["summarized_turns"] = summarized_turns
+
+    def save_state(self, session_id: str, state: dict):
+        with self._lock:
+            self._session(session_id)["state"] = dict(state)
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def purge_expired(self, max_idle: float = Config.SESSION_STORE_TTL) -> int:
+        with self._lock:
+            return self._drop_idle(time.time() - min(max_idle, self.ttl))
+
+    def _session(self, session_id: str) -> dict:
+        now = time.time()
+        session = self._sessions.get(session_id)
+        if session is None:
+            self._drop_idle(now - self.ttl)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            session = self._sessions[session_id] = {"summary": "", "summarized_turns": 0, "turns": [], "state": None}
+        else:
+            self._sessions.move_to_end(session_id)
+        session["updated_at"] = now
+        return session
+
+    def _drop_idle(self, expired_before: float) -> int:
+        dropped = 0
+        while self._sessions and next(iter(self._sessions.values()))["updated_at"] < expired_before:
+            self._sessions.popitem(last=False)
+            dropped += 1
+        return dropped
+
+
+class SQLiteSessionStore(SessionStore):
+    """Rozmowy w lokalnym pliku SQLite - przetrwają restart i mogą być współdzielone przez procesy (workerów)"""
+
+    def __init__(self, path: str = Config.SESSION_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                summary TEXT NOT NULL DEFAULT '',
+                summarized_turns INTEGER NOT NULL DEFAULT 0,
+                state TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS turns (
+                session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                user_input TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (session_id, seq)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+
+    def load_history(self, session_id: str) -> Optional[StoredHistory]:
+        with self._lock:
+            row = self._conn.execute("SELECT summary, summarized_turns FROM sessions WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+            if row is None:
+                return None
+            summary, summarized_turns = row
+            turns = self._conn.execute(
+                "SELECT user_input, response FROM turns WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, summarized_turns)
+            ).fetchall()
+        return StoredHistory(summary, summarized_turns, [tuple(turn) for turn in turns])
+
+    def load_state(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone() is not None
+
+    def append_turn(self, session_id: str, user_input: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._touch(session_id, now)
+            self._conn.execute(
+                "INSERT INTO turns (session_id, seq, user_input, response, created_at) "
+                "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ?, ? FROM turns WHERE session_id = ?",
+                (session_id, user_input, response, now, session_id)
+            )
+
+    def save_summary(self, session_id: str, summary: str, summarized_turns: int):
+        with self._lock:
+            self._touch(session_id, time.time())
+            self._conn.execute("UPDATE sessions SET summary = ?, summarized_turns = ? WHERE session_id = ?",
+                               (summary, summarized_turns, session_id))
+
+    def save_state(self, session_id: str, state: dict):
+        with self._lock:
+            self._touch(session_id, time.time())
+            self._conn.execute("UPDATE sessions SET state = ? WHERE session_id = ?", (json.dumps(state), session_id))
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def purge_expired(self, max_idle: float = Config.SESSION_STORE_TTL) -> int:
+        expired_before = time.time() - max_idle
+        with self._lock:
+            self._conn.execute("DELETE FROM turns WHERE session_id IN (SELECT session_id FROM sessions WHERE updated_at < ?)",
+                               (expired_before,))
+            return self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (expired_before,)).rowcount
+
+    def _touch(self, session_id: str, now: float):
+        self._conn.execute(
+            "INSERT INTO sessions (session_id, updated_at) VALUES (?, ?) "
+            "ON CONFLICT(session_id) DO UPDATE SET updated_at = excluded.updated_at",
+            (session_id, now)
+        )
+
+
+_session_store: Optional[SessionStore] = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Wspólny magazyn rozmów (Config.SESSION_STORE: 'memory' lub 'sqlite')"""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = SQLiteSessionStore() if Config.SESSION_STORE == "sqlite" else InMemorySessionStore()
+    return _session_store
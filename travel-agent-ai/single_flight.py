@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from collections import Counter
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Łączenie identycznych wywołań w locie: równoległe wywołania z tym samym kluczem
+    czekają na wynik pierwszego zamiast wysyłać własne zapytanie do API"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self._acalls: Dict[Tuple[int, Hashable], asyncio.Future] = {}
+        self.stats = Counter()
+    
+    def do(self, key: Hashable, call: Callable[[], T]) -> T:
+        """Wywołuje call() albo dołącza do trwającego wywołania z tym samym kluczem"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        
+        if not leader:
+            self.stats["shared"] += 1
+            print(f"DEBUG: Joining in-flight call {key}")
+            return future.result()
+        
+        self.stats["leader"] += 1
+        try:
+            result = call()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+    
+    async def ado(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> T:
+        """Asynchroniczna wersja do() - wywołania łączone w obrębie jednej pętli zdarzeń"""
+        loop = asyncio.get_running_loop()
+        flight_key = (id(loop), key)
+        future = self._acalls.get(flight_key)
+        if future is not None:
+            self.stats["shared"] += 1
+            print(f"DEBUG: Joining in-flight call {key}")
+            # shield - anulowanie jednego czekającego nie przerywa wywołania pozostałym
+            return await asyncio.shield(future)
+        
+        future = loop.create_future()
+        self._acalls[flight_key] = future
+        self.stats["leader"] += 1
+        try:
+            result = await call()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # oznacz jako odebrany, gdy nikt inny nie czekał
+            raise
+        finally:
+            self._acalls.pop(flight_key, None)
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> SingleFlight:
+    """Wspólna warstwa single-flight dla wszystkich klientów Booking API"""
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
@@ -0,0 +1,150 @@
+from typing import AsyncIterable, Iterable, Optional, Sequence
+
+from config import Config
+
+try:
+    import ijson
+except ImportError:  # opcjonalna zależność - bez niej odpowiedź jest parsowana w całości (response.json())
+    ijson = None
+
+_CONTAINER_START = ("start_map", "start_array")
+_CONTAINER_END = ("end_map", "end_array")
+
+
+def streaming_available() -> bool:
+    return Config.STREAM_PARSING and ijson is not None
+
+
+class SearchPayloadParser:
+    """Przyrostowy parser odpowiedzi searchFlights / searchHotels.
+    Z bajtów przychodzących fragmentami buduje tylko status, komunikat i pierwsze `limit` elementów
+    listy data.<items_key> - pozostałe elementy i reszta danych nie są w ogóle tworzone.
+    fields - ścieżki pól elementu w notacji ijson ("segments.item.legs.item.arrivalTime"); podane pola
+    (z przodkami) są budowane, pozostałe pomijane. Bez fields - cały element.
+    Wynik ma ten sam kształt co response.json(), więc dalsze przetwarzanie się nie zmienia"""
+
+    def __init__(self, items_key: str, limit: int = Config.RESULT_ITEMS_LIMIT, fields: Optional[Sequence[str]] = None):
+        self.items_key = items_key
+        self.limit = limit
+        self.fields = tuple(fields) if fields else None
+        self._ancestors = {field.rsplit(".", i)[0] for field in self.fields or () for i in range(1, field.count(".") + 1)}
+        self._ancestors.add("")
+        self._relevant = {}
+        self.status = None
+        self.message = None
+        self.items = []
+        self.done = False
+        self._item_prefix = f"data.{items_key}.item"
+        self._builder = None
+        self._depth = 0
+        self._events = ijson.sendable_list()
+        self._coro = ijson.parse_coro(self._events, use_float=True)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Przetwarza kolejny fragment; True gdy zebrano już `limit` elementów i można przestać czytać"""
+        if not self.done:
+            self._coro.send(chunk)
+            self._consume()
+        return self.done
+
+    def close(self):
+        """Koniec danych - sprawdza kompletność JSON, jeśli odczytano całą odpowiedź"""
+        if not self.done:
+            self._coro.close()
+            self._consume()
+
+    def result(self) -> dict:
+        payload = {"data": {self.items_key: self.items}}
+        if self.status is not None:
+            payload["status"] = self.status
+        if self.message is not None:
+            payload["message"] = self.message
+        return payload
+
+    def _is_relevant(self, path: str) -> bool:
+        """Czy ścieżka (względem elementu) to wybrane pole, jego część lub przodek"""
+        relevant = self._relevant.get(path)
+        if relevant is None:
+            relevant = path in self._ancestors or any(path == field or path.startswith(field + ".") for field in self.fields)
+            self._relevant[path] = relevant
+        return relevant
+
+    def _item_event(self, prefix: str, event: str, value) -> bool:
+        if self.fields is None:
+            return True
+        path = prefix[len(self._item_prefix) + 1:]
+        if event == "map_key":
+            path = f"{path}.{value}" if path else value
+        return self._is_relevant(path)
+
+    def _consume(self):
+        for prefix, event, value in self._events:
+            if self._builder is not None:
+                if self._item_event(prefix, event, value):
+                    self._builder.event(event, value)
+                if event in _CONTAINER_START:
+                    self._depth += 1
+                elif event in _CONTAINER_END:
+                    self._depth -= 1
+                if self._depth == 0:
+                    self.items.append(self._builder.value)
+                    self._builder = None
+                    if len(self.items) >= self.limit:
+                        self.done = True
+                        break
+            elif prefix == self._item_prefix and event in _CONTAINER_START:
+                self._builder = ijson.ObjectBuilder()
+                self._builder.event(event, value)
+                self._depth = 1
+            elif prefix == "status" and event == "boolean":
+                self.status = value
+            elif prefix == "message" and event == "string":
+                self.message = value
+        del self._events[:]
+
+
+def parse_streamed(chunks: Iterable[bytes], items_key: str, limit: int = Config.RESULT_ITEMS_LIMIT,
+                   fields: Optional[Sequence[str]] = None) -> dict:
+    """Parsuje odpowiedź czytaną fragmentami - przestaje parsować po zebraniu `limit` elementów.
+    Resztę odpowiedzi do Config.STREAM_DRAIN_MAX_BYTES doczytuje bez parsowania - odczytana do końca
+    odpowiedź zwalnia połączenie keep-alive do puli, przerwana je zamyka"""
+    parser = SearchPayloadParser(items_key, limit, fields)
+    chunks = iter(chunks)
+    for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    parser.close()
+    drained = 0
+    if parser.done:
+        for chunk in chunks:
+            drained += len(chunk)
+            if drained > Config.STREAM_DRAIN_MAX_BYTES:
+                break
+    _log_cutoff(parser, drained)
+    return parser.result()
+
+
+async def aparse_streamed(chunks: AsyncIterable[bytes], items_key: str, limit: int = Config.RESULT_ITEMS_LIMIT,
+                          fields: Optional[Sequence[str]] = None) -> dict:
+    """Asynchroniczna wersja parse_streamed"""
+    parser = SearchPayloadParser(items_key, limit, fields)
+    chunks = chunks.__aiter__()
+    async for chunk in chunks:
+        if parser.feed(chunk):
+            break
+    parser.close()
+    drained = 0
+    if parser.done:
+        async for chunk in chunks:
+            drained += len(chunk)
+            if drained > Config.STREAM_DRAIN_MAX_BYTES:
+                break
+    _log_cutoff(parser, drained)
+    return parser.result()
+
+
+def _log_cutoff(parser: SearchPayloadParser, drained: int):
+    if parser.done:
+        kept = "connection kept" if drained <= Config.STREAM_DRAIN_MAX_BYTES else "connection closed"
+        print(f"DEBUG: Streamed parse stopped after {len(parser.items)} {parser.items_key}, "
+              f"drained {drained} bytes ({kept})")
@@ -0,0 +1,31 @@
+import unittest
+
+from intent_classifier import IntentClassifier
+
+
+class IntentClassifierTest(unittest.TestCase):
+    def setUp(self):
+        self.classifier = IntentClassifier()
+
+    def test_single_intent_keywords(self):
+        self.assertEqual(self.classifier.classify("Szukam lotów z Warszawy do Rzymu").intent, "LOTY")
+        self.assertEqual(self.classifier.classify("Hotel w Paryżu na weekend").intent, "HOTELE")
+        self.assertEqual(self.classifier.classify("Co warto zobaczyć w Barcelonie?").intent, "ATRAKCJE")
+
+    def test_trip_needs_explicit_cue(self):
+        for query in ["Lot i hotel do Barcelony w maju", "Szukam lotu do Rzymu z noclegiem",
+                      "Wyjazd do Paryża - samolot i hotel na 3 noce"]:
+            with self.subTest(query=query):
+                self.assertEqual(self.classifier.classify(query).intent, "PODROZ")
+
+    def test_airport_as_location_is_not_a_trip(self):
+        for query in ["Hotel blisko lotniska w Paryżu", "Transfer z lotniska do hotelu",
+                      "Nocleg niedaleko lotniska Chopina"]:
+            with self.subTest(query=query):
+                decision = self.classifier.classify(query)
+                self.assertNotEqual(decision.intent, "PODROZ")
+                self.assertNotEqual(decision.intent, "LOTY")
+
+
+if __name__ == "__main__":
+    unittest.main()
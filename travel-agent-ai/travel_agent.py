@@ -1,13 +1,35 @@
 from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
-from langchain.memory import ConversationBufferMemory
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import RunnableLambda
+from pydantic import ValidationError
+import asyncio
+import copy
+import json
+import threading
+import uuid
 from datetime import datetime, timedelta
+from collections import Counter
+from typing import Optional, Tuple, Union, Iterator, AsyncIterator
 
-from models import FlightQuery, HotelQuery
+from models import FlightQuery, HotelQuery, TripQuery, RoutedRequest, TripState
 from config import Config
-from flight_api import FlightAPI
-from hotel_api import HotelAPI
+from concurrency import agather_with_deadline, iterate_sync, run_sync
+from flight_api import AsyncFlightAPI
+from hotel_api import AsyncHotelAPI
+from intent_classifier import IntentClassifier
+from result_renderer import render_results, compact_results, compact_params, render_fare_calendar, render_trip
+from conversation_memory import ConversationMemory, NO_HISTORY, estimate_tokens
+from attractions_cache import get_attractions_cache, guide_destination, period_label, travel_period
+from prefetch import get_prefetcher
+from session_store import get_session_store
+
+# Kubełki rate limitera używane przez wyszukiwania w tle (patrz Prefetcher.has_budget)
+FLIGHT_PREFETCH_BUCKETS = ("searchDestination", "searchFlights")
+HOTEL_PREFETCH_BUCKETS = ("searchDestination", "searchHotels")
+# Miasto -> lotnisko dla zapytań w tle (odwrotność Config.AIRPORT_CITIES)
+CITY_AIRPORTS = {city.lower(): airport for airport, city in Config.AIRPORT_CITIES.items()}
 
 class TravelAgent:
     def __init__(self, claude_api_key: str, booking_api_key: str):
@@ -16,317 +38,849 @@ class TravelAgent:
             model=Config.CLAUDE_MODEL,
             temperature=Config.CLAUDE_TEMPERATURE
         )
+        # Osobny klient (model + timeout) dla każdego etapu - szybki model dla routingu i ekstrakcji
+        self.stage_llms = {
+            stage: ChatAnthropic(
+                api_key=claude_api_key,
+                model=model,
+                temperature=Config.CLAUDE_TEMPERATURE,
+                timeout=Config.STAGE_TIMEOUTS[stage]
+            )
+            for stage, model in Config.STAGE_MODELS.items()
+        }
         
-        # API clients
-        self.flight_api = FlightAPI(booking_api_key)
-        self.hotel_api = HotelAPI(booking_api_key)
+        # API clients (httpx) - synchroniczne process_query_stream też korzysta ze ścieżki asynchronicznej
+        self.flight_api = AsyncFlightAPI(booking_api_key)
+        self.hotel_api = AsyncHotelAPI(booking_api_key)
         
         # Parsery
         self.flight_parser = PydanticOutputParser(pydantic_object=FlightQuery)
         self.hotel_parser = PydanticOutputParser(pydantic_object=HotelQuery)
+        self.trip_parser = PydanticOutputParser(pydantic_object=TripQuery)
+        # Rozpoznanie typu + parametry w jednym wywołaniu (tool calling)
+        self.routing_llm = self.stage_llms["routing"].with_structured_output(RoutedRequest)
         
-        # Memory - przechowuje historię rozmowy
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            input_key="query",
-            output_key="response"
-        )
+        # Szybka ścieżka rozpoznawania intencji (bez wywołania LLM)
+        self.intent_classifier = IntentClassifier(threshold=Config.INTENT_CONFIDENCE_THRESHOLD)
+        self.routing_stats = Counter()
+        self.escalations = Counter()  # etapy powtórzone na głównym modelu
+        self.format_stats = Counter()  # tokeny danych wysyłanych do formatowania (tryb 'rich')
+        
+        # Memory - ostatnie tury dosłownie, starsze w podsumowaniu (Config.MEMORY_*), zapisywane w magazynie sesji
+        self.session_store = get_session_store()
+        self.session_id = uuid.uuid4().hex
+        self.memory = ConversationMemory(summarizer=self._summarize_history, store=self.session_store, session_id=self.session_id)
+        # Stan podróży (miejsca, daty, osoby, budżet) - kontekst dla promptów ekstrakcji
+        self.trip_state = TripState()
+        # Przewodniki po atrakcjach - wspólne dla sesji (Config.ATTRACTIONS_*)
+        self.attractions_cache = get_attractions_cache()
+        # Wyszukiwania w tle dla spodziewanego następnego pytania (Config.PREFETCH_*)
+        self.prefetcher = get_prefetcher()
+        
+        # Łańcuchy budowane raz - statyczne instrukcje w blokach systemowych (cache promptów)
+        self.prompt_prefixes = {}  # szacowany rozmiar statycznego prefiksu każdego promptu (patrz _register_prompt_prefix)
+        self.routing_chain = self._build_routing_chain()
+        self.classification_chain = self._build_classification_chain()
+        self.flight_extraction_chain = self._build_flight_extraction_chain()
+        self.hotel_extraction_chain = self._build_hotel_extraction_chain()
+        self.trip_extraction_chain = self._build_trip_extraction_chain()
+        self.attractions_chain = self._build_attractions_chain()
+        self.attractions_guide_chain = self._build_attractions_guide_chain()
+        self.attractions_personalization_chain = self._build_attractions_personalization_chain()
+        self.format_chain = self._build_format_chain()
+        self.summary_chain = self._build_summary_chain()
     
     def process_query(self, user_input: str) -> str:
         """Główna metoda przetwarzająca zapytania użytkownika"""
+        return "".join(self.process_query_stream(user_input))
+    
+    def process_query_stream(self, user_input: str) -> Iterator[str]:
+        """Przetwarza zapytanie i zwraca odpowiedź fragmentami (tokeny LLM) w miarę generowania.
+        Nakładka na aprocess_query_stream wykonywana na prywatnej pętli zdarzeń w tle (jedna implementacja)"""
+        return iterate_sync(self.aprocess_query_stream(user_input))
+    
+    async def aprocess_query(self, user_input: str) -> str:
+        """Asynchroniczna wersja process_query (np. serwer)"""
+        return "".join([chunk async for chunk in self.aprocess_query_stream(user_input)])
+    
+    async def aprocess_query_stream(self, user_input: str) -> AsyncIterator[str]:
+        """Przetwarza zapytanie i zwraca odpowiedź fragmentami (ainvoke/astream + klienci httpx)"""
+        response_parts = []
+        query_type = None
         try:
-            # Pobierz historię rozmowy
-            chat_history = self.memory.chat_memory.messages
-            history_text = self._format_chat_history(chat_history)
-
-             # DODAJ: Stwórz pełny kontekst z current query
-            full_context = history_text
-            if history_text and history_text != "Brak poprzednich rozmów.":
-                full_context += f"\nUżytkownik (AKTUALNE): {user_input}"
-            else:
-                full_context = f"Użytkownik: {user_input}"
+            # Pamięć wczytywana z magazynu sesji przy pierwszym użyciu - poza pętlą zdarzeń
+            chat_history, history_text, full_context = await asyncio.to_thread(self._build_context, user_input)
             
-            # KROK 1: LLM rozpoznaje typ i parsuje parametry z kontekstem
-            analysis_prompt = ChatPromptTemplate.from_template("""
-                Przeanalizuj zapytanie użytkownika i określ czy dotyczy LOTÓW czy HOTELI czy ATRAKCJI.
-                Uwzględnij kontekst poprzednich rozmów. 
-
-                HISTORIA ROZMOWY:
-                {full_context}
-
-                DZISIEJSZA DATA: {today}
-
-                WSKAZÓWKI ROZPOZNAWANIA:
-                - LOTY: "lot", "lecieć", "samolot", "airline", "lotnisko", "lot do", "bilety lotnicze"
-                - HOTELE: "hotel", "nocleg", "zakwaterowanie", "rezerwacja hotelu", "gdzie spać", "pobyt"
-                - ATRAKCJE: "atrakcje", "co robić", "zwiedzanie", "wycieczki", "co zobaczyć"
-                - KONTEKST: Jeśli wcześniej rozmawialiśmy o konkretnym miejscu/dacie, użyj tych informacji
-
-                ZAAWANSOWANE WSKAZÓWKI KONTEKSTOWE:
-                - Jeśli zapytanie to "Tak", "Nie", "OK" lub podobna krótka odpowiedź, sprawdź ostatnie pytanie Agenta:
-                - Jeśli Agent pytał o loty lub propozycja dotyczyła lotów, uznaj to za LOTY
-                - Jeśli Agent pytał o hotele lub propozycja dotyczyła hoteli, uznaj to za HOTELE
-                - Jeśli Agent pytał o atrakcje lub propozycja dotyczyła atrakcji, uznaj to za ATRAKCJE
-
-                LOGIKA PRIORYTETÓW:
-                1. Jeśli zapytanie to krótka odpowiedź (1-3 słowa), zastosuj ZAAWANSOWANE WSKAZÓWKI KONTEKSTOWE
-                2. Jeśli zapytanie zawiera słowa kluczowe LOTY, uznaj to za LOT
-                3. Jeśli zapytanie zawiera słowa kluczowe HOTELE, uznaj to za HOTEL
-                4. Jeśli zapytanie zawiera słowa kluczowe ATRAKCJE, uznaj to za ATRAKCJE
-                5. Jeśli zapytanie nie jest jasne, sprawdź ostatnie pytanie Agenta w historii
-
-                Odpowiedz TYLKO jednym słowem: "LOTY" lub "HOTELE" lub "ATRAKCJE".
-                """)
-            
-            analysis_chain = analysis_prompt | self.llm
-            query_type = analysis_chain.invoke({
-                "today": datetime.now().strftime('%Y-%m-%d'),
-                "full_context": full_context,
-            }).content.strip().upper()
+            # KROK 1: Rozpoznanie typu - lokalnie gdy to jednoznaczne, w przeciwnym razie przez LLM
+            query_type, parsed_query = await self._adetect_query_type(user_input, chat_history, full_context)
             
             print(f"DEBUG: Detected type: {query_type}")
-     
-
+            
             # Przetwórz zapytanie
             if query_type == "HOTELE":
-                result = self._handle_hotel_request(user_input, history_text)
+                stream = self._ahandle_hotel_request(user_input, history_text, parsed_query)
             elif query_type == "LOTY":
-                result = self._handle_flight_request(user_input, history_text)
-            else: 
-                result = self._handle_attractions_request(user_input, history_text)
+                stream = self._ahandle_flight_request(user_input, history_text, parsed_query)
+            elif query_type == "PODROZ":
+                stream = self._ahandle_trip_request(user_input, history_text, parsed_query)
+            else:
+                stream = self._ahandle_attractions_request(user_input, history_text)
+            
+            async for chunk in stream:
+                response_parts.append(chunk)
+                yield chunk
             
-            # Zapisz interakcję do memory
-            self.memory.save_context(
-                {"query": user_input},
-                {"response": result}
-            )
             print(full_context)
-            return result
             
-                
         except Exception as e:
             print(f"Error processing query: {e}")
             error_msg = f"❌ Błąd podczas przetwarzania: {str(e)}"
-            
-            # Zapisz błąd do memory
-            self.memory.save_context(
-                {"query": user_input},
-                {"response": error_msg}
-            )
-            
-            return error_msg
+            response_parts.append(error_msg)
+            yield error_msg
+        
+        finally:
+            # Zapisz pełną odpowiedź do memory (także po przerwaniu strumienia)
+            await asyncio.to_thread(self._save_turn, user_input, "".join(response_parts), query_type)
     
-    def _handle_flight_request(self, user_input: str, full_context: str) -> str:
-        """Obsługa zapytań o loty z kontekstem"""
+    def _save_turn(self, user_input: str, response: str, query_type: Optional[str]):
+        """Tura do pamięci rozmowy, stan podróży do magazynu sesji.
+        Wywoływane w finally strumienia - błąd magazynu (np. zablokowana baza) jest tylko logowany,
+        tura zostaje w pamięci procesu"""
+        self.trip_state.record_turn(query_type, response)
         try:
-            # Parse parametrów lotu z uwzględnieniem historii
-            flight_prompt = ChatPromptTemplate.from_template("""
-            Wyciągnij parametry lotu z zapytania użytkownika.
-            UWZGLĘDNIJ KONTEKST z poprzednich rozmów - jeśli użytkownik wcześniej mówił o konkretnym miejscu lub dacie, użyj tych informacji.
-            
-            HISTORIA ROZMOWY:
-            {full_context}
-            
-            AKTUALNE ZAPYTANIE: "{query}"
-            DZISIEJSZA DATA: {today}
-            
-            KODY IATA: WAW=Warszawa, CDG=Paryż, LHR=Londyn, BER=Berlin, FCO=Rzym, MAD=Madryt, BCN=Barcelona, AMS=Amsterdam, VIE=Wiedeń, PRG=Praga, BUD=Budapeszt, KRK=Kraków, GDN=Gdańsk, WRO=Wrocław
-            
-            REGUŁY:
-            - Origin domyślnie: "WAW" 
+            self.memory.save_context(user_input, response)
+            self.session_store.save_state(self.session_id, self.trip_state.model_dump())
+        except Exception as e:
+            print(f"Session store error for session {self.session_id}: {e}")
+    
+    def _build_context(self, user_input: str):
+        """Historia rozmowy: (wiadomości, tekst historii, pełny kontekst z aktualnym zapytaniem)"""
+        # Pobierz historię rozmowy
+        chat_history = self.memory.messages
+        history_text = self.memory.history_text()
+        
+        # Stwórz pełny kontekst z current query
+        full_context = history_text
+        if history_text and history_text != NO_HISTORY:
+            full_context += f"\nUżytkownik (AKTUALNE): {user_input}"
+        else:
+            full_context = f"Użytkownik: {user_input}"
+        return chat_history, history_text, full_context
+    
+    async def _adetect_query_type(self, user_input: str, chat_history, full_context: str) -> Tuple[str, Optional[Union[FlightQuery, HotelQuery, TripQuery]]]:
+        """Rozpoznaje typ zapytania - szybka ścieżka lokalna, LLM tylko dla niejednoznacznych.
+        Zwraca (typ, sparsowane parametry lub None gdy handler ma je wyciągnąć sam)"""
+        fast_intent = self._fast_route(user_input, chat_history)
+        if fast_intent:
+            return fast_intent, None
+        
+        if Config.STRUCTURED_ROUTING:
+            try:
+                routed = await self._aroute_and_extract(user_input, full_context)
+                self.routing_stats["llm"] += 1
+                print(f"DEBUG: Routing structured LLM call | {self._routing_summary()}")
+                return routed.intent, getattr(routed, "query", None)
+            except Exception as e:
+                print(f"Structured routing error, falling back to classic routing: {e}")
+        
+        query_type = await self._aclassify_with_llm(full_context)
+        self.routing_stats["llm"] += 1
+        print(f"DEBUG: Routing LLM fallback | {self._routing_summary()}")
+        return query_type, None
+    
+    def _fast_route(self, user_input: str, chat_history) -> Optional[str]:
+        """Lokalny klasyfikator - zwraca typ zapytania lub None gdy potrzebny LLM"""
+        if not Config.INTENT_FAST_PATH:
+            return None
+        
+        last_agent_message = next((m.content for m in reversed(chat_history) if m.type == "ai"), None)
+        decision = self.intent_classifier.classify(user_input, last_agent_message)
+        
+        if decision.intent:
+            self.routing_stats["fast"] += 1
+            print(f"DEBUG: Routing fast path ({decision.source}, confidence {decision.confidence}) | {self._routing_summary()}")
+        return decision.intent
+    
+    def _prompt_inputs(self, user_input: str, full_context: str, **extra) -> dict:
+        """Wspólne zmienne promptów"""
+        return {
+            "query": user_input,
+            "today": datetime.now().strftime('%Y-%m-%d'),
+            "full_context": full_context,
+            "trip_state": self.trip_state.to_prompt(),
+            **extra
+        }
+    
+    async def _aroute_and_extract(self, user_input: str, full_context: str):
+        """Jedno wywołanie LLM: typ zapytania + wypełniony FlightQuery/HotelQuery/TripQuery"""
+        result = await self.routing_chain.ainvoke(self._prompt_inputs(user_input, full_context))
+        return result.request
+    
+    def _build_routing_chain(self):
+        """Prompt rozpoznania typu z ekstrakcją parametrów (structured output)"""
+        routing_prompt = self._cached_prompt("""
+            Przeanalizuj zapytanie użytkownika, określ czy dotyczy LOTÓW, HOTELI, PODRÓŻY (lot i hotel razem) czy ATRAKCJI
+            i od razu wypełnij parametry wyszukiwania dla lotów, hoteli lub podróży.
+            Uwzględnij stan podróży ustalony we wcześniejszej rozmowie.
+
+            ROZPOZNAWANIE TYPU:
+            - LOTY: "lot", "lecieć", "samolot", "airline", "lotnisko", "lot do", "bilety lotnicze"
+            - HOTELE: "hotel", "nocleg", "zakwaterowanie", "rezerwacja hotelu", "gdzie spać", "pobyt"
+            - PODROZ: lot i nocleg w jednym zapytaniu ("lot i hotel", "wyjazd z noclegiem", "wakacje z przelotem")
+            - ATRAKCJE: "atrakcje", "co robić", "zwiedzanie", "wycieczki", "co zobaczyć"
+            - Krótka odpowiedź ("Tak", "Nie", "OK") - typ zgodny z ostatnim pytaniem/propozycją Agenta
+            - Jeśli zapytanie nie jest jasne, sprawdź ostatnie pytanie Agenta i ostatnie wyszukiwanie w stanie podróży
+
+            PARAMETRY LOTÓW:
+            - KODY IATA: WAW=Warszawa, CDG=Paryż, LHR=Londyn, BER=Berlin, FCO=Rzym, MAD=Madryt, BCN=Barcelona, AMS=Amsterdam, VIE=Wiedeń, PRG=Praga, BUD=Budapeszt, KRK=Kraków, GDN=Gdańsk, WRO=Wrocław
+            - Origin domyślnie: "WAW"
             - "jutro" → następny dzień
             - "para" → adults=2
             - "dzieci X lat" → children="X"
             - "tanio" → budget=800, sort=CHEAPEST
             - "bezpośredni" → stops="0"
+            - "około piątku", "w okolicach", "najtaniej w tym tygodniu" → flexible_days (1-3), departure_date = środek okresu
             - Klasa domyślnie: ECONOMY
-            - KONTEKST: Jeśli w historii była mowa o miejscu docelowym, użyj go jako destination
-            - KONTEKST: Jeśli w historii była mowa o datach, użyj ich jako odniesienie
-            
-            {format_instructions}
-            """)
+
+            PARAMETRY HOTELI:
+            - "jutro" → arrival_date = następny dzień
+            - "weekend" → sobota-niedziela
+            - "na X dni" → departure_date = arrival_date + X dni
+            - "para" → adults=2
+            - "tanio" → price_max=200
+            - Domyślnie: 2 noce jeśli nie podano departure_date
             
-            flight_chain = flight_prompt | self.llm | self.flight_parser
-            query = flight_chain.invoke({
-                "query": user_input,
-                "today": datetime.now().strftime('%Y-%m-%d'),
-                "full_context":   full_context,
-                "format_instructions": self.flight_parser.get_format_instructions()
-            })
+            PARAMETRY PODRÓŻY:
+            - flight jak PARAMETRY LOTÓW; "na X dni" → return_date = departure_date + X dni
+            - city - miasto noclegu (nazwa miasta docelowego lotu, nie kod IATA)
+            - "za X zł", "budżet X na wszystko" → total_budget=X
+            - "hotel do X zł za noc" → hotel_price_max=X
             
-            # Fix dat jeśli potrzeba
-            if not query.departure_date or query.departure_date == "jutro":
-                query.departure_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+            KONTEKST: Jeśli stan podróży zawiera miejsce lub daty, użyj ich jako destination i odniesienia dla dat.
+            """, """
+            STAN PODRÓŻY:
+            {trip_state}
+
+            AKTUALNE ZAPYTANIE: "{query}"
+            DZISIEJSZA DATA: {today}
+            """)
+        # Schemat narzędzia (structured output) poprzedza blok systemowy i należy do cache'owanego prefiksu
+        self._register_prompt_prefix("routing", routing_prompt, tools=(RoutedRequest,))
+        
+        return self._with_escalation(
+            "routing",
+            routing_prompt | self.routing_llm,
+            routing_prompt | self.llm.with_structured_output(RoutedRequest)
+        )
+    
+    async def _aclassify_with_llm(self, full_context: str) -> str:
+        """Rozpoznanie typu zapytania przez LLM"""
+        result = await self.classification_chain.ainvoke(self._prompt_inputs("", full_context))
+        return result.strip().upper()
+    
+    def _build_classification_chain(self):
+        """Prompt rozpoznania typu zapytania (jedno słowo)"""
+        analysis_prompt = self._cached_prompt("""
+            Przeanalizuj zapytanie użytkownika i określ czy dotyczy LOTÓW czy HOTELI czy PODRÓŻY (lot i hotel razem) czy ATRAKCJI.
+            Uwzględnij kontekst poprzednich rozmów. 
+
+            WSKAZÓWKI ROZPOZNAWANIA:
+            - LOTY: "lot", "lecieć", "samolot", "airline", "lotnisko", "lot do", "bilety lotnicze"
+            - HOTELE: "hotel", "nocleg", "zakwaterowanie", "rezerwacja hotelu", "gdzie spać", "pobyt"
+            - PODROZ: lot i nocleg w jednym zapytaniu ("lot i hotel", "wyjazd z noclegiem", "wakacje z przelotem")
+            - ATRAKCJE: "atrakcje", "co robić", "zwiedzanie", "wycieczki", "co zobaczyć"
+            - KONTEKST: Jeśli wcześniej rozmawialiśmy o konkretnym miejscu/dacie, użyj tych informacji
+
+            ZAAWANSOWANE WSKAZÓWKI KONTEKSTOWE:
+            - Jeśli zapytanie to "Tak", "Nie", "OK" lub podobna krótka odpowiedź, sprawdź ostatnie pytanie Agenta:
+            - Jeśli Agent pytał o loty lub propozycja dotyczyła lotów, uznaj to za LOTY
+            - Jeśli Agent pytał o hotele lub propozycja dotyczyła hoteli, uznaj to za HOTELE
+            - Jeśli Agent pytał o atrakcje lub propozycja dotyczyła atrakcji, uznaj to za ATRAKCJE
+
+            LOGIKA PRIORYTETÓW:
+            1. Jeśli zapytanie to krótka odpowiedź (1-3 słowa), zastosuj ZAAWANSOWANE WSKAZÓWKI KONTEKSTOWE
+            2. Jeśli zapytanie zawiera słowa kluczowe LOTY, uznaj to za LOT
+            3. Jeśli zapytanie zawiera słowa kluczowe HOTELE, uznaj to za HOTEL
+            4. Jeśli zapytanie zawiera słowa kluczowe ATRAKCJE, uznaj to za ATRAKCJE
+            5. Jeśli zapytanie nie jest jasne, sprawdź ostatnie pytanie Agenta w historii
+
+            Odpowiedz TYLKO jednym słowem: "LOTY" lub "HOTELE" lub "PODROZ" lub "ATRAKCJE".
+            """, """
+            HISTORIA ROZMOWY:
+            {full_context}
+
+            DZISIEJSZA DATA: {today}
+            """)
+        
+        self._register_prompt_prefix("classification", analysis_prompt, stage="routing")
+        return analysis_prompt | self.stage_llms["routing"] | StrOutputParser()
+    
+    def _routing_summary(self) -> str:
+        stats = self.get_routing_stats()
+        return f"fast={stats['fast']} llm={stats['llm']} ({stats['fast_ratio']:.0%} bez LLM)"
+    
+    def get_routing_stats(self) -> dict:
+        """Statystyki ścieżek rozpoznawania intencji (lokalna vs LLM)"""
+        fast = self.routing_stats["fast"]
+        llm = self.routing_stats["llm"]
+        total = fast + llm
+        return {
+            "fast": fast,
+            "llm": llm,
+            "fast_ratio": fast / total if total else 0.0,
+            "escalations": dict(self.escalations)
+        }
+    
+    async def _ahandle_flight_request(self, user_input: str, full_context: str, query: Optional[FlightQuery] = None) -> AsyncIterator[str]:
+        """Obsługa zapytań o loty z kontekstem - zwraca odpowiedź fragmentami"""
+        try:
+            if query is None:
+                query = await self._aextract_flight_query(user_input, full_context)
             
-            if not query.destination:
-                return "❌ Nie rozpoznałem celu podróży. Przykład: 'lot do Paryża jutro'"
+            error = self._prepare_flight_query(query)
+            if error:
+                yield error
+                return
             
-            print(f"DEBUG: Flight {query.origin} → {query.destination} na {query.departure_date}")
+            # Elastyczna data - kalendarz cen, a szczegóły dla najtańszego dnia (wynik już w cache)
+            if query.flexible_days:
+                fare_days = await self.flight_api.search_flexible_dates(query)
+                if fare_days:
+                    yield render_fare_calendar(query, fare_days) + "\n\n"
+                    query = self._best_fare_query(query, fare_days)
             
             # Szukaj lotów
-            api_data = self.flight_api.search_flights(query)
+            api_data = await self.flight_api.search_flights(query)
             
-            if not api_data or not api_data.get('data', {}).get('flightOffers'):
-                return f"❌ Brak lotów {query.origin} → {query.destination} na {query.departure_date}"
+            simplified_flights = self._simplify_flight_results(api_data)
+            if not simplified_flights:
+                yield f"❌ Brak lotów {query.origin} → {query.destination} na {query.departure_date}"
+                return
             
-            # Wyciągnij tylko potrzebne dane żeby zmniejszyć tokeny
-            simplified_flights = self._extract_flight_essentials(api_data.get('data', {}).get('flightOffers', []))
-            
-            print(f"DEBUG: Simplified {len(simplified_flights)} flight offers")
+            # Odpowiedź proponuje hotele - wyszukiwanie w tle, w trakcie formatowania
+            hotel_query = self._follow_up_hotel_query(query)
+            if hotel_query:
+                self.prefetcher.asubmit(("HOTELE", compact_params(hotel_query)),
+                                        lambda: self.hotel_api.search_hotels_pages(hotel_query), HOTEL_PREFETCH_BUCKETS)
             
             # Formatuj wyniki - przekaż tylko essentials
-            return self._format_results("LOTY", user_input, query, simplified_flights, full_context)
+            async for chunk in self._aformat_results("LOTY", user_input, query, simplified_flights, full_context):
+                yield chunk
             
         except Exception as e:
             print(f"Flight error: {e}")
-            return f"❌ Błąd wyszukiwania lotów: {str(e)}"
+            yield f"❌ Błąd wyszukiwania lotów: {str(e)}"
+    
+    def _prepare_flight_query(self, query: FlightQuery) -> Optional[str]:
+        """Uzupełnia daty; zwraca komunikat błędu gdy zapytania nie da się wykonać"""
+        # Fix dat jeśli potrzeba
+        if not query.departure_date or query.departure_date == "jutro":
+            query.departure_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        if not query.destination:
+            return "❌ Nie rozpoznałem celu podróży. Przykład: 'lot do Paryża jutro'"
+        
+        print(f"DEBUG: Flight {query.origin} → {query.destination} na {query.departure_date}")
+        self.trip_state.update_from_flight(query)
+        return None
+    
+    def _best_fare_query(self, query: FlightQuery, fare_days: list) -> FlightQuery:
+        """Zapytanie dla najtańszego dnia z kalendarza cen (bez zmian, gdy żaden dzień nie ma ofert)"""
+        priced = [day for day in fare_days if day.get('cheapest')]
+        if not priced:
+            return query
+        best = min(priced, key=lambda day: day['cheapest'])
+        print(f"DEBUG: Cheapest day in ±{min(query.flexible_days, Config.FLEX_DATE_MAX_DAYS)} window: {best['date']}")
+        best_query = query.model_copy(update={
+            "departure_date": best['date'],
+            "return_date": best['return_date'],
+            "flexible_days": 0
+        })
+        self.trip_state.update_from_flight(best_query)
+        return best_query
+    
+    def _follow_up_flight_query(self, query: HotelQuery) -> Optional[FlightQuery]:
+        """Lot na czas pobytu, o który użytkownik najpewniej zapyta po hotelach (None - prefetch wyłączony lub nieznane lotnisko)"""
+        destination = CITY_AIRPORTS.get(query.destination.strip().lower())
+        if not Config.PREFETCH or not destination:
+            return None
+        return FlightQuery(
+            origin=self.trip_state.origin or "WAW",
+            destination=destination,
+            departure_date=query.arrival_date,
+            return_date=query.departure_date,
+            adults=query.adults,
+            children=query.children_age,
+            currency_code=query.currency_code
+        )
+    
+    def _simplify_flight_results(self, api_data: Optional[dict]) -> list:
+        """Wyciąga tylko potrzebne dane żeby zmniejszyć tokeny (pusta lista gdy brak ofert)"""
+        if not api_data or not api_data.get('data', {}).get('flightOffers'):
+            return []
+        
+        simplified_flights = self._extract_flight_essentials(api_data.get('data', {}).get('flightOffers', []))
+        print(f"DEBUG: Simplified {len(simplified_flights)} flight offers")
+        return simplified_flights
+    
+    async def _aextract_flight_query(self, user_input: str, full_context: str) -> FlightQuery:
+        """Parse parametrów lotu przez LLM"""
+        return await self.flight_extraction_chain.ainvoke(self._prompt_inputs(user_input, full_context))
     
-    def _handle_hotel_request(self, user_input: str,  full_context: str) -> str:
-        """Obsługa zapytań o hotele z kontekstem"""
+    def _build_flight_extraction_chain(self):
+        # Parse parametrów lotu z uwzględnieniem stanu podróży
+        flight_prompt = self._extraction_prompt(
+            "flight_extraction", "Wyciągnij parametry lotu (REGUŁY - LOT) i zwróć JSON w FORMACIE - LOT.")
+        
+        return self._with_escalation(
+            "flight_extraction",
+            flight_prompt | self.stage_llms["flight_extraction"] | self.flight_parser,
+            flight_prompt | self.llm | self.flight_parser
+        )
+    
+    async def _ahandle_hotel_request(self, user_input: str, full_context: str, query: Optional[HotelQuery] = None) -> AsyncIterator[str]:
+        """Obsługa zapytań o hotele z kontekstem - zwraca odpowiedź fragmentami"""
         try:
-            # Parse parametrów hotelu z uwzględnieniem historii
-            hotel_prompt = ChatPromptTemplate.from_template("""
-            Wyciągnij parametry hotelu z zapytania użytkownika.
-            UWZGLĘDNIJ KONTEKST z poprzednich rozmów - jeśli użytkownik wcześniej mówił o konkretnym miejscu lub datach, użyj tych informacji.
-            
-            HISTORIA ROZMOWY:
-            {full_context}
-            
-            AKTUALNE ZAPYTANIE: "{query}"
-            DZISIEJSZA DATA: {today}
-            
-            REGUŁY:
-            - "jutro" → arrival_date = następny dzień
-            - "weekend" → sobota-niedziela
-            - "na X dni" → departure_date = arrival_date + X dni
-            - "para" → adults=2
-            - "tanio" → price_max=200
-            - Domyślnie: 2 noce jeśli nie podano departure_date
-            - KONTEKST: Jeśli w historii była mowa o miejscu, użyj go jako destination
-            - KONTEKST: Jeśli w historii była mowa o datach lotów, dopasuj daty hotelu
-            
-            {format_instructions}
-            """)
-            
-            hotel_chain = hotel_prompt | self.llm | self.hotel_parser
-            query = hotel_chain.invoke({
-                "query": user_input,
-                "today": datetime.now().strftime('%Y-%m-%d'),
-                "full_context":   full_context,
-                "format_instructions": self.hotel_parser.get_format_instructions()
-            })
-            
-            # Fix dat
-            if not query.arrival_date or query.arrival_date == "jutro":
-                query.arrival_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
-            
-            if not query.departure_date:
-                arrival = datetime.strptime(query.arrival_date, '%Y-%m-%d')
-                query.departure_date = (arrival + timedelta(days=2)).strftime('%Y-%m-%d')
-            
-            if not query.destination:
-                return "❌ Nie rozpoznałem miejsca pobytu. Przykład: 'hotel w Paryżu na weekend'"
-            
-            print(f"DEBUG: Hotel {query.destination} {query.arrival_date} → {query.departure_date}")
+            if query is None:
+                query = await self._aextract_hotel_query(user_input, full_context)
             
-            # Szukaj hoteli
-            api_data = self.hotel_api.search_hotels(query)
+            error = self._prepare_hotel_query(query)
+            if error:
+                yield error
+                return
             
-            if not api_data or not api_data.get('data', {}).get('hotels'):
-                return f"❌ Brak hoteli w {query.destination} na {query.arrival_date}"
+            # Szukaj hoteli - kolejne strony wyników, gdy na pierwszej jest za mało ofert spełniających filtry
+            api_data = await self.hotel_api.search_hotels_pages(query)
             
-            # Wyciągnij tylko potrzebne dane żeby zmniejszyć tokeny
-            simplified_hotels = self._extract_hotel_essentials(api_data.get('data', {}).get('hotels', []))
+            simplified_hotels = self._simplify_hotel_results(api_data)
+            if not simplified_hotels:
+                yield f"❌ Brak hoteli w {query.destination} na {query.arrival_date}"
+                return
             
-            print(f"DEBUG: Simplified {len(simplified_hotels)} hotel offers")
+            # Odpowiedź proponuje loty - wyszukiwanie w tle, w trakcie formatowania
+            flight_query = self._follow_up_flight_query(query)
+            if flight_query:
+                self.prefetcher.asubmit(("LOTY", compact_params(flight_query)),
+                                        lambda: self.flight_api.search_flights(flight_query), FLIGHT_PREFETCH_BUCKETS)
             
             # Formatuj wyniki - przekaż tylko essentials
-            return self._format_results("HOTELE", user_input, query, simplified_hotels, full_context)
+            async for chunk in self._aformat_results("HOTELE", user_input, query, simplified_hotels, full_context):
+                yield chunk
             
         except Exception as e:
             print(f"Hotel error: {e}")
-            return f"❌ Błąd wyszukiwania hoteli: {str(e)}"
+            yield f"❌ Błąd wyszukiwania hoteli: {str(e)}"
+    
+    def _prepare_hotel_query(self, query: HotelQuery) -> Optional[str]:
+        """Uzupełnia daty; zwraca komunikat błędu gdy zapytania nie da się wykonać"""
+        # Fix dat
+        if not query.arrival_date or query.arrival_date == "jutro":
+            query.arrival_date = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')
+        
+        if not query.departure_date:
+            arrival = datetime.strptime(query.arrival_date, '%Y-%m-%d')
+            query.departure_date = (arrival + timedelta(days=2)).strftime('%Y-%m-%d')
+        
+        if not query.destination:
+            return "❌ Nie rozpoznałem miejsca pobytu. Przykład: 'hotel w Paryżu na weekend'"
+        
+        print(f"DEBUG: Hotel {query.destination} {query.arrival_date} → {query.departure_date}")
+        self.trip_state.update_from_hotel(query)
+        return None
+    
+    def _follow_up_hotel_query(self, query: FlightQuery) -> Optional[HotelQuery]:
+        """Hotel na daty lotu, o który użytkownik najpewniej zapyta po lotach (None - prefetch wyłączony lub nieznane miasto).
+        Bez daty powrotu - domyślne 2 noce, jak w _prepare_hotel_query"""
+        city = Config.AIRPORT_CITIES.get(query.destination.strip().upper())
+        if not Config.PREFETCH or not city:
+            return None
+        departure_date = query.return_date or (
+            datetime.strptime(query.departure_date, '%Y-%m-%d') + timedelta(days=2)).strftime('%Y-%m-%d')
+        return HotelQuery(
+            destination=city,
+            arrival_date=query.departure_date,
+            departure_date=departure_date,
+            adults=query.adults,
+            children_age=query.children,
+            price_max=self.trip_state.hotel_price_max,
+            currency_code=query.currency_code
+        )
+    
+    def _simplify_hotel_results(self, api_data: Optional[dict]) -> list:
+        """Wyciąga tylko potrzebne dane żeby zmniejszyć tokeny (pusta lista gdy brak ofert)"""
+        if not api_data or not api_data.get('data', {}).get('hotels'):
+            return []
+        
+        simplified_hotels = self._extract_hotel_essentials(api_data.get('data', {}).get('hotels', []))
+        print(f"DEBUG: Simplified {len(simplified_hotels)} hotel offers")
+        return simplified_hotels
+    
+    async def _aextract_hotel_query(self, user_input: str, full_context: str) -> HotelQuery:
+        """Parse parametrów hotelu przez LLM"""
+        return await self.hotel_extraction_chain.ainvoke(self._prompt_inputs(user_input, full_context))
+    
+    def _build_hotel_extraction_chain(self):
+        # Parse parametrów hotelu z uwzględnieniem stanu podróży
+        hotel_prompt = self._extraction_prompt(
+            "hotel_extraction", "Wyciągnij parametry hotelu (REGUŁY - HOTEL) i zwróć JSON w FORMACIE - HOTEL.")
+        
+        return self._with_escalation(
+            "hotel_extraction",
+            hotel_prompt | self.stage_llms["hotel_extraction"] | self.hotel_parser,
+            hotel_prompt | self.llm | self.hotel_parser
+        )
     
-    def _handle_attractions_request(self, user_input: str,  full_context: str) -> str:
-        """Obsługa zapytań o atrakcje - wykorzystuje wewnętrzną wiedzę Claude'a"""
+    def _extraction_prompt(self, stage: str, task: str) -> ChatPromptTemplate:
+        """Wspólny prompt ekstrakcji lotu, hotelu i podróży: reguły i formaty wszystkich trzech w jednym statycznym
+        bloku - ten sam prefiks dla trzech etapów (jeden wpis w cache) i powyżej progu cache szybkiego modelu.
+        Zadanie etapu w wiadomości użytkownika"""
+        extraction_prompt = self._cached_prompt("""
+        Wyciągasz parametry wyszukiwania podróży z zapytania użytkownika. Zadanie (lot, hotel lub lot z noclegiem)
+        i oczekiwany format podaje wiadomość użytkownika.
+        UWZGLĘDNIJ STAN PODRÓŻY - jeśli użytkownik wcześniej ustalił miejsce, daty lub liczbę osób, użyj tych informacji.
+        
+        KODY IATA: WAW=Warszawa, CDG=Paryż, LHR=Londyn, BER=Berlin, FCO=Rzym, MAD=Madryt, BCN=Barcelona, AMS=Amsterdam, VIE=Wiedeń, PRG=Praga, BUD=Budapeszt, KRK=Kraków, GDN=Gdańsk, WRO=Wrocław
+        
+        REGUŁY - LOT:
+        - Origin domyślnie: "WAW"
+        - "jutro" → następny dzień
+        - "para" → adults=2
+        - "dzieci X lat" → children="X"
+        - "tanio" → budget=800, sort=CHEAPEST
+        - "bezpośredni" → stops="0"
+        - "około piątku", "w okolicach", "najtaniej w tym tygodniu" → flexible_days (1-3), departure_date = środek okresu
+        - Klasa domyślnie: ECONOMY
+        - KONTEKST: Jeśli stan podróży zawiera miejsce docelowe, użyj go jako destination (miasto zamień na kod IATA)
+        - KONTEKST: Jeśli stan podróży zawiera daty lub liczbę osób, użyj ich jako odniesienie
+        
+        REGUŁY - HOTEL:
+        - "jutro" → arrival_date = następny dzień
+        - "weekend" → sobota-niedziela
+        - "na X dni" → departure_date = arrival_date + X dni
+        - "para" → adults=2
+        - "tanio" → price_max=200
+        - Domyślnie: 2 noce jeśli nie podano departure_date
+        - KONTEKST: Jeśli stan podróży zawiera miejsce, użyj go jako destination (kod IATA zamień na nazwę miasta)
+        - KONTEKST: Jeśli stan podróży zawiera daty lotów lub liczbę osób, dopasuj do nich hotel
+        
+        REGUŁY - PODRÓŻ (lot i nocleg):
+        - flight.origin domyślnie: "WAW", flight.destination - kod IATA
+        - "jutro" → następny dzień
+        - "na X dni", "na tydzień" → flight.return_date = departure_date + X dni (hotel na ten sam okres)
+        - "weekend" → piątek-niedziela
+        - "para" → adults=2
+        - "dzieci X lat" → flight.children="X"
+        - "za X zł", "budżet X na wszystko" → total_budget=X
+        - "hotel do X zł za noc" → hotel_price_max=X
+        - "bezpośredni" → flight.stops="0"
+        - city - miasto noclegu (nazwa miasta, nie kod IATA), zwykle miasto docelowe lotu
+        - KONTEKST: Jeśli stan podróży zawiera miejsce, daty lub liczbę osób, użyj ich jako odniesienie
+        
+        FORMAT - LOT:
+        {flight_format}
+        
+        FORMAT - HOTEL:
+        {hotel_format}
+        
+        FORMAT - PODRÓŻ:
+        {trip_format}
+        
+        Zwróć tylko JSON w formacie wskazanym w zadaniu.
+        """, """
+        ZADANIE: {task}
+        
+        STAN PODRÓŻY:
+        {trip_state}
+        
+        AKTUALNE ZAPYTANIE: "{query}"
+        DZISIEJSZA DATA: {today}
+        """).partial(
+            task=task,
+            flight_format=self.flight_parser.get_format_instructions(),
+            hotel_format=self.hotel_parser.get_format_instructions(),
+            trip_format=self.trip_parser.get_format_instructions()
+        )
+        self._register_prompt_prefix(stage, extraction_prompt)
+        return extraction_prompt
+    
+    async def _ahandle_trip_request(self, user_input: str, full_context: str, query: Optional[TripQuery] = None) -> AsyncIterator[str]:
+        """Obsługa zapytań o lot i hotel razem - oba wyszukiwania równolegle, odpowiedź z lokalnego szablonu"""
         try:
-            # Wyciągnij kontekst podróży z historii
-          
-            
-            attractions_prompt = ChatPromptTemplate.from_template("""
-            Jesteś ekspertem od turystyki i lokalnych atrakcji. Odpowiedz na zapytanie użytkownika o atrakcje, 
-            wykorzystując swoją rozległą wiedzę o miejscach, kulturze i turystyce.
-            
-            HISTORIA ROZMOWY (context podróży):
-            {full_context}
-            
-           
-            ZAPYTANIE UŻYTKOWNIKA: "{query}"
-            
-            INSTRUKCJE:
-            
-            1. **Wykorzystaj kontekst**: Jeśli wiesz gdzie jedzie użytkownik, skup się na tym miejscu
-            2. **Bądź konkretny**: Podaj nazwy konkretnych miejsc, adresów, godzin otwarcia
-            3. **Uwzględnij praktyczne info**: ceny, transport, czas potrzebny na zwiedzanie
-            4. **Dostosuj do dat**: Jeśli wiesz kiedy jedzie, uwzględnij sezonowość, wydarzenia
-            5. **Kategoryzuj**: Podziel na kategorie (zabytki, muzea, restauracje, rozrywka)
-            6. **Lokalny kontekst**: Dodaj wskazówki lokalnego przewodnika
-            
-            STRUKTURA ODPOWIEDZI:
+            if query is None:
+                query = await self._aextract_trip_query(user_input, full_context)
             
-            🎯 **[NAZWA MIEJSCA] - Przewodnik po Atrakcjach**
+            flight_query, hotel_query, error = self._prepare_trip_query(query)
+            if error:
+                yield error
+                return
             
-            **🏛️ MUST-SEE (najważniejsze zabytki)**
-            - [3-5 głównych atrakcji z praktycznymi info]
+            # Loty i hotele naraz
+            results = await agather_with_deadline({
+                "flights": lambda: self.flight_api.search_flights(flight_query),
+                "hotels": lambda: self.hotel_api.search_hotels_pages(hotel_query)
+            }, Config.TRIP_SEARCH_TIMEOUT)
             
-            **🍽️ GDZIE JEŚĆ (lokalne specjały)**
-            - [2-3 polecane restauracje/miejsca]
-            
-            **🎨 KULTURA & ROZRYWKA**
-            - [muzea, galerie, wydarzenia]
-            
-            **💡 WSKAZÓWKI PRAKTYCZNE**
-            - Transport lokalny
-            - Najlepsze godziny zwiedzania
-            - Co zabrać / na co uważać
-            - Budżet dzienny
-            
-            **📅 PLAN DNIA** (jeśli możliwe)
-            - Sugerowany harmonogram zwiedzania
-            
-            Pisz po polsku, używaj emoji, bądź entuzjastyczny ale praktyczny. 
-            Jeśli nie ma kontekstu miejsca, zapytaj gdzie jedzie użytkownik.
-            """)
-            
-            attractions_chain = attractions_prompt | self.llm
-            result = attractions_chain.invoke({
-               "query": user_input,
-                "today": datetime.now().strftime('%Y-%m-%d'),
-                "full_context":   full_context
-            })
+            yield self._render_trip(query, flight_query, hotel_query, results)
+        
+        except Exception as e:
+            print(f"Trip error: {e}")
+            yield f"❌ Błąd wyszukiwania podróży: {str(e)}"
+    
+    def _prepare_trip_query(self, query: TripQuery) -> Tuple[FlightQuery, HotelQuery, Optional[str]]:
+        """Zapytania o lot i hotel na te same daty; komunikat błędu gdy któregoś nie da się wykonać"""
+        # Kalendarz cen nie dotyczy podróży - hotel jest szukany na konkretne daty lotu
+        flight_query = query.flight.model_copy(update={"flexible_days": 0})
+        error = self._prepare_flight_query(flight_query)
+        if error:
+            return flight_query, None, error
+        
+        hotel_query = query.model_copy(update={"flight": flight_query}).hotel_query()
+        if not hotel_query.destination:
+            hotel_query.destination = flight_query.destination
+        return flight_query, hotel_query, self._prepare_hotel_query(hotel_query)
+    
+    def _render_trip(self, query: TripQuery, flight_query: FlightQuery, hotel_query: HotelQuery, results: dict) -> str:
+        flights = self._simplify_flight_results(results.get("flights"))
+        hotels = self._simplify_hotel_results(results.get("hotels"))
+        if not flights and not hotels:
+            return (f"❌ Brak lotów {flight_query.origin} → {flight_query.destination} "
+                    f"i hoteli w {hotel_query.destination} na {flight_query.departure_date}")
+        return render_trip(flight_query, hotel_query, flights, hotels, query.total_budget)
+    
+    async def _aextract_trip_query(self, user_input: str, full_context: str) -> TripQuery:
+        """Parse parametrów lotu i noclegu przez LLM"""
+        return await self.trip_extraction_chain.ainvoke(self._prompt_inputs(user_input, full_context))
+    
+    def _build_trip_extraction_chain(self):
+        # Parse parametrów lotu i noclegu (jedno wywołanie dla obu wyszukiwań)
+        trip_prompt = self._extraction_prompt(
+            "trip_extraction", "Wyciągnij parametry lotu i noclegu (REGUŁY - PODRÓŻ) i zwróć JSON w FORMACIE - PODRÓŻ.")
+        
+        return self._with_escalation(
+            "trip_extraction",
+            trip_prompt | self.stage_llms["trip_extraction"] | self.trip_parser,
+            trip_prompt | self.llm | self.trip_parser
+        )
+    
+    async def _ahandle_attractions_request(self, user_input: str, full_context: str) -> AsyncIterator[str]:
+        """Obsługa zapytań o atrakcje - wykorzystuje wewnętrzną wiedzę Claude'a, tokeny strumieniowane.
+        Dla jednego znanego miejsca ogólny przewodnik (miejsce i pora roku, bez kontekstu rozmowy) z cache
+        lub generowany i zapisywany, poprzedzony wstępem dla użytkownika, który nie trafia do cache"""
+        try:
+            target = self._attractions_guide_target(user_input)
+            if target is None:
+                async for chunk in self.attractions_chain.astream(self._prompt_inputs(user_input, full_context)):
+                    yield chunk
+                return
             
-            return result.content
+            destination, name, period = target
+            guide = self.attractions_cache.get(destination, period)
+            if Config.ATTRACTIONS_PERSONALIZE:
+                try:
+                    async for chunk in self.attractions_personalization_chain.astream(self._prompt_inputs(user_input, full_context)):
+                        yield chunk
+                    yield "\n\n"
+                except Exception as e:
+                    print(f"Attractions personalization error: {e}")
+            if guide:
+                print(f"DEBUG: Attractions guide from cache {destination} / {period}")
+                yield guide
+                return
             
+            parts = []
+            async for chunk in self.attractions_guide_chain.astream(self._guide_inputs(name, period)):
+                parts.append(chunk)
+                yield chunk
+            self._store_attractions_guide(destination, period, "".join(parts))
+        
         except Exception as e:
             print(f"Attractions error: {e}")
-            return f"❌ Błąd przy wyszukiwaniu atrakcji: {str(e)}"
+            yield f"❌ Błąd przy wyszukiwaniu atrakcji: {str(e)}"
+    
+    def _attractions_guide_target(self, user_input: str) -> Optional[Tuple[str, str, str]]:
+        """(klucz miejsca, nazwa miejsca, pora roku) ogólnego przewodnika lub None - wtedy odpowiedź
+        z pełnym kontekstem rozmowy, bez cache (wyłączony cache, brak lub kilka miejsc w pytaniu)"""
+        if not Config.ATTRACTIONS_CACHE:
+            return None
+        trip_destination = self.trip_state.destination_city or self.trip_state.destination_airport
+        resolved = guide_destination(user_input, trip_destination)
+        if resolved is None:
+            return None
+        destination, name = resolved
+        return destination, name, travel_period(self.trip_state.start_date)
+    
+    @staticmethod
+    def _guide_inputs(name: str, period: str) -> dict:
+        """Zmienne promptu ogólnego przewodnika - tylko miejsce i pora roku, nic z rozmowy"""
+        return {"destination": name, "period": period_label(period)}
+    
+    def _store_attractions_guide(self, destination: str, period: str, guide: str):
+        # Krótka odpowiedź to zwykle urwane generowanie, a nie przewodnik
+        if len(guide) >= Config.ATTRACTIONS_CACHE_MIN_CHARS:
+            self.attractions_cache.set(destination, period, guide)
+    
+    def _build_attractions_chain(self):
+        """Prompt przewodnika po atrakcjach"""
+        attractions_prompt = self._cached_prompt("""
+        Jesteś ekspertem od turystyki i lokalnych atrakcji. Odpowiedz na zapytanie użytkownika o atrakcje, 
+        wykorzystując swoją rozległą wiedzę o miejscach, kulturze i turystyce.
         
-    def _format_results(self, search_type: str, original_query: str, query_params, results, full_context: str) -> str:
-        """Formatowanie wyników przez LLM z uwzględnieniem kontekstu"""
-        format_prompt = ChatPromptTemplate.from_template("""
-        Sformatuj wyniki wyszukiwania dla polskiego użytkownika.
-        UWZGLĘDNIJ KONTEKST poprzednich rozmów przy formatowaniu odpowiedzi.
+        INSTRUKCJE:
         
-        HISTORIA ROZMOWY:
+        1. **Wykorzystaj kontekst**: Jeśli wiesz gdzie jedzie użytkownik, skup się na tym miejscu
+        2. **Bądź konkretny**: Podaj nazwy konkretnych miejsc, adresów, godzin otwarcia
+        3. **Uwzględnij praktyczne info**: ceny, transport, czas potrzebny na zwiedzanie
+        4. **Dostosuj do dat**: Jeśli wiesz kiedy jedzie, uwzględnij sezonowość, wydarzenia
+        5. **Kategoryzuj**: Podziel na kategorie (zabytki, muzea, restauracje, rozrywka)
+        6. **Lokalny kontekst**: Dodaj wskazówki lokalnego przewodnika
+        
+        STRUKTURA ODPOWIEDZI:
+        
+        🎯 **[NAZWA MIEJSCA] - Przewodnik po Atrakcjach**
+        
+        **🏛️ MUST-SEE (najważniejsze zabytki)**
+        - [3-5 głównych atrakcji z praktycznymi info]
+        
+        **🍽️ GDZIE JEŚĆ (lokalne specjały)**
+        - [2-3 polecane restauracje/miejsca]
+        
+        **🎨 KULTURA & ROZRYWKA**
+        - [muzea, galerie, wydarzenia]
+        
+        **💡 WSKAZÓWKI PRAKTYCZNE**
+        - Transport lokalny
+        - Najlepsze godziny zwiedzania
+        - Co zabrać / na co uważać
+        - Budżet dzienny
+        
+        **📅 PLAN DNIA** (jeśli możliwe)
+        - Sugerowany harmonogram zwiedzania
+        
+        Pisz po polsku, używaj emoji, bądź entuzjastyczny ale praktyczny. 
+        Jeśli nie ma kontekstu miejsca, zapytaj gdzie jedzie użytkownik.
+        """, """
+        HISTORIA ROZMOWY (context podróży):
         {full_context}
         
-        TYP: {search_type}
-        AKTUALNE ZAPYTANIE: "{original_query}"
-        PARAMETRY WYSZUKIWANIA: {query_params}
-        SUROWE DANE Z API: {results}
+        ZAPYTANIE UŻYTKOWNIKA: "{query}"
+        """)
+        
+        self._register_prompt_prefix("attractions", attractions_prompt)
+        return attractions_prompt | self.stage_llms["attractions"] | StrOutputParser()
+    
+    def _build_attractions_guide_chain(self):
+        """Prompt ogólnego przewodnika (trafia do cache wspólnego dla sesji) - bez kontekstu rozmowy"""
+        guide_prompt = self._cached_prompt("""
+        Jesteś ekspertem od turystyki i lokalnych atrakcji. Napisz ogólny przewodnik po atrakcjach
+        podanego miejsca, wykorzystując swoją rozległą wiedzę o miejscach, kulturze i turystyce.
+        Przewodnik jest dla dowolnego turysty - nie zakładaj niczego o jego datach, grupie ani budżecie.
+        
+        INSTRUKCJE:
+        
+        1. **Bądź konkretny**: Podaj nazwy konkretnych miejsc, adresów, godzin otwarcia
+        2. **Uwzględnij praktyczne info**: ceny, transport, czas potrzebny na zwiedzanie
+        3. **Dostosuj do pory roku**: Jeśli jest podana, uwzględnij sezonowość i typowe wydarzenia
+        4. **Kategoryzuj**: Podziel na kategorie (zabytki, muzea, restauracje, rozrywka)
+        5. **Lokalny kontekst**: Dodaj wskazówki lokalnego przewodnika
+        
+        STRUKTURA ODPOWIEDZI:
+        
+        🎯 **[NAZWA MIEJSCA] - Przewodnik po Atrakcjach**
+        
+        **🏛️ MUST-SEE (najważniejsze zabytki)**
+        - [3-5 głównych atrakcji z praktycznymi info]
+        
+        **🍽️ GDZIE JEŚĆ (lokalne specjały)**
+        - [2-3 polecane restauracje/miejsca]
+        
+        **🎨 KULTURA & ROZRYWKA**
+        - [muzea, galerie, wydarzenia]
+        
+        **💡 WSKAZÓWKI PRAKTYCZNE**
+        - Transport lokalny
+        - Najlepsze godziny zwiedzania
+        - Co zabrać / na co uważać
+        - Orientacyjny budżet dzienny
+        
+        **📅 PLAN DNIA**
+        - Sugerowany harmonogram zwiedzania
+        
+        Pisz po polsku, używaj emoji, bądź entuzjastyczny ale praktyczny.
+        """, """
+        MIEJSCE: {destination}
+        PORA ROKU: {period}
+        """)
+        
+        self._register_prompt_prefix("attractions_guide", guide_prompt, stage="attractions")
+        return guide_prompt | self.stage_llms["attractions"] | StrOutputParser()
+    
+    def _build_attractions_personalization_chain(self):
+        """Krótki wstęp do ogólnego przewodnika - dopasowanie do pytania i stanu podróży (nie trafia do cache)"""
+        personalization_prompt = self._cached_prompt("""
+        Użytkownik dostanie za chwilę ogólny przewodnik po atrakcjach miejsca, o które pyta
+        (ten sam dla wszystkich podróżnych - bez jego dat, grupy i budżetu).
+        Napisz 1-3 zdania wstępu dopasowane do jego pytania i stanu podróży
+        (daty i pora roku, liczba osób, dzieci, budżet) - np. na co zwrócić szczególną uwagę.
+        
+        Nie powtarzaj treści przewodnika, nie dodawaj nagłówków ani list. Pisz po polsku.
+        """, """
+        STAN PODRÓŻY:
+        {trip_state}
+        
+        ZAPYTANIE UŻYTKOWNIKA: "{query}"
+        """)
+        
+        self._register_prompt_prefix("attractions_personalization", personalization_prompt)
+        return personalization_prompt | self.stage_llms["attractions_personalization"] | StrOutputParser()
+    
+    async def _aformat_results(self, search_type: str, original_query: str, query_params, results, full_context: str) -> AsyncIterator[str]:
+        """Formatowanie wyników - lokalny szablon lub LLM w trybie 'rich' (tokeny strumieniowane)"""
+        if Config.FORMAT_MODE != "rich":
+            yield render_results(search_type, query_params, results)
+            return
+        async for chunk in self.format_chain.astream(
+                self._format_inputs(search_type, original_query, query_params, results, full_context)):
+            yield chunk
+    
+    def _format_inputs(self, search_type: str, original_query: str, query_params, results, full_context: str) -> dict:
+        params_text, results_text = str(query_params), str(results)
+        repr_tokens = estimate_tokens(params_text) + estimate_tokens(results_text)
+        if Config.FORMAT_ENCODING == "compact":
+            params_text = compact_params(query_params)
+            results_text = compact_results(search_type, results)
+        
+        sent_tokens = estimate_tokens(params_text) + estimate_tokens(results_text)
+        self.format_stats["requests"] += 1
+        self.format_stats["tokens_sent"] += sent_tokens
+        self.format_stats["tokens_saved"] += repr_tokens - sent_tokens
+        print(f"DEBUG: Format input ~{sent_tokens} tokens (repr ~{repr_tokens}, saved ~{repr_tokens - sent_tokens})")
+        return {
+            "search_type": search_type,
+            "original_query": original_query,
+            "query_params": params_text,
+            "results": results_text,
+            "full_context": full_context
+        }
+    
+    def get_format_stats(self) -> dict:
+        """Tokeny danych wysłanych do formatowania i zaoszczędzone względem str(results)"""
+        requests = self.format_stats["requests"]
+        return {
+            "requests": requests,
+            "tokens_sent": self.format_stats["tokens_sent"],
+            "tokens_saved": self.format_stats["tokens_saved"],
+            "avg_saved": self.format_stats["tokens_saved"] / requests if requests else 0.0
+        }
+    
+    def _build_format_chain(self):
+        """Prompt formatowania wyników (tryb 'rich')"""
+        format_prompt = self._cached_prompt("""
+        Sformatuj wyniki wyszukiwania dla polskiego użytkownika.
+        UWZGLĘDNIJ KONTEKST poprzednich rozmów przy formatowaniu odpowiedzi.
         
         UWAGA: Otrzymujesz uproszczone dane (tylko najważniejsze pola) żeby zmniejszyć liczbę tokenów.
+        Dane mogą być tabelą: pierwszy wiersz to nazwy pól, każdy kolejny to jedna oferta (wartości rozdzielone "|",
+        godziny jako "DD.MM HH:MM", czas lotu jako np. "2h30", ceny w PLN zaokrąglone).
         Z CAŁEJ LISTY WYBIERZ TYLKO 5 NAJLEPSZYCH OFERT według kryteriów:
         - Dla LOTÓW: priorytet = 1) bez przesiadek (stops=0), 2) najniższa cena
         - Dla HOTELI: priorytet = najniższa cena (price_per_night)
@@ -356,53 +910,118 @@ class TravelAgent:
         - Jeśli to ma sens w kontekście rozmowy, zaproponuj następne kroki (np. "czy chcesz teraz poszukać hoteli?" po pokazaniu lotów)
         
         Używaj emoji, polskich znaków, bądź zwięzły ale pomocny.
-        """)
+        """, """
+        HISTORIA ROZMOWY:
+        {full_context}
         
-        format_chain = format_prompt | self.llm
-        result = format_chain.invoke({
-            "search_type": search_type,
-            "original_query": original_query,
-            "query_params": str(query_params),
-            "results": str(results),
-            "full_context": full_context
-        })
+        TYP: {search_type}
+        AKTUALNE ZAPYTANIE: "{original_query}"
+        PARAMETRY WYSZUKIWANIA: {query_params}
+        SUROWE DANE Z API: {results}
+        """)
         
-        return result.content
+        self._register_prompt_prefix("format", format_prompt, stage="formatting")
+        return format_prompt | self.stage_llms["formatting"] | StrOutputParser()
+    
+    def _summarize_history(self, summary: str, new_lines: str) -> str:
+        """Aktualizuje podsumowanie rozmowy o tury wypadające z okna pamięci"""
+        return self.summary_chain.invoke({"summary": summary or "(brak)", "new_lines": new_lines})
     
-    def _format_chat_history(self, messages) -> str:
-        """Formatuje historię rozmowy do czytelnej formy"""
-        if not messages:
-            return "Brak poprzednich rozmów."
+    def _build_summary_chain(self):
+        """Prompt przyrostowego podsumowania rozmowy"""
+        summary_prompt = self._cached_prompt("""
+        Uaktualnij podsumowanie rozmowy klienta z agentem podróży o nowe wymiany.
+
+        Zachowaj fakty potrzebne do dalszych wyszukiwań: miejsca (z kodami IATA), daty, liczbę osób i wiek dzieci,
+        budżet, preferencje (klasa, przesiadki, standard hotelu) oraz czego dotyczyło ostatnie wyszukiwanie
+        i jakie było ostatnie pytanie Agenta. Pomiń listy ofert, emoji i formatowanie.
+        Odpowiedz samym podsumowaniem, maksymalnie 5 zdań.
+        """, """
+        DOTYCHCZASOWE PODSUMOWANIE:
+        {summary}
+
+        NOWE WYMIANY:
+        {new_lines}
+        """)
         
-        history_parts = []
-        for i in range(0, len(messages), 2):
-            if i + 1 < len(messages):
-                user_msg = messages[i].content
-                ai_msg = messages[i + 1].content
-                
-                
-                
-                history_parts.append(f"Użytkownik: {user_msg}")
-                history_parts.append(f"Agent: {ai_msg}")
+        self._register_prompt_prefix("summary", summary_prompt)
+        return summary_prompt | self.stage_llms["summary"] | StrOutputParser()
+    
+    def _with_escalation(self, stage: str, chain, fallback):
+        """Gdy odpowiedź szybkiego modelu nie da się sparsować, etap jest powtarzany na głównym modelu"""
+        if not Config.ESCALATE_ON_PARSE_ERROR or Config.STAGE_MODELS[stage] == Config.CLAUDE_MODEL:
+            return chain
         
-      
+        def log_escalation(inputs):
+            self.escalations[stage] += 1
+            print(f"DEBUG: {stage} output could not be parsed, escalating to {Config.CLAUDE_MODEL}")
+            return inputs
         
-        return "\n".join(history_parts)
+        return chain.with_fallbacks(
+            [RunnableLambda(log_escalation) | fallback],
+            exceptions_to_handle=(OutputParserException, ValidationError)
+        )
+    
+    def _register_prompt_prefix(self, name: str, prompt: ChatPromptTemplate, stage: Optional[str] = None, tools: tuple = ()):
+        """Szacowany rozmiar statycznego prefiksu promptu (schematy narzędzi + blok systemowy). Anthropic cache'uje
+        prefiks dopiero od Config.PROMPT_CACHE_MIN_TOKENS tokenów modelu etapu - krótszy nic nie zyskuje"""
+        system = prompt.format_messages(**{variable: "" for variable in prompt.input_variables})[0].content
+        text = "".join(block["text"] for block in system) if isinstance(system, list) else system
+        text += "".join(json.dumps(tool.model_json_schema(), ensure_ascii=False) for tool in tools)
+        model = Config.STAGE_MODELS[stage or name]
+        tokens = estimate_tokens(text)
+        min_tokens = Config.PROMPT_CACHE_MIN_TOKENS.get(model, Config.PROMPT_CACHE_MIN_TOKENS_DEFAULT)
+        self.prompt_prefixes[name] = {"tokens": tokens, "min_tokens": min_tokens, "cached": tokens >= min_tokens}
+        print(f"DEBUG: Prompt prefix {name}: ~{tokens} tokens, cache minimum {min_tokens} for {model}"
+              f"{'' if tokens >= min_tokens else ' - below minimum, not cached'}")
+    
+    @staticmethod
+    def _cached_prompt(system_template: str, human_template: str) -> ChatPromptTemplate:
+        """Statyczne instrukcje w bloku systemowym oznaczonym do cache promptów Anthropic,
+        zmienne dane (historia, zapytanie, data) na końcu w wiadomości użytkownika"""
+        system_block = {"type": "text", "text": system_template}
+        if Config.PROMPT_CACHING:
+            system_block["cache_control"] = {"type": "ephemeral"}
+        return ChatPromptTemplate.from_messages([
+            ("system", [system_block]),
+            ("human", human_template)
+        ])
     
     def get_chat_history(self) -> str:
-        """Publiczna metoda do pobierania historii rozmowy"""
-        return self._format_chat_history(self.memory.chat_memory.messages)
+        """Publiczna metoda do pobierania historii rozmowy (wczytywanej z magazynu sesji)"""
+        return self.memory.history_text()
+    
+    def warm_up_caches(self):
+        """Wstępnie wypełnia trwały cache lokalizacji popularnymi lotniskami i miastami"""
+        try:
+            fetched = run_sync(self.flight_api.warm_up()) + run_sync(self.hotel_api.warm_up())
+            print(f"DEBUG: Location cache warm-up done, fetched {fetched} missing entries")
+        except Exception as e:
+            print(f"Location cache warm-up error: {e}")
     
     def clear_memory(self):
-        """Czyści historię rozmowy"""
+        """Czyści historię rozmowy (także w magazynie sesji)"""
         self.memory.clear()
+        self.trip_state = TripState()
         print("Historia rozmowy została wyczyszczona.")
     
+    def new_session(self, session_id: Optional[str] = None) -> "TravelAgent":
+        """Agent dla kolejnej rozmowy (np. sesji serwera): własna pamięć i stan podróży,
+        wspólne klienty LLM i API, łańcuchy, cache oraz statystyki.
+        Dla session_id zapisanej rozmowy - kontynuacja (historia wczytywana przy pierwszej turze)"""
+        session = copy.copy(self)
+        session.session_id = session_id or uuid.uuid4().hex
+        session.memory = ConversationMemory(summarizer=session._summarize_history,
+                                            store=self.session_store, session_id=session.session_id)
+        state = self.session_store.load_state(session.session_id) if session_id else None
+        session.trip_state = TripState.model_validate(state) if state else TripState()
+        return session
+    
     def _extract_flight_essentials(self, flights: list) -> list:
         """Wyciąga tylko najważniejsze dane z lotów żeby zmniejszyć tokeny"""
         essentials = []
         
-        for flight in flights[:20]:  # Ogranicz do 20 lotów max
+        for flight in flights[:Config.RESULT_ITEMS_LIMIT]:  # Ogranicz liczbę lotów
             try:
                 # Cena
                 price_breakdown = flight.get('priceBreakdown', {})
@@ -448,7 +1067,7 @@ class TravelAgent:
         """Wyciąga tylko najważniejsze dane z hoteli żeby zmniejszyć tokeny"""
         essentials = []
         
-        for hotel in hotels[:20]:  # Ogranicz do 20 hoteli max
+        for hotel in hotels[:Config.RESULT_ITEMS_LIMIT]:  # Ogranicz liczbę hoteli
             try:
                 # Nazwa
                 name = "Unknown Hotel"
@@ -500,7 +1119,12 @@ class TravelAgentFactory:
         if not Config.validate():
             raise ValueError("Brak kluczy API w .env")
         
-        return TravelAgent(
+        agent = TravelAgent(
             claude_api_key=Config.CLAUDE_API_KEY,
             booking_api_key=Config.RAPIDAPI_KEY
-        )
\ No newline at end of file
+        )
+        
+        if Config.LOCATION_CACHE_WARM_UP:
+            threading.Thread(target=agent.warm_up_caches, name="location-warm-up", daemon=True).start()
+        
+        return agent
\ No newline at end of file